@@ -2,7 +2,7 @@
 API v1 router.
 """
 from fastapi import APIRouter
-from app.api.v1 import auth, invoices, suggestions, audit
+from app.api.v1 import auth, invoices, suggestions, audit, admin
 
 api_router = APIRouter()
 
@@ -10,3 +10,4 @@ api_router.include_router(auth.router, prefix="/auth", tags=["authentication"])
 api_router.include_router(invoices.router, prefix="/invoices", tags=["invoices"])
 api_router.include_router(suggestions.router, prefix="/suggestions", tags=["suggestions"])
 api_router.include_router(audit.router, prefix="/audit", tags=["audit"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
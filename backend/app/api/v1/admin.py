@@ -0,0 +1,40 @@
+"""
+Operational endpoints (admin only).
+"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from typing import Any, Dict
+from app.db.database import get_db
+from app.db import models
+from app.core.security import require_role
+from app.core.executors import all_pool_metrics, run_io
+from app.services.admission_service import admission_service
+from app.services.vendor_memory_service import vendor_memory_service
+
+router = APIRouter()
+
+
+@router.get("/executors")
+async def get_executor_metrics(
+    current_user: models.User = Depends(require_role("admin"))
+) -> Dict[str, Dict[str, Any]]:
+    """Metrics for this API process's io/cpu executor pools (admin only)."""
+    return all_pool_metrics()
+
+
+@router.get("/admission")
+async def get_admission_levels(
+    current_user: models.User = Depends(require_role("admin")),
+    db: Session = Depends(get_db)
+) -> Dict[str, Any]:
+    """Upload admission limits, current queue depth and in-flight jobs per user/tenant (admin only)."""
+    return await run_io(admission_service.levels, db)
+
+
+@router.post("/vendor-memory/rebuild")
+async def rebuild_vendor_memory(
+    current_user: models.User = Depends(require_role("admin")),
+    db: Session = Depends(get_db)
+) -> Dict[str, Any]:
+    """Recount vendor memory from all approved/rejected suggestions, e.g. after changing identifier extraction (admin only)."""
+    return {"entries": await run_io(vendor_memory_service.rebuild, db)}
@@ -14,6 +14,7 @@ from app.core.security import (
     get_current_active_user,
 )
 from app.core.config import settings
+from app.services.admission_service import admission_service
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
@@ -66,6 +67,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     # Create user
     user = models.User(
         email=user_data.email,
+        tenant=admission_service.tenant_of(user_data.email),
         hashed_password=get_password_hash(user_data.password),
         full_name=user_data.full_name,
         role=user_data.role
@@ -1,27 +1,33 @@
 """
 Invoice endpoints for document upload and processing.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Response
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.exc import IntegrityError
+from starlette.requests import ClientDisconnect
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-import os
+import mimetypes
 import uuid
+import zipfile
 from app.db.database import get_db
 from app.db import models
 from app.core.security import get_current_active_user
 from app.core.config import settings
+from app.core.executors import run_io
+from app.services.admission_service import admission_service, AdmissionRejected
 from app.services.audit_service import audit_service
-from app.services.workflow_engine import run_workflow
-from app.services.workflow_steps import DEFAULT_INVOICE_STEPS
+from app.services.job_queue import job_queue
+from app.services.ocr_service import ocr_service
+from app.services.storage_service import storage, FileTooLargeError
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
-# Create uploads directory
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+TUS_VERSION = "1.0.0"
 
 
 class InvoiceResponse(BaseModel):
@@ -30,6 +36,8 @@ class InvoiceResponse(BaseModel):
     filename: str
     file_size: int
     status: str
+    duplicate_of_id: Optional[int] = None
+    ocr_truncated: bool = False  # only part of the document was OCR'd (page limit or time budget)
     created_at: datetime
     
     class Config:
@@ -44,14 +52,68 @@ class InvoiceDetailResponse(InvoiceResponse):
         from_attributes = True
 
 
-@router.post("/upload", response_model=InvoiceResponse, status_code=status.HTTP_201_CREATED)
+class OCRLayoutResponse(BaseModel):
+    """Word-level OCR layout: per page, parallel arrays of words, boxes (left, top, width, height), conf and line."""
+    invoice_id: int
+    page_count: int
+    word_count: int
+    pages: List[dict]
+
+
+class BulkUploadResponse(BaseModel):
+    """Bulk upload response schema."""
+    batch_id: int
+    total_files: int
+    queued: int
+    duplicate_invoice_ids: List[int]
+    skipped: List[str]
+
+
+class BatchStatusResponse(BaseModel):
+    """Bulk upload progress schema."""
+    batch_id: int
+    total_files: int
+    duplicates: int
+    skipped: int
+    status_counts: Dict[str, int]
+    finished: bool
+    created_at: datetime
+
+
+class ResumableUploadCreate(BaseModel):
+    """Resumable upload creation schema."""
+    filename: str
+    size: int
+    mime_type: Optional[str] = None
+
+
+class ResumableUploadResponse(BaseModel):
+    """Resumable upload session schema."""
+    id: str
+    filename: str
+    total_size: int
+    offset: int
+    status: str
+    invoice_id: Optional[int] = None
+    expires_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+@router.post("/upload", response_model=InvoiceResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_invoice(
     file: UploadFile = File(...),
     current_user: models.User = Depends(get_current_active_user),
     db: Session = Depends(get_db),
-    request: Request = None
+    request: Request = None,
+    response: Response = None
 ):
-    """Upload an invoice document for processing."""
+    """
+    Upload an invoice document and queue it for processing (OCR/AI run in the worker).
+    
+    Re-uploading a document the user already uploaded returns the existing invoice (200).
+    """
     # Validate file extension
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in settings.ALLOWED_EXTENSIONS:
@@ -59,92 +121,733 @@ async def upload_invoice(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid file type. Allowed: {', '.join(settings.ALLOWED_EXTENSIONS)}"
         )
+    await run_io(_admit, db, current_user, 1, False)
     
-    # Read file
-    contents = await file.read()
-    
-    # Check file size
-    if len(contents) > settings.MAX_UPLOAD_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large. Maximum size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
-        )
+    # Stream file to content-addressed storage (constant memory; size and SHA-256 computed on the fly)
+    file_key, file_size, sha256 = await _stream_upload(file, file_ext)
+    return await run_io(
+        _register_upload, db, current_user, file.filename, file.content_type, file_key, file_size, sha256, request, response
+    )
+
+
+def _too_many_requests(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=e.detail,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def _admit(db: Session, user: models.User, new_jobs: int = 1, count_admitted: bool = True) -> None:
+    """Refuse the upload with 429 + Retry-After when the queue or the user's/tenant's in-flight limit is full. Blocking; call through run_io.
+
+    Before storing a document this is a pre-check (count_admitted=False); _admitting() decides when its jobs are inserted.
+    """
+    try:
+        admission_service.check(db, user, new_jobs, count_admitted)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+
+
+@contextmanager
+def _admitting(db: Session, user: models.User, new_jobs: int = 1) -> Iterator[None]:
+    """admission_service.admitting(), refusing with 429 + Retry-After like _admit. Insert and commit the jobs inside. Blocking."""
+    try:
+        with admission_service.admitting(db, user, new_jobs):
+            yield
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+
+
+def _register_upload(
+    db: Session,
+    current_user: models.User,
+    filename: str,
+    mime_type: str,
+    file_key: str,
+    file_size: int,
+    sha256: str,
+    request: Optional[Request],
+    response: Optional[Response],
+    admit: bool = True
+) -> models.Invoice:
+    """Create the invoice for a stored document, audit it and queue processing (or return the user's duplicate). Blocking; call through run_io.
+
+    With admit the invoice, audit entry and job are committed under the tenant's admission lock (429 if over the limit).
+    """
+    ip_address = request.client.host if request and request.client else None
+    user_agent = request.headers.get("user-agent") if request else None
     
-    # Generate unique filename
-    file_id = str(uuid.uuid4())
-    file_path = UPLOAD_DIR / f"{file_id}{file_ext}"
+    # Same user, same document (forwarded email, retry after timeout): return the existing invoice
+    existing = _find_user_duplicate(db, current_user.id, sha256)
+    if existing:
+        return _duplicate_upload_response(db, existing, filename, ip_address, user_agent, response)
     
-    # Save file
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    # Same document uploaded by someone else: link it so the workflow can reuse OCR/AI results
+    original = db.query(models.Invoice).filter(
+        models.Invoice.content_hash == sha256
+    ).order_by(models.Invoice.id).first()
     
     # Create invoice record
     invoice = models.Invoice(
-        filename=file.filename,
-        file_path=str(file_path),
-        file_size=len(contents),
-        mime_type=file.content_type,
+        filename=filename,
+        file_path=file_key,
+        file_size=file_size,
+        mime_type=mime_type,
+        content_hash=sha256,
+        duplicate_of_id=original.id if original else None,
         uploaded_by=current_user.id,
         status=models.ProcessingStatus.UPLOADED
     )
     
-    db.add(invoice)
-    db.commit()
-    db.refresh(invoice)
+    try:
+        with _admitting(db, current_user) if admit else nullcontext():
+            db.add(invoice)
+            db.flush()
+            audit_service.log_upload(
+                db=db,
+                user_id=current_user.id,
+                invoice_id=invoice.id,
+                filename=filename,
+                file_size=file_size,
+                ip_address=ip_address,
+                user_agent=user_agent,
+                sha256=sha256,
+                commit=False
+            )
+            # Queue processing (OCR → AI → rules → save) for the worker; returns immediately
+            job_queue.enqueue(db, kind="process_invoice", invoice_id=invoice.id, user_id=current_user.id, commit=False)
+            db.commit()
+    except IntegrityError:
+        # Concurrent upload of the same document by the same user won the race
+        db.rollback()
+        existing = _find_user_duplicate(db, current_user.id, sha256)
+        return _duplicate_upload_response(db, existing, filename, ip_address, user_agent, response)
+    db.refresh(invoice)  # loaded here, not lazily while the response is serialized on the event loop
     
-    # Log upload
-    ip_address = request.client.host if request else None
-    user_agent = request.headers.get("user-agent") if request else None
-    audit_service.log_upload(
+    return invoice
+
+
+def _find_user_duplicate(db: Session, user_id: int, sha256: str) -> Optional[models.Invoice]:
+    return db.query(models.Invoice).filter(
+        models.Invoice.uploaded_by == user_id,
+        models.Invoice.content_hash == sha256
+    ).first()
+
+
+def _duplicate_upload_response(
+    db: Session,
+    invoice: models.Invoice,
+    filename: str,
+    ip_address: Optional[str],
+    user_agent: Optional[str],
+    response: Optional[Response]
+) -> models.Invoice:
+    """Audit a duplicate upload and return the existing invoice with 200 instead of 202."""
+    audit_service.log_action(
         db=db,
-        user_id=current_user.id,
+        action="upload_duplicate",
+        user_id=invoice.uploaded_by,
         invoice_id=invoice.id,
-        filename=file.filename,
-        file_size=len(contents),
+        metadata={"filename": filename, "sha256": invoice.content_hash},
         ip_address=ip_address,
         user_agent=user_agent
     )
+    if response is not None:
+        response.status_code = status.HTTP_200_OK
+    db.refresh(invoice)
+    return invoice
+
+
+async def _stream_upload(file: UploadFile, file_ext: str) -> Tuple[str, int, str]:
+    """Stream an upload to storage in UPLOAD_CHUNK_SIZE chunks. Returns (storage key, size, sha256 hex)."""
+    writer = await run_io(storage.open_writer, file_ext, max_size=settings.MAX_UPLOAD_SIZE)
+    try:
+        while True:
+            chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await run_io(writer.write, chunk)
+        return await run_io(writer.commit)
+    except FileTooLargeError as e:
+        await run_io(writer.abort)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except BaseException:
+        await run_io(writer.abort)
+        raise
+
+
+def _store_fileobj(fileobj: BinaryIO, file_ext: str) -> Tuple[str, int, str]:
+    """Synchronous variant of _stream_upload for file objects (e.g. zip entries). Raises FileTooLargeError."""
+    writer = storage.open_writer(file_ext, max_size=settings.MAX_UPLOAD_SIZE)
+    try:
+        for chunk in iter(lambda: fileobj.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            writer.write(chunk)
+        return writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+@router.post("/bulk", response_model=BulkUploadResponse, status_code=status.HTTP_202_ACCEPTED)
+async def bulk_upload_invoices(
+    files: List[UploadFile] = File(...),
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """
+    Upload many invoices at once (multiple files and/or zip archives) and queue them all.
     
-    # Process invoice via workflow (OCR → AI → rules → save; safe dataflow, audited)
+    Documents are streamed to storage one at a time; invoices, audit entries and jobs are
+    inserted in batched statements with a single commit. Poll GET /batches/{batch_id} for progress.
+    """
+    # Admit the documents the zip archives expand to, before anything is stored
+    document_count = await run_io(_count_bulk_documents, files)
+    if document_count > settings.MAX_BULK_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many documents. Maximum per bulk upload: {settings.MAX_BULK_FILES}"
+        )
+    await run_io(_admit, db, current_user, document_count, False)
+    documents, skipped = await run_io(_store_bulk_documents, files)
+    ip_address = request.client.host if request and request.client else None
+    user_agent = request.headers.get("user-agent") if request else None
+    return await run_io(_register_bulk, db, current_user, documents, skipped, ip_address, user_agent)
+
+
+def _register_bulk(
+    db: Session,
+    current_user: models.User,
+    documents: List[Dict[str, Any]],
+    skipped: List[str],
+    ip_address: Optional[str],
+    user_agent: Optional[str]
+) -> Dict[str, Any]:
+    """Create the batch, its invoices, audit entries and jobs for stored bulk documents (one commit, under the tenant's admission lock)."""
     try:
-        await process_invoice(db, invoice.id, current_user.id)
-    except Exception as e:
-        invoice.status = models.ProcessingStatus.ERROR
-        db.commit()
+        with _admitting(db, current_user, len(documents)):
+            return _insert_bulk(db, current_user, documents, skipped, ip_address, user_agent)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Some of these documents were uploaded concurrently; retry the batch"
+        )
+
+
+def _insert_bulk(
+    db: Session,
+    current_user: models.User,
+    documents: List[Dict[str, Any]],
+    skipped: List[str],
+    ip_address: Optional[str],
+    user_agent: Optional[str]
+) -> Dict[str, Any]:
+    batch = models.UploadBatch(
+        uploaded_by=current_user.id,
+        total_files=len(documents) + len(skipped),
+        skipped_count=len(skipped),
+    )
+    db.add(batch)
+    db.flush()
+    
+    # Dedup against this user's invoices (and within the batch); link other users' copies
+    hashes = list({d["sha256"] for d in documents})
+    existing_by_hash: Dict[str, Any] = dict(
+        db.query(models.Invoice.content_hash, models.Invoice.id).filter(
+            models.Invoice.uploaded_by == current_user.id,
+            models.Invoice.content_hash.in_(hashes)
+        ).all()
+    )
+    originals: Dict[str, int] = dict(
+        db.query(models.Invoice.content_hash, func.min(models.Invoice.id)).filter(
+            models.Invoice.content_hash.in_(hashes)
+        ).group_by(models.Invoice.content_hash).all()
+    )
+    
+    new_invoices: List[models.Invoice] = []
+    duplicates: List[Any] = []  # existing invoice ids, or invoices created earlier in this batch
+    for doc in documents:
+        if doc["sha256"] in existing_by_hash:
+            duplicates.append(existing_by_hash[doc["sha256"]])
+            continue
+        invoice = models.Invoice(
+            filename=doc["filename"],
+            file_path=doc["key"],
+            file_size=doc["size"],
+            mime_type=doc["mime_type"],
+            content_hash=doc["sha256"],
+            duplicate_of_id=originals.get(doc["sha256"]),
+            batch_id=batch.id,
+            uploaded_by=current_user.id,
+            status=models.ProcessingStatus.UPLOADED
+        )
+        new_invoices.append(invoice)
+        existing_by_hash[doc["sha256"]] = invoice
+    
+    db.add_all(new_invoices)
+    db.flush()
+    duplicate_ids = [d.id if isinstance(d, models.Invoice) else d for d in duplicates]
+    batch.duplicate_count = len(duplicate_ids)
+    
+    audit_entries = [
+        {
+            "action": "bulk_upload",
+            "user_id": current_user.id,
+            "metadata": {"batch_id": batch.id, "total_files": batch.total_files, "skipped": skipped},
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+        }
+    ]
+    audit_entries += [
+        {
+            "action": "upload",
+            "user_id": current_user.id,
+            "invoice_id": invoice.id,
+            "metadata": {
+                "filename": invoice.filename,
+                "file_size": invoice.file_size,
+                "sha256": invoice.content_hash,
+                "batch_id": batch.id,
+            },
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+        }
+        for invoice in new_invoices
+    ]
+    audit_service.log_actions_bulk(db, audit_entries, commit=False)
+    job_queue.enqueue_many(
+        db, kind="process_invoice", invoice_ids=[i.id for i in new_invoices], user_id=current_user.id, commit=False
+    )
+    db.commit()
+    
+    return {
+        "batch_id": batch.id,
+        "total_files": batch.total_files,
+        "queued": len(new_invoices),
+        "duplicate_invoice_ids": duplicate_ids,
+        "skipped": skipped,
+    }
+
+
+def _is_bulk_document(info: zipfile.ZipInfo) -> bool:
+    """True for zip entries that are documents (not directories or macOS metadata)."""
+    return not info.is_dir() and not info.filename.startswith("__MACOSX/")
+
+
+def _count_bulk_documents(files: List[UploadFile]) -> int:
+    """Documents of an allowed type in a bulk upload, zip entries included (read from the archives' directories)."""
+    count = 0
+    for upload in files:
+        name = upload.filename or ""
+        if Path(name).suffix.lower() != ".zip":
+            count += Path(name).suffix.lower() in settings.ALLOWED_EXTENSIONS
+            continue
+        try:
+            with zipfile.ZipFile(upload.file) as archive:
+                count += sum(
+                    1 for info in archive.infolist()
+                    if _is_bulk_document(info) and Path(info.filename).suffix.lower() in settings.ALLOWED_EXTENSIONS
+                )
+        except zipfile.BadZipFile:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid zip archive: {name}"
+            )
+    return count
+
+
+def _store_bulk_documents(files: List[UploadFile]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Stream every document (zip entries included) to storage. Returns (stored documents, skipped names)."""
+    documents: List[Dict[str, Any]] = []
+    skipped: List[str] = []
+    
+    def store(filename: str, mime_type: Optional[str], fileobj: BinaryIO) -> None:
+        file_ext = Path(filename).suffix.lower()
+        if file_ext not in settings.ALLOWED_EXTENSIONS:
+            skipped.append(filename)
+            return
+        try:
+            key, size, sha256 = _store_fileobj(fileobj, file_ext)
+        except FileTooLargeError:
+            skipped.append(filename)
+            return
+        documents.append({
+            "filename": Path(filename).name,
+            "mime_type": mime_type or mimetypes.guess_type(filename)[0],
+            "key": key,
+            "size": size,
+            "sha256": sha256,
+        })
+    
+    for upload in files:
+        name = upload.filename or ""
+        if Path(name).suffix.lower() != ".zip":
+            store(name, upload.content_type, upload.file)
+            continue
+        try:
+            with zipfile.ZipFile(upload.file) as archive:
+                for info in archive.infolist():
+                    if not _is_bulk_document(info):
+                        continue
+                    if info.file_size > settings.MAX_UPLOAD_SIZE:
+                        skipped.append(info.filename)
+                        continue
+                    with archive.open(info) as entry:
+                        store(info.filename, mimetypes.guess_type(info.filename)[0], entry)
+        except zipfile.BadZipFile:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid zip archive: {name}"
+            )
+    
+    return documents, skipped
+
+
+@router.get("/batches/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(
+    batch_id: int,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get processing progress of a bulk upload."""
+    return await run_io(_batch_status, db, batch_id, current_user)
+
+
+def _batch_status(db: Session, batch_id: int, current_user: models.User) -> Dict[str, Any]:
+    """Batch counters and per-status invoice counts. Blocking; call through run_io."""
+    batch = db.query(models.UploadBatch).filter(models.UploadBatch.id == batch_id).first()
+    
+    if not batch:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch not found"
+        )
+    
+    if batch.uploaded_by != current_user.id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this batch"
+        )
+    
+    counts = db.query(models.Invoice.status, func.count(models.Invoice.id)).filter(
+        models.Invoice.batch_id == batch_id
+    ).group_by(models.Invoice.status).all()
+    pending_jobs = db.query(models.Job).join(
+        models.Invoice, models.Job.invoice_id == models.Invoice.id
+    ).filter(
+        models.Invoice.batch_id == batch_id,
+        models.Job.status.in_([models.JobStatus.QUEUED, models.JobStatus.RUNNING])
+    ).count()
+    
+    return {
+        "batch_id": batch.id,
+        "total_files": batch.total_files,
+        "duplicates": batch.duplicate_count,
+        "skipped": batch.skipped_count,
+        "status_counts": {s.value: n for s, n in counts},
+        "finished": pending_jobs == 0,
+        "created_at": batch.created_at,
+    }
+
+
+@router.post("/uploads", response_model=ResumableUploadResponse, status_code=status.HTTP_201_CREATED)
+async def create_resumable_upload(
+    upload: ResumableUploadCreate,
+    request: Request,
+    response: Response,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a resumable upload (tus-style) for large documents on unreliable connections.
+    
+    Protocol: create here, PATCH /uploads/{id} with chunks at Upload-Offset (HEAD gives the
+    current offset after a dropped connection), then POST /uploads/{id}/finalize.
+    """
+    file_ext = Path(upload.filename).suffix.lower()
+    if file_ext not in settings.ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid file type. Allowed: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+        )
+    if upload.size <= 0 or upload.size > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+        )
+    # Admitted once, before any data is sent; finalize is not refused
+    await run_io(_admit, db, current_user)
+    session = await run_io(_create_upload_session, db, current_user, upload)
+    
+    response.headers.update(_tus_headers(session))
+    response.headers["Location"] = str(request.url_for("get_resumable_upload", upload_id=session.id))
+    return session
+
+
+@router.head("/uploads/{upload_id}")
+async def get_resumable_upload_offset(
+    upload_id: str,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Current offset of a resumable upload (Upload-Offset header); resume PATCHing from there."""
+    session = await run_io(_get_upload_session, db, upload_id, current_user)
+    return Response(status_code=status.HTTP_200_OK, headers=_tus_headers(session))
+
+
+@router.get("/uploads/{upload_id}", response_model=ResumableUploadResponse)
+async def get_resumable_upload(
+    upload_id: str,
+    response: Response,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get a resumable upload session."""
+    session = await run_io(_get_upload_session, db, upload_id, current_user)
+    response.headers.update(_tus_headers(session))
+    return session
+
+
+@router.patch("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def upload_resumable_chunk(
+    upload_id: str,
+    request: Request,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Append a chunk (raw request body) at the offset given in the Upload-Offset header.
+    
+    If the connection drops mid-chunk, the bytes received so far are kept; HEAD returns the new offset.
+    """
+    session = await run_io(_get_upload_session, db, upload_id, current_user)
+    if session.status != models.UploadSessionStatus.ACTIVE:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload already finalized"
+        )
+    
+    offset_header = request.headers.get("upload-offset", "")
+    if not offset_header.isdigit() or int(offset_header) != session.offset:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload-Offset mismatch; expected {session.offset}",
+            headers=_tus_headers(session)
+        )
+    
+    # Only one request may write at this offset; a concurrent PATCH (or finalize) gets 409
+    if not await run_io(_claim_upload_session, db, session, session.offset):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Processing failed: {str(e)}"
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload is busy or the offset moved; current offset {session.offset}",
+            headers=_tus_headers(session)
         )
     
+    received = 0
+    try:
+        writer = await run_io(storage.open_part_writer, session.id, session.offset)
+        written = 0
+        try:
+            async for chunk in request.stream():
+                if session.offset + written + len(chunk) > session.total_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Chunk exceeds the declared upload size"
+                    )
+                await run_io(writer.write, chunk)
+                written += len(chunk)
+        except ClientDisconnect:
+            pass  # keep what arrived; the client resumes from the new offset
+        except BaseException:
+            await run_io(writer.abort)
+            raise
+        await run_io(writer.close)
+        received = written
+    finally:
+        await run_io(_release_upload_session, db, session, received)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_tus_headers(session))
+
+
+@router.post("/uploads/{upload_id}/finalize", response_model=InvoiceResponse, status_code=status.HTTP_202_ACCEPTED)
+async def finalize_resumable_upload(
+    upload_id: str,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    request: Request = None,
+    response: Response = None
+):
+    """Assemble a completed resumable upload into a document and queue it like /upload."""
+    session = await run_io(_get_upload_session, db, upload_id, current_user)
+    if session.status == models.UploadSessionStatus.FINALIZED:
+        response.status_code = status.HTTP_200_OK
+        return await run_io(_get_finalized_invoice, db, session)
+    if session.offset != session.total_size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload incomplete: {session.offset} of {session.total_size} bytes received",
+            headers=_tus_headers(session)
+        )
+    
+    # Claim the session so concurrent finalizes do not both assemble and register the document
+    if not await run_io(_claim_upload_session, db, session, session.total_size):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is being written or finalized by another request",
+            headers=_tus_headers(session)
+        )
+    
+    try:
+        file_key, file_size, sha256 = await run_io(_assemble_partial, session.id, Path(session.filename).suffix.lower())
+        invoice = await run_io(
+            _register_upload, db, current_user, session.filename, session.mime_type, file_key, file_size, sha256, request, response,
+            False
+        )
+    except BaseException:
+        await run_io(_release_upload_session, db, session, 0)
+        raise
+    await run_io(_finish_upload_session, db, session, invoice)
+    await run_io(storage.delete_partial, session.id)
     return invoice
 
 
-async def process_invoice(db: Session, invoice_id: int, user_id: Optional[int] = None):
-    """Process an invoice via the default workflow (OCR → AI → rules → save). Safe dataflow, every step audited."""
-    invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
-    if not invoice:
-        return
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_resumable_upload(
+    upload_id: str,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Abort a resumable upload and discard the data received so far."""
+    session = await run_io(_get_upload_session, db, upload_id, current_user, True)
+    await run_io(storage.delete_partial, session.id)
+    await run_io(_delete_upload_session, db, session)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def _assemble_partial(upload_id: str, file_ext: str) -> Tuple[str, int, str]:
+    """Copy a completed resumable upload into content-addressed storage. Returns (storage key, size, sha256 hex)."""
+    writer = storage.open_writer(file_ext, max_size=settings.MAX_UPLOAD_SIZE)
     try:
-        context = {
-            "invoice_id": invoice_id,
-            "file_path": invoice.file_path,
-            "mime_type": invoice.mime_type,
-            "user_id": user_id or invoice.uploaded_by,
-        }
-        run_workflow(
-            trigger="invoice_uploaded",
-            context=context,
-            steps=DEFAULT_INVOICE_STEPS,
-            db=db,
-            user_id=user_id or invoice.uploaded_by,
-            invoice_id=invoice_id,
-        )
-    except Exception:
-        invoice.status = models.ProcessingStatus.ERROR
-        db.commit()
+        for chunk in storage.iter_partial(upload_id):
+            writer.write(chunk)
+        return writer.commit()
+    except BaseException:
+        writer.abort()
         raise
 
 
+def _create_upload_session(db: Session, current_user: models.User, upload: ResumableUploadCreate) -> models.UploadSession:
+    """Insert an active upload session. Blocking; call through run_io."""
+    session = models.UploadSession(
+        id=str(uuid.uuid4()),
+        user_id=current_user.id,
+        filename=upload.filename,
+        mime_type=upload.mime_type or mimetypes.guess_type(upload.filename)[0],
+        total_size=upload.size,
+        offset=0,
+        status=models.UploadSessionStatus.ACTIVE,
+        expires_at=datetime.utcnow() + timedelta(hours=settings.RESUMABLE_UPLOAD_EXPIRE_HOURS),
+    )
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+
+def _claim_upload_session(db: Session, session: models.UploadSession, expected_offset: int) -> bool:
+    """
+    Lock an active session at expected_offset for one PATCH or finalize (conditional UPDATE, so
+    concurrent requests cannot both pass). Locks older than RESUMABLE_UPLOAD_LOCK_SECONDS are taken
+    over. Returns False if the session moved on or is held; session is refreshed either way.
+    """
+    now = datetime.utcnow()
+    claimed = db.query(models.UploadSession).filter(
+        models.UploadSession.id == session.id,
+        models.UploadSession.status == models.UploadSessionStatus.ACTIVE,
+        models.UploadSession.offset == expected_offset,
+        or_(
+            models.UploadSession.locked_at.is_(None),
+            models.UploadSession.locked_at < now - timedelta(seconds=settings.RESUMABLE_UPLOAD_LOCK_SECONDS)
+        )
+    ).update({models.UploadSession.locked_at: now}, synchronize_session=False)
+    db.commit()
+    db.refresh(session)
+    return claimed == 1
+
+
+def _release_upload_session(db: Session, session: models.UploadSession, received: int) -> None:
+    """Unlock a claimed session, advancing its offset by the bytes received."""
+    db.query(models.UploadSession).filter(models.UploadSession.id == session.id).update(
+        {
+            models.UploadSession.offset: models.UploadSession.offset + received,
+            models.UploadSession.locked_at: None,
+        },
+        synchronize_session=False
+    )
+    db.commit()
+    db.refresh(session)
+
+
+def _finish_upload_session(db: Session, session: models.UploadSession, invoice: models.Invoice) -> None:
+    """Mark a claimed session finalized with its invoice and unlock it."""
+    session.status = models.UploadSessionStatus.FINALIZED
+    session.invoice_id = invoice.id
+    session.locked_at = None
+    db.commit()
+    db.refresh(session)
+    db.refresh(invoice)
+
+
+def _get_finalized_invoice(db: Session, session: models.UploadSession) -> Optional[models.Invoice]:
+    return db.query(models.Invoice).filter(models.Invoice.id == session.invoice_id).first()
+
+
+def _delete_upload_session(db: Session, session: models.UploadSession) -> None:
+    """Drop an active session (finalized ones stay as the record of their invoice)."""
+    if session.status == models.UploadSessionStatus.ACTIVE:
+        db.delete(session)
+        db.commit()
+
+
+def _get_upload_session(
+    db: Session,
+    upload_id: str,
+    current_user: models.User,
+    allow_expired: bool = False
+) -> models.UploadSession:
+    """Load the current user's upload session (404/403/410 otherwise). Blocking; call through run_io."""
+    session = db.query(models.UploadSession).filter(models.UploadSession.id == upload_id).first()
+    
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    
+    if session.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this upload"
+        )
+    
+    expired = session.expires_at.replace(tzinfo=None) < datetime.utcnow()
+    if expired and not allow_expired and session.status == models.UploadSessionStatus.ACTIVE:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Upload expired"
+        )
+    
+    return session
+
+
+def _tus_headers(session: models.UploadSession) -> Dict[str, str]:
+    return {
+        "Tus-Resumable": TUS_VERSION,
+        "Upload-Offset": str(session.offset),
+        "Upload-Length": str(session.total_size),
+    }
+
+
 @router.get("/", response_model=List[InvoiceResponse])
 async def list_invoices(
     skip: int = 0,
@@ -202,3 +905,49 @@ async def get_invoice(
             for s in suggestions
         ]
     }
+
+
+@router.get("/{invoice_id}/ocr-layout", response_model=OCRLayoutResponse)
+async def get_invoice_ocr_layout(
+    invoice_id: int,
+    page: Optional[int] = None,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the word boxes and confidences from OCR (for highlighting and field extraction), optionally one page."""
+    return await run_io(_ocr_layout, db, invoice_id, page, current_user)
+
+
+def _ocr_layout(db: Session, invoice_id: int, page: Optional[int], current_user: models.User) -> Dict[str, Any]:
+    """Load and unpack an invoice's stored OCR layout. Blocking; call through run_io."""
+    invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
+    
+    if not invoice:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invoice not found"
+        )
+    
+    # Check access (user can only see their own invoices, unless admin)
+    if invoice.uploaded_by != current_user.id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this invoice"
+        )
+    
+    layout = db.query(models.OCRLayout).filter(models.OCRLayout.invoice_id == invoice_id).first()
+    if not layout:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No OCR layout for this invoice"
+        )
+    
+    pages = ocr_service.unpack_layout(layout.data)
+    if page is not None:
+        pages = [p for p in pages if p["page"] == page]
+    return {
+        "invoice_id": invoice_id,
+        "page_count": layout.page_count,
+        "word_count": layout.word_count,
+        "pages": pages,
+    }
@@ -8,6 +8,7 @@ from app.db.database import get_db
 from app.db import models
 from app.core.security import get_current_active_user
 from app.services.audit_service import audit_service
+from app.services.vendor_memory_service import vendor_memory_service
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -66,6 +67,7 @@ async def approve_suggestion(
         )
     
     # Update suggestion
+    previous_status = suggestion.approval_status
     if approval_request.approved:
         suggestion.approval_status = models.ApprovalStatus.APPROVED
         suggestion.approved_by = current_user.id
@@ -81,8 +83,11 @@ async def approve_suggestion(
     db.commit()
     db.refresh(suggestion)
     
+    # Learn the vendor's booking for the vendor memory fast path
+    vendor_memory_service.record_decision(db, invoice, suggestion, previous_status)
+    
     # Log approval/rejection
-    ip_address = request.client.host if request else None
+    ip_address = request.client.host if request and request.client else None
     user_agent = request.headers.get("user-agent") if request else None
     audit_service.log_approval(
         db=db,
@@ -24,9 +24,53 @@ class Settings(BaseSettings):
     
     # OpenAI (set in Railway Variables; get from platform.openai.com/api-keys)
     OPENAI_API_KEY: str = Field(default="", description="OpenAI API key; set for AI suggestions")
+    AI_MAX_CONCURRENT_REQUESTS: int = 32  # LLM calls in flight per worker process (async path)
+    AI_MAX_CONNECTIONS: int = 32  # pooled keep-alive HTTP connections to the API per worker process
+    AI_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    AI_REQUEST_TIMEOUT_SECONDS: float = 60.0
+    AI_CACHE_ENABLED: bool = True  # reuse LLM answers for the same (whitespace-normalized) OCR text, prompt and model
+    AI_CACHE_TTL_HOURS: int = 720  # cached answers older than this are not used
+    AI_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # least recently used entries are evicted beyond this
+    AI_COMPACTION_ENABLED: bool = True  # normalize, deduplicate and strip boilerplate from OCR text before the prompt
+    AI_PROMPT_TOKEN_BUDGET: int = 2000  # max OCR text tokens in the prompt after compaction (0 = no limit)
+    # Vendor memory: recurring vendors get their approved account/VAT code without an LLM call
+    VENDOR_MEMORY_ENABLED: bool = True
+    VENDOR_MEMORY_MIN_APPROVALS: int = 3  # approvals of the same booking needed for a vendor
+    VENDOR_MEMORY_MIN_CONFIDENCE: float = 0.8  # calibrated confidence needed to skip the LLM
+    OPENAI_BASE_URL: str = ""  # empty for api.openai.com; e.g. http://localhost:8090/v1 for scripts/openai_batch_stub.py
+    # Batch API for non-urgent work: suggestions are collected into JSONL batches and the workflow resumes when results arrive
+    AI_BATCH_MODE: str = "off"  # "off", "bulk" (invoices from bulk uploads) or "all"
+    AI_BATCH_MAX_REQUESTS: int = 5000  # requests per batch; a full batch is submitted immediately
+    AI_BATCH_MAX_WAIT_SECONDS: int = 600  # a partial batch is submitted once its oldest request waited this long
+    AI_BATCH_POLL_INTERVAL_SECONDS: float = 60.0  # worker submits and polls batches at this interval
+    AI_BATCH_COMPLETION_WINDOW: str = "24h"
     
     # OCR
     TESSERACT_CMD: str = "/usr/bin/tesseract"
+    OCR_ENGINE: str = "auto"  # "tesserocr" (in-process), "pytesseract" (CLI per image) or "auto" (tesserocr if installed)
+    PDF_TEXT_LAYER_ENABLED: bool = True  # use embedded PDF text (pdftotext) and OCR only scanned pages
+    PDFTOTEXT_CMD: str = "pdftotext"
+    PDFTOTEXT_TIMEOUT_SECONDS: int = 30
+    PDF_TEXT_LAYER_MIN_CHARS: int = 30  # non-whitespace chars a page needs to skip OCR
+    OCR_MAX_PARALLEL_PAGES: int = 4  # pages of one document OCR'd at once in the shared cpu pool
+    PDFINFO_CMD: str = "pdfinfo"
+    OCR_LANGUAGES: str = "nor+eng"
+    OCR_DPI: int = 300
+    OCR_ADAPTIVE_DPI_ENABLED: bool = True  # OCR at OCR_LOW_DPI first; re-run at OCR_DPI only if confidence is low
+    OCR_LOW_DPI: int = 150
+    OCR_MIN_CONFIDENCE: float = 80.0  # mean Tesseract word confidence (0-100) to accept a page
+    OCR_MAX_PDF_PAGES: int = 200  # pages to OCR per document; later pages are skipped and the result marked truncated
+    OCR_DOCUMENT_TIME_BUDGET_SECONDS: float = 300.0  # wall clock per document; pages not started by then are skipped (0 = no limit)
+    OCR_MAX_PAGE_PIXELS: int = 25_000_000  # larger pages are rendered at a lower DPI (A4 at 300 DPI is ~8.7M)
+    OCR_CACHE_ENABLED: bool = True  # reuse OCR output for unchanged documents and OCR settings
+    OCR_CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # least recently used entries are evicted beyond this
+    OCR_PAGE_CACHE_ENABLED: bool = True  # reuse OCR output for identical PDF pages across documents (e.g. supplier terms pages)
+    OCR_PAGE_CACHE_HASH_DPI: int = 50  # pages are identified by a hash of a render at this DPI
+    OCR_PAGE_CACHE_MEMORY_BYTES: int = 64 * 1024 * 1024  # in-process LRU in front of the persistent page cache
+    OCR_PAGE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # persistent page cache; least recently used entries are evicted beyond this
+    IMAGE_NORMALIZE_ENABLED: bool = True  # OCR photos from a grayscale, downscaled copy in temp space (not stored)
+    IMAGE_NORMALIZE_MAX_SIDE: int = 3000  # px on the long side (~300 DPI for an A4 page)
+    OCR_PREPROCESS_DOCUMENT_TYPES: List[str] = ["photo"]  # crop/deskew/binarize before OCR: "photo" (image uploads), "scan" (OCR'd PDF pages)
     
     # Application
     ENVIRONMENT: str = "development"
@@ -60,8 +104,43 @@ class Settings(BaseSettings):
     
     # File upload
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # uploads are streamed to storage in chunks of this size
+    MULTIPART_OVERHEAD: int = 64 * 1024  # allowance for multipart headers/boundaries over MAX_UPLOAD_SIZE
+    MAX_BULK_UPLOAD_SIZE: int = 500 * 1024 * 1024  # total request body for /invoices/bulk (500MB)
+    MAX_BULK_FILES: int = 200  # documents per bulk upload (after expanding zip archives); keep <= the per-user limit
+    RESUMABLE_UPLOAD_EXPIRE_HOURS: int = 24
+    RESUMABLE_UPLOAD_LOCK_SECONDS: int = 900  # a PATCH/finalize holding a session longer than this is presumed dead
+    
+    # Admission control for uploads (0 disables a limit); refused uploads get 429 + Retry-After
+    ADMISSION_MAX_QUEUE_DEPTH: int = 2000  # queued jobs, all users
+    ADMISSION_MAX_IN_FLIGHT_PER_USER: int = 200  # queued + running jobs per user
+    ADMISSION_MAX_IN_FLIGHT_PER_TENANT: int = 500  # queued + running jobs per tenant (accounting firm)
+    ADMISSION_RETRY_AFTER_SECONDS: int = 30
+    
+    # Document storage: "local" (sharded directory) or "s3" (S3-compatible, e.g. MinIO)
+    STORAGE_BACKEND: str = "local"
+    STORAGE_LOCAL_DIR: str = "uploads"
+    S3_BUCKET: str = ""
+    S3_PREFIX: str = ""
+    S3_ENDPOINT_URL: str = ""  # e.g. http://minio:9000; empty for AWS
+    S3_REGION: str = ""
+    S3_ACCESS_KEY_ID: str = ""  # empty: use the default AWS credential chain
+    S3_SECRET_ACCESS_KEY: str = ""
     ALLOWED_EXTENSIONS: List[str] = [".pdf", ".png", ".jpg", ".jpeg"]
     
+    # Background job queue (worker: python -m app.worker)
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: int = 30
+    JOB_STALE_AFTER_SECONDS: int = 900  # RUNNING jobs older than this are requeued (worker crashed)
+    JOB_REQUEUE_STALE_INTERVAL_SECONDS: float = 60.0  # how often each worker checks for stale jobs
+    CACHE_EVICT_INTERVAL_SECONDS: float = 300.0  # how often each worker trims the OCR/AI caches to their size limits
+    WORKER_CONCURRENCY: int = 32  # jobs run concurrently per worker process (coroutines on one event loop)
+    
+    # Executor pools for blocking work (see app/core/executors.py)
+    IO_POOL_MAX_WORKERS: int = 16
+    CPU_POOL_MAX_WORKERS: int = 0  # 0 = CPUs available to the process
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,156 @@
+"""
+Bounded executor pools for blocking work.
+
+- io_pool (threads): file/object-storage I/O and blocking client calls from async endpoints.
+- cpu_pool (processes): CPU-bound work such as OCR and rasterization, so it runs on all
+  cores and never holds the GIL of the API or worker process.
+
+Pools are created lazily on first use and record per-pool metrics (submitted, running,
+completed, failed, queue wait and run time), exposed via GET /api/v1/admin/executors.
+"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from app.core.config import settings
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    """Run fn in the pool and report when it actually started (for queue-wait metrics)."""
+    started_at = time.time()
+    result = fn(*args, **kwargs)
+    return result, started_at
+
+
+class ExecutorPool:
+    """A lazily created, fixed-size thread or process pool with metrics."""
+
+    def __init__(self, name: str, kind: str, max_workers: int):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_ms_total = 0.0
+        self.run_ms_total = 0.0
+        self.max_wait_ms = 0.0
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "thread":
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=f"{self.name}-pool"
+                    )
+                else:
+                    # spawn: children never inherit the parent's threads or DB connections
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+            return self._executor
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        """Submit blocking work; returns a Future with fn's result."""
+        outer: Future = Future()
+        submitted_at = time.time()
+        with self._lock:
+            self.submitted += 1
+        inner = self._get_executor().submit(_timed_call, fn, args, kwargs)
+
+        def on_done(f: Future) -> None:
+            if f.cancelled():
+                outer.cancel()
+                return
+            finished_at = time.time()
+            exc = f.exception()
+            with self._lock:
+                if exc is not None:
+                    self.failed += 1
+                else:
+                    _, started_at = f.result()
+                    wait_ms = max(0.0, (started_at - submitted_at) * 1000)
+                    self.completed += 1
+                    self.wait_ms_total += wait_ms
+                    self.run_ms_total += (finished_at - started_at) * 1000
+                    self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            if outer.cancelled():
+                return  # the caller gave up on the result
+            if exc is not None:
+                outer.set_exception(exc)
+            else:
+                outer.set_result(f.result()[0])
+
+        def on_outer_done(f: Future) -> None:
+            # Cancelling the returned future cancels the work if it has not started yet
+            if f.cancelled():
+                inner.cancel()
+
+        inner.add_done_callback(on_done)
+        outer.add_done_callback(on_outer_done)
+        return outer
+
+    async def run(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Await blocking work from async code without stalling the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "name": self.name,
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "started": self._executor is not None,
+                "submitted": self.submitted,
+                "in_flight": self.submitted - finished,  # running + queued
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.wait_ms_total / self.completed, 2) if self.completed else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 2),
+                "avg_run_ms": round(self.run_ms_total / self.completed, 2) if self.completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects affinity/cpusets, unlike os.cpu_count())."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+io_pool = ExecutorPool("io", "thread", settings.IO_POOL_MAX_WORKERS)
+cpu_pool = ExecutorPool("cpu", "process", settings.CPU_POOL_MAX_WORKERS or available_cpus())
+
+
+async def run_io(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run blocking I/O in the io pool."""
+    return await io_pool.run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run CPU-bound work in the cpu (process) pool. fn and its arguments must be picklable."""
+    return await cpu_pool.run(fn, *args, **kwargs)
+
+
+def all_pool_metrics() -> Dict[str, Dict[str, Any]]:
+    return {pool.name: pool.metrics() for pool in (io_pool, cpu_pool)}
+
+
+def shutdown_pools() -> None:
+    for pool in (io_pool, cpu_pool):
+        pool.shutdown()
@@ -1,7 +1,8 @@
 """
 Custom middleware.
 """
-from fastapi import Request
+from fastapi import Request, HTTPException, status
+from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 import time
 
@@ -15,3 +16,56 @@ class TimingMiddleware(BaseHTTPMiddleware):
         process_time = time.time() - start_time
         response.headers["X-Process-Time"] = str(process_time)
         return response
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject upload requests whose body exceeds a limit before it is parsed.
+
+    Checks Content-Length up front and counts bytes as they are received, so
+    chunked bodies without a Content-Length are cut off while streaming instead
+    of being spooled in full first.
+    """
+    
+    def __init__(self, app, max_body_size: int, paths: tuple):
+        self.app = app
+        self.max_body_size = max_body_size
+        # Exact paths (a trailing slash is ignored), so e.g. /invoices/uploads/... is not limited as /invoices/upload
+        self.paths = {path.rstrip("/") for path in paths}
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].rstrip("/") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # HTTPException passes through FastAPI's body parsing and becomes a 413 response
+                    raise _too_large(self.max_body_size)
+            return message
+        
+        await self.app(scope, limited_receive, send)
+    
+    async def _reject(self, scope, receive, send):
+        exc = _too_large(self.max_body_size)
+        response = JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+        await response(scope, receive, send)
+
+
+def _too_large(max_body_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request too large. Maximum size: {max_body_size / 1024 / 1024:.0f}MB",
+    )
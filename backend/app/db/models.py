@@ -1,7 +1,7 @@
 """
 Database models for the accounting assistant platform.
 """
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, LargeBinary, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -24,6 +24,28 @@ class ProcessingStatus(str, enum.Enum):
     ERROR = "error"
 
 
+class JobStatus(str, enum.Enum):
+    """Background job status."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class UploadSessionStatus(str, enum.Enum):
+    """Resumable upload session status."""
+    ACTIVE = "active"
+    FINALIZED = "finalized"
+
+
+class AIBatchRequestStatus(str, enum.Enum):
+    """Status of a suggestion request sent through the OpenAI Batch API."""
+    PENDING = "pending"  # waiting to be submitted
+    SUBMITTED = "submitted"
+    DONE = "done"  # result stored
+    FAILED = "failed"  # no result from the batch; the resumed workflow calls the API directly
+
+
 class ApprovalStatus(str, enum.Enum):
     """Suggestion approval status."""
     PENDING = "pending"
@@ -44,6 +66,8 @@ class User(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
+    # Accounting firm the user belongs to (see AdmissionService.tenant_of); None = on their own
+    tenant = Column(String, index=True, nullable=True)
     hashed_password = Column(String, nullable=False)
     full_name = Column(String, nullable=False)
     role = Column(SQLEnum(UserRole), default=UserRole.ACCOUNTANT, nullable=False)
@@ -65,6 +89,11 @@ class Invoice(Base):
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
     mime_type = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of file contents; blobs are stored under this key
+    duplicate_of_id = Column(Integer, ForeignKey("invoices.id"), nullable=True)  # earlier invoice with the same content
+    ocr_text = Column(Text, nullable=True)
+    ocr_truncated = Column(Boolean, default=False, nullable=False)  # OCR stopped at the page cap or time budget; text is partial
+    batch_id = Column(Integer, ForeignKey("upload_batches.id"), nullable=True, index=True)
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=False)
     status = Column(SQLEnum(ProcessingStatus), default=ProcessingStatus.UPLOADED, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -74,6 +103,41 @@ class Invoice(Base):
     uploaded_by_user = relationship("User", back_populates="invoices")
     suggestions = relationship("Suggestion", back_populates="invoice", cascade="all, delete-orphan")
     audit_logs = relationship("AuditLog", back_populates="invoice")
+    
+    __table_args__ = (
+        # A user uploading the same document twice gets the existing invoice back
+        Index("uq_invoices_uploaded_by_content_hash", "uploaded_by", "content_hash", unique=True),
+    )
+
+
+class UploadBatch(Base):
+    """A bulk upload (zip archive or multi-file drop); its invoices reference it via batch_id."""
+    __tablename__ = "upload_batches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    total_files = Column(Integer, default=0, nullable=False)
+    duplicate_count = Column(Integer, default=0, nullable=False)
+    skipped_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class UploadSession(Base):
+    """Resumable (tus-style) upload in progress; received bytes live in storage under partials/<id>."""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String(36), primary_key=True)  # uuid4
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    mime_type = Column(String, nullable=False)
+    total_size = Column(Integer, nullable=False)
+    offset = Column(Integer, default=0, nullable=False)
+    status = Column(SQLEnum(UploadSessionStatus), default=UploadSessionStatus.ACTIVE, nullable=False)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=True)  # set on finalize
+    locked_at = Column(DateTime(timezone=True), nullable=True)  # set while a PATCH or finalize holds the session
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
 class Suggestion(Base):
@@ -90,6 +154,7 @@ class Suggestion(Base):
     approved_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     approved_at = Column(DateTime(timezone=True), nullable=True)
     notes = Column(Text, nullable=True)
+    ai_response = Column(Text, nullable=True)  # normalized AI result (JSON); reused for duplicate documents
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -117,3 +182,138 @@ class AuditLog(Base):
     # Relationships
     user = relationship("User", back_populates="audit_logs")
     invoice = relationship("Invoice", back_populates="audit_logs")
+
+
+class Job(Base):
+    """Durable background job, claimed and run by worker processes (see app/worker.py)."""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # e.g., "process_invoice"
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    status = Column(SQLEnum(JobStatus), default=JobStatus.QUEUED, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    run_after = Column(DateTime(timezone=True), nullable=False)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_user_id_status", "user_id", "status"),
+    )
+
+
+class OCRLayout(Base):
+    """Word-level OCR structure of an invoice (words, boxes, confidences, page sizes), see OCRService.pack_layout."""
+    __tablename__ = "ocr_layouts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), unique=True, nullable=False)
+    page_count = Column(Integer, nullable=False)
+    word_count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)  # zlib-compressed columnar JSON
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class OCRCacheEntry(Base):
+    """Cached OCR result for a document, keyed by content hash and OCR configuration (see ocr_cache_service)."""
+    __tablename__ = "ocr_cache_entries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+    content_hash = Column(String(64), index=True, nullable=False)
+    engine = Column(String, nullable=False)  # e.g., "tesserocr (tesseract 5.3.0) nor+eng"
+    pages = Column(Text, nullable=False)  # JSON list of page items
+    size_bytes = Column(Integer, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class OCRPageCacheEntry(Base):
+    """Cached OCR result for a single PDF page, keyed by rendered page hash and OCR configuration (see ocr_page_cache_service)."""
+    __tablename__ = "ocr_page_cache_entries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+    page_hash = Column(String(64), index=True, nullable=False)
+    data = Column(Text, nullable=False)  # JSON page item (text, confidence, dpi, layout)
+    size_bytes = Column(Integer, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class AIResponseCacheEntry(Base):
+    """Cached LLM answer, keyed by normalized OCR text, prompt version and model (see ai_cache_service)."""
+    __tablename__ = "ai_response_cache_entries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+    model = Column(String, nullable=False)
+    prompt_version = Column(String(16), nullable=False)
+    response = Column(Text, nullable=False)  # JSON of the normalized AI result
+    size_bytes = Column(Integer, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_used_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class AIBatch(Base):
+    """A JSONL batch of suggestion requests submitted to the OpenAI Batch API (see ai_batch_service)."""
+    __tablename__ = "ai_batches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    remote_id = Column(String, unique=True, nullable=True)  # OpenAI batch id, set once submitted
+    status = Column(String, nullable=False, index=True)  # "preparing" until submitted, then the OpenAI batch status
+    request_count = Column(Integer, default=0, nullable=False)
+    input_file_id = Column(String, nullable=True)
+    output_file_id = Column(String, nullable=True)
+    error_file_id = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    submitted_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class AIBatchRequest(Base):
+    """An invoice's deferred suggestion request; its workflow resumes once the batch has a result for it."""
+    __tablename__ = "ai_batch_requests"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    batch_id = Column(Integer, ForeignKey("ai_batches.id"), nullable=True, index=True)
+    status = Column(SQLEnum(AIBatchRequestStatus), default=AIBatchRequestStatus.PENDING, nullable=False, index=True)
+    ocr_text = Column(Text, nullable=False)  # text sent to the model
+    ai_response = Column(Text, nullable=True)  # normalized AI result (JSON)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class VendorMemoryEntry(Base):
+    """Approval/rejection counts of an account + VAT code booking for a vendor identifier, per tenant (see vendor_memory_service)."""
+    __tablename__ = "vendor_memory_entries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tenant = Column(String, nullable=False)  # users.tenant of the uploaders, or "user:<id>" without one
+    identifier_type = Column(String, nullable=False)  # "org_number", "iban", "bank_account" or "name"
+    identifier = Column(String, nullable=False)  # normalized, e.g. "987654321"
+    account_number = Column(String, nullable=False)
+    vat_code = Column(String, nullable=False, default="")  # "" when the suggestion had no VAT code
+    approved_count = Column(Integer, default=0, nullable=False)
+    rejected_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index(
+            "uq_vendor_memory_booking",
+            "tenant", "identifier_type", "identifier", "account_number", "vat_code",
+            unique=True,
+        ),
+    )
@@ -0,0 +1,91 @@
+"""
+In-place schema upgrade for existing databases.
+
+Tables are created with Base.metadata.create_all, which never alters a table that
+already exists. upgrade_schema() brings existing tables up to the models: it adds
+missing columns (ALTER TABLE ... ADD COLUMN, with the model's type, default and
+foreign key), fills columns that need data from existing rows, and creates missing
+indexes. Every step checks the live schema first, so it is safe to run on every
+start (PostgreSQL also gets IF NOT EXISTS, for API and worker starting together).
+
+Only additions are handled; renamed, dropped or retyped columns need a hand-written
+migration.
+"""
+from sqlalchemy import Column, inspect, literal, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.types import SchemaType
+from typing import Callable, Dict, List, Optional, Tuple
+from app.db.database import Base
+from app.db import models  # noqa: F401  (registers the tables on Base.metadata)
+
+
+def _backfill_user_tenants(conn: Connection) -> None:
+    from app.services.admission_service import admission_service
+
+    for user_id, email in conn.execute(text("SELECT id, email FROM users")).all():
+        conn.execute(
+            text("UPDATE users SET tenant = :tenant WHERE id = :id"),
+            {"tenant": admission_service.tenant_of(email), "id": user_id},
+        )
+
+
+# Data for columns added to tables that already have rows, run once when the column is added
+BACKFILLS: Dict[Tuple[str, str], Callable[[Connection], None]] = {
+    ("users", "tenant"): _backfill_user_tenants,
+}
+
+
+def _default_sql(column: Column, conn: Connection) -> Optional[str]:
+    """The column's default as SQL, for rows that exist when it is added."""
+    if column.server_default is not None:
+        arg = column.server_default.arg
+        return arg.text if isinstance(arg, TextClause) else str(arg.compile(dialect=conn.dialect))
+    if column.default is not None and column.default.is_scalar:
+        return str(literal(column.default.arg, column.type).compile(
+            dialect=conn.dialect, compile_kwargs={"literal_binds": True}
+        ))
+    return None
+
+
+def add_column_sql(column: Column, conn: Connection) -> str:
+    """ALTER TABLE statement adding a model column to its existing table."""
+    preparer = conn.dialect.identifier_preparer
+    parts = [preparer.format_column(column), column.type.compile(dialect=conn.dialect)]
+    default = _default_sql(column, conn)
+    if default is not None:
+        parts.append(f"DEFAULT {default}")
+    if not column.nullable:
+        if default is None:
+            raise RuntimeError(f"Cannot add NOT NULL column {column.table.name}.{column.name} without a default")
+        parts.append("NOT NULL")
+    for foreign_key in column.foreign_keys:
+        target = foreign_key.column
+        parts.append(f"REFERENCES {preparer.format_table(target.table)} ({preparer.format_column(target)})")
+    if_not_exists = "IF NOT EXISTS " if conn.dialect.name == "postgresql" else ""
+    return f"ALTER TABLE {preparer.format_table(column.table)} ADD COLUMN {if_not_exists}{' '.join(parts)}"
+
+
+def upgrade_schema(engine: Engine) -> List[str]:
+    """Add missing columns and indexes to existing tables. Returns the columns added ("table.column")."""
+    added = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if isinstance(column.type, SchemaType):
+                    column.type.create(conn, checkfirst=True)
+                conn.execute(text(add_column_sql(column, conn)))
+                backfill = BACKFILLS.get((table.name, column.name))
+                if backfill is not None:
+                    backfill(conn)
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return added
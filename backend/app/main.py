@@ -4,12 +4,16 @@ Main FastAPI application entry point.
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.middleware import UploadSizeLimitMiddleware
+from app.core.executors import shutdown_pools
 from app.api.v1 import api_router
 from app.db.database import engine
 from app.db import models
+from app.db.schema import upgrade_schema
 
-# Create database tables
+# Create database tables, then add columns and indexes that existing tables are missing
 models.Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
 
 app = FastAPI(
     title="Accounting Assistant API",
@@ -19,7 +23,19 @@ app = FastAPI(
     redoc_url="/api/redoc",
 )
 
-# CORS middleware
+# Reject oversized upload bodies while they stream in (before multipart parsing spools them)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=settings.MAX_UPLOAD_SIZE + settings.MULTIPART_OVERHEAD,
+    paths=("/api/v1/invoices/upload",),
+)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=settings.MAX_BULK_UPLOAD_SIZE,
+    paths=("/api/v1/invoices/bulk",),
+)
+
+# CORS middleware (added last so it wraps the others and their 413 responses get CORS headers)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -47,6 +63,12 @@ async def startup_warnings():
         print("WARNING: OPENAI_API_KEY not set. AI suggestions will fail until you set it in Railway Variables.")
 
 
+@app.on_event("shutdown")
+async def shutdown_executors():
+    """Stop the io/cpu executor pools (waits for running work)."""
+    shutdown_pools()
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
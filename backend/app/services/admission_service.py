@@ -0,0 +1,196 @@
+"""
+Admission control for the upload endpoints.
+
+Every accepted upload becomes a queued job, so the jobs table is the measure of load:
+a job is "in flight" from enqueue until it finishes. An invoice whose suggestion was
+deferred to the Batch API (see ai_batch_service) has no job while it waits for the
+batch, so its pending or submitted AIBatchRequest counts as in flight instead; the
+resume job takes over once the batch has a result. New uploads are refused with
+429 + Retry-After when
+
+- the global queue depth is at ADMISSION_MAX_QUEUE_DEPTH, or
+- the uploading user, or their tenant (accounting firm), would exceed its in-flight limit.
+
+The upload endpoints check before storing anything (check()), then again under the
+tenant's admission lock while inserting the jobs (admitting()), so concurrent uploads
+of one tenant cannot together exceed the user and tenant limits. The lock is a
+transaction-scoped advisory lock on PostgreSQL and a process-local lock elsewhere
+(SQLite, single API process). The global queue depth is not serialized across tenants
+and may be exceeded by the number of uploads admitted at the same moment.
+
+A user's tenant is their email domain, stored in the indexed users.tenant column when
+the user is created. Users of public mail providers (gmail.com, outlook.com, ...) have
+no tenant: they are not one firm, so only the per-user limit applies to them.
+
+A limit of 0 disables that check.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterator, Optional
+import threading
+from app.db import models
+from app.core.config import settings
+from app.services.job_queue import job_queue
+
+IN_FLIGHT_STATUSES = (models.JobStatus.QUEUED, models.JobStatus.RUNNING)
+BATCH_IN_FLIGHT_STATUSES = (models.AIBatchRequestStatus.PENDING, models.AIBatchRequestStatus.SUBMITTED)
+# Rows counted as in-flight work, with their in-flight statuses (both have user_id)
+IN_FLIGHT = ((models.Job, IN_FLIGHT_STATUSES), (models.AIBatchRequest, BATCH_IN_FLIGHT_STATUSES))
+# First key of the PostgreSQL advisory locks taken by admitting() (the second is the tenant's hash)
+ADVISORY_LOCK_NAMESPACE = 0x41444D  # "ADM"
+# Email domains shared by unrelated people; never used as a tenant
+PUBLIC_MAIL_DOMAINS = frozenset({
+    "gmail.com", "googlemail.com", "outlook.com", "hotmail.com", "hotmail.no", "live.com", "live.no",
+    "msn.com", "icloud.com", "me.com", "mac.com", "yahoo.com", "yahoo.no", "aol.com", "proton.me",
+    "protonmail.com", "gmx.com", "gmx.net", "mail.com", "online.no", "start.no", "broadpark.no",
+})
+
+
+class AdmissionRejected(Exception):
+    """Raised when an upload must be refused; carries the reason and a Retry-After hint."""
+
+    def __init__(self, reason: str, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionService:
+    """Service for admitting or refusing new work based on current load."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._admission_lock = threading.Lock()  # admitting() on databases without advisory locks
+        self.admitted = 0
+        self.rejected: Counter = Counter()
+
+    @staticmethod
+    def tenant_of(email: str) -> Optional[str]:
+        """Tenant for a new user's email: the domain, or None for public mail providers."""
+        domain = email.rsplit("@", 1)[-1].strip().lower()
+        return None if domain in PUBLIC_MAIL_DOMAINS else domain
+
+    @staticmethod
+    def user_in_flight(db: Session, user_id: int) -> int:
+        return sum(
+            db.query(func.count(model.id)).filter(model.status.in_(statuses), model.user_id == user_id).scalar()
+            for model, statuses in IN_FLIGHT
+        )
+
+    @staticmethod
+    def tenant_in_flight(db: Session, tenant: str) -> int:
+        return sum(
+            db.query(func.count(model.id)).join(
+                models.User, models.User.id == model.user_id
+            ).filter(model.status.in_(statuses), models.User.tenant == tenant).scalar()
+            for model, statuses in IN_FLIGHT
+        )
+
+    def check(self, db: Session, user: models.User, new_jobs: int = 1, count_admitted: bool = True) -> None:
+        """Admit new_jobs more jobs for user, or raise AdmissionRejected. count_admitted=False for a pre-check before admitting()."""
+        try:
+            max_depth = settings.ADMISSION_MAX_QUEUE_DEPTH
+            if max_depth and job_queue.depth(db) >= max_depth:
+                raise AdmissionRejected(
+                    "queue_full",
+                    "Processing queue is full, please retry later",
+                    settings.ADMISSION_RETRY_AFTER_SECONDS,
+                )
+
+            user_limit = settings.ADMISSION_MAX_IN_FLIGHT_PER_USER
+            if user_limit:
+                in_flight = self.user_in_flight(db, user.id)
+                if in_flight + new_jobs > user_limit:
+                    raise AdmissionRejected(
+                        "user_limit",
+                        f"Too many documents in processing ({in_flight}, limit {user_limit}), please retry later",
+                        settings.ADMISSION_RETRY_AFTER_SECONDS,
+                    )
+
+            tenant_limit = settings.ADMISSION_MAX_IN_FLIGHT_PER_TENANT
+            if tenant_limit and user.tenant:
+                in_flight = self.tenant_in_flight(db, user.tenant)
+                if in_flight + new_jobs > tenant_limit:
+                    raise AdmissionRejected(
+                        "tenant_limit",
+                        f"Too many documents in processing for your organization ({in_flight}, limit {tenant_limit}), please retry later",
+                        settings.ADMISSION_RETRY_AFTER_SECONDS,
+                    )
+        except AdmissionRejected as e:
+            with self._lock:
+                self.rejected[e.reason] += 1
+            raise
+        if count_admitted:
+            with self._lock:
+                self.admitted += 1
+
+    @contextmanager
+    def admitting(self, db: Session, user: models.User, new_jobs: int = 1) -> Iterator[None]:
+        """
+        check() under the user's tenant admission lock, held until the caller has committed its new jobs.
+
+        Use as `with admission_service.admitting(db, user, n): ...add the jobs...; db.commit()`.
+        On PostgreSQL the lock is a transaction-scoped advisory lock per tenant (per user without
+        one), released by the caller's commit; the session is rolled back if the block raises.
+        """
+        try:
+            if db.bind.dialect.name == "postgresql":
+                db.execute(
+                    text("SELECT pg_advisory_xact_lock(:namespace, hashtext(:key))"),
+                    {"namespace": ADVISORY_LOCK_NAMESPACE, "key": user.tenant or f"user:{user.id}"},
+                )
+                self.check(db, user, new_jobs)
+                yield
+            else:
+                with self._admission_lock:
+                    self.check(db, user, new_jobs)
+                    yield
+        except BaseException:
+            db.rollback()
+            raise
+
+    def levels(self, db: Session, top: int = 10) -> Dict[str, Any]:
+        """Current load vs limits, the busiest users/tenants, and admission counters (this process)."""
+        per_user: Counter = Counter()
+        for model, statuses in IN_FLIGHT:
+            rows = db.query(
+                models.User.id, models.User.email, models.User.tenant, func.count(model.id)
+            ).join(
+                model, model.user_id == models.User.id
+            ).filter(
+                model.status.in_(statuses)
+            ).group_by(models.User.id, models.User.email, models.User.tenant).all()
+            for user_id, email, tenant, count in rows:
+                per_user[(user_id, email, tenant)] += count
+
+        per_tenant: Counter = Counter()
+        for (_, _, tenant), count in per_user.items():
+            if tenant:
+                per_tenant[tenant] += count
+
+        with self._lock:
+            counters = {"admitted": self.admitted, "rejected": dict(self.rejected)}
+        return {
+            "limits": {
+                "max_queue_depth": settings.ADMISSION_MAX_QUEUE_DEPTH,
+                "max_in_flight_per_user": settings.ADMISSION_MAX_IN_FLIGHT_PER_USER,
+                "max_in_flight_per_tenant": settings.ADMISSION_MAX_IN_FLIGHT_PER_TENANT,
+                "retry_after_seconds": settings.ADMISSION_RETRY_AFTER_SECONDS,
+            },
+            "queue_depth": job_queue.depth(db),
+            "in_flight": sum(per_user.values()),
+            "users": [
+                {"user_id": user_id, "email": email, "tenant": tenant, "in_flight": count}
+                for (user_id, email, tenant), count in per_user.most_common(top)
+            ],
+            "tenants": [
+                {"tenant": tenant, "in_flight": count} for tenant, count in per_tenant.most_common(top)
+            ],
+            **counters,
+        }
+
+
+admission_service = AdmissionService()
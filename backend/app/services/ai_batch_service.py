@@ -0,0 +1,375 @@
+"""
+OpenAI Batch API mode for non-urgent suggestion requests.
+
+With AI_BATCH_MODE set, the invoice workflow stops after the ai_suggestion step
+and leaves an AIBatchRequest behind (the invoice stays in AI_PROCESSING). The
+worker then periodically (AI_BATCH_POLL_INTERVAL_SECONDS) runs run_once:
+
+1. submit_pending: collects pending requests into a JSONL file of chat completion
+   requests (AIService.build_request, so the answers match the interactive path),
+   uploads it and creates a batch. A batch is submitted once it is full
+   (AI_BATCH_MAX_REQUESTS) or its oldest request waited AI_BATCH_MAX_WAIT_SECONDS.
+2. poll: checks submitted batches; when one ends, stores each request's parsed
+   result and enqueues a "resume_invoice" job, which runs the rest of the workflow
+   (rules → save) with that result.
+
+All state lives in the ai_batches / ai_batch_requests tables, so batches survive
+worker restarts and any worker may submit or poll them; requests and finished
+batches are claimed with conditional UPDATEs so two workers never handle the same
+one. Requests without a result (failed lines, expired, cancelled or vanished
+batches) are marked FAILED and their workflow falls back to a direct API call.
+
+Submission is recoverable: the input file id is committed before the batch is
+created, and the batch carries metadata.ai_batch_id. If creating the batch fails
+or its worker dies before storing the remote id, the remote batches are searched
+for that metadata before the requests are released; a batch OpenAI did create is
+adopted instead of being submitted (and billed) a second time.
+
+openai 1.12 has no batches resource, so batches are created and retrieved through
+the client's generic request methods; files go through client.files. Point
+OPENAI_BASE_URL at scripts/openai_batch_stub.py to run the whole cycle locally.
+"""
+from openai import NotFoundError
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+import json
+import logging
+from app.db import models
+from app.core.config import settings
+from app.services.ai_service import AIService, get_client
+from app.services.job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+PREPARING = "preparing"
+# A batch still preparing after this long belongs to a worker that died mid-upload
+PREPARING_STALE_AFTER = timedelta(hours=1)
+# Remote batches are listed newest first; stop searching at ones this much older than ours (clock skew)
+REMOTE_SEARCH_MARGIN = timedelta(hours=1)
+
+
+class AIBatchService:
+    """Service for deferring suggestion requests to the OpenAI Batch API and collecting the results."""
+
+    @staticmethod
+    def use_batch_api(invoice: models.Invoice) -> bool:
+        """True if the invoice's suggestion should go through the Batch API (AI_BATCH_MODE)."""
+        if settings.AI_BATCH_MODE == "all":
+            return True
+        return settings.AI_BATCH_MODE == "bulk" and invoice.batch_id is not None
+
+    @staticmethod
+    def defer(db: Session, invoice_id: int, user_id: Optional[int], ocr_text: str) -> models.AIBatchRequest:
+        """Queue the invoice's suggestion request for the next batch."""
+        request = models.AIBatchRequest(
+            invoice_id=invoice_id,
+            user_id=user_id,
+            status=models.AIBatchRequestStatus.PENDING,
+            ocr_text=ocr_text,
+        )
+        db.add(request)
+        db.commit()
+        db.refresh(request)
+        return request
+
+    @staticmethod
+    def get_request(db: Session, invoice_id: int) -> Optional[models.AIBatchRequest]:
+        """The invoice's latest batch request."""
+        return db.query(models.AIBatchRequest).filter(
+            models.AIBatchRequest.invoice_id == invoice_id
+        ).order_by(models.AIBatchRequest.id.desc()).first()
+
+    @staticmethod
+    def custom_id(request_id: int) -> str:
+        return f"req-{request_id}"
+
+    @staticmethod
+    def build_jsonl(requests: List[models.AIBatchRequest]) -> bytes:
+        """Batch input file: one chat completion request per line."""
+        lines = [
+            json.dumps({
+                "custom_id": AIBatchService.custom_id(request.id),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": AIService.build_request(request.ocr_text),
+            }, ensure_ascii=False)
+            for request in requests
+        ]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    @staticmethod
+    def _due(db: Session) -> bool:
+        """True if the pending requests should be submitted now (full batch or oldest waited long enough)."""
+        pending = db.query(
+            func.count(models.AIBatchRequest.id), func.min(models.AIBatchRequest.created_at)
+        ).filter(
+            models.AIBatchRequest.status == models.AIBatchRequestStatus.PENDING,
+            models.AIBatchRequest.batch_id.is_(None),
+        ).one()
+        count, oldest = pending
+        if not count:
+            return False
+        if count >= settings.AI_BATCH_MAX_REQUESTS:
+            return True
+        return oldest.replace(tzinfo=None) <= datetime.utcnow() - timedelta(seconds=settings.AI_BATCH_MAX_WAIT_SECONDS)
+
+    @staticmethod
+    def _release(db: Session, batch: models.AIBatch) -> None:
+        """Return a batch's requests to the pending pool (submission failed or was abandoned)."""
+        db.query(models.AIBatchRequest).filter(
+            models.AIBatchRequest.batch_id == batch.id,
+            models.AIBatchRequest.status == models.AIBatchRequestStatus.SUBMITTED,
+        ).update(
+            {
+                models.AIBatchRequest.batch_id: None,
+                models.AIBatchRequest.status: models.AIBatchRequestStatus.PENDING,
+            },
+            synchronize_session=False
+        )
+        batch.status = "failed"
+        db.commit()
+
+    @staticmethod
+    def _find_remote(batch: models.AIBatch) -> Optional[Dict[str, Any]]:
+        """The remote batch created for this AIBatch (metadata.ai_batch_id), or None if it was never created."""
+        client = get_client()
+        oldest = (batch.created_at.replace(tzinfo=None) - REMOTE_SEARCH_MARGIN - datetime(1970, 1, 1)).total_seconds()
+        params: Dict[str, Any] = {"limit": 100}
+        while True:
+            page = client.get("/batches", cast_to=object, options={"params": params})
+            for remote in page.get("data", []):
+                if (remote.get("metadata") or {}).get("ai_batch_id") == str(batch.id):
+                    return remote
+                if remote.get("created_at", 0) < oldest:
+                    return None
+            if not page.get("has_more") or not page.get("data"):
+                return None
+            params["after"] = page["data"][-1]["id"]
+
+    @staticmethod
+    def _adopt(db: Session, batch: models.AIBatch, remote: Dict[str, Any]) -> None:
+        """Record a remote batch created for this AIBatch whose creation was not stored."""
+        batch.remote_id = remote["id"]
+        batch.status = remote.get("status", "validating")
+        batch.request_count = db.query(func.count(models.AIBatchRequest.id)).filter(
+            models.AIBatchRequest.batch_id == batch.id
+        ).scalar()
+        batch.submitted_at = datetime.utcnow()
+        db.commit()
+
+    @staticmethod
+    def _recover(db: Session, batch: models.AIBatch) -> None:
+        """
+        Settle a batch whose submission did not complete: adopt the remote batch if it was
+        created after all, else release its requests. Raises (batch left preparing) if the
+        remote batches cannot be listed.
+        """
+        if batch.input_file_id:
+            remote = AIBatchService._find_remote(batch)
+            if remote is not None:
+                AIBatchService._adopt(db, batch, remote)
+                return
+        AIBatchService._release(db, batch)
+
+    @staticmethod
+    def _submit(db: Session) -> Optional[models.AIBatch]:
+        """Claim up to AI_BATCH_MAX_REQUESTS pending requests into a new batch and submit it."""
+        batch = models.AIBatch(status=PREPARING, request_count=0)
+        db.add(batch)
+        db.commit()
+
+        ids = [
+            request_id for (request_id,) in db.query(models.AIBatchRequest.id).filter(
+                models.AIBatchRequest.status == models.AIBatchRequestStatus.PENDING,
+                models.AIBatchRequest.batch_id.is_(None),
+            ).order_by(models.AIBatchRequest.id).limit(settings.AI_BATCH_MAX_REQUESTS)
+        ]
+        # Conditional update: requests claimed by another worker in between are skipped
+        db.query(models.AIBatchRequest).filter(
+            models.AIBatchRequest.id.in_(ids),
+            models.AIBatchRequest.batch_id.is_(None),
+        ).update(
+            {
+                models.AIBatchRequest.batch_id: batch.id,
+                models.AIBatchRequest.status: models.AIBatchRequestStatus.SUBMITTED,
+            },
+            synchronize_session=False
+        )
+        db.commit()
+        requests = db.query(models.AIBatchRequest).filter(
+            models.AIBatchRequest.batch_id == batch.id
+        ).order_by(models.AIBatchRequest.id).all()
+        if not requests:
+            db.delete(batch)
+            db.commit()
+            return None
+
+        try:
+            client = get_client()
+            input_file = client.files.create(
+                file=(f"ai_batch_{batch.id}.jsonl", AIBatchService.build_jsonl(requests)),
+                purpose="batch",
+            )
+            # Stored first: a batch may exist remotely from here on, and _recover looks for it
+            batch.input_file_id = input_file.id
+            db.commit()
+            remote = client.post(
+                "/batches",
+                cast_to=object,
+                body={
+                    "input_file_id": input_file.id,
+                    "endpoint": "/v1/chat/completions",
+                    "completion_window": settings.AI_BATCH_COMPLETION_WINDOW,
+                    "metadata": {"ai_batch_id": str(batch.id)},
+                },
+            )
+        except Exception:
+            try:
+                AIBatchService._recover(db, batch)
+            except Exception:
+                # Remote state unknown; the batch stays preparing and is recovered once stale
+                db.rollback()
+            raise
+
+        batch.remote_id = remote["id"]
+        batch.status = remote.get("status", "validating")
+        batch.request_count = len(requests)
+        batch.submitted_at = datetime.utcnow()
+        db.commit()
+        return batch
+
+    @staticmethod
+    def submit_pending(db: Session) -> List[models.AIBatch]:
+        """Submit batches while pending requests are due; also recovers batches abandoned mid-submission."""
+        for batch in db.query(models.AIBatch).filter(
+            models.AIBatch.status == PREPARING,
+            models.AIBatch.remote_id.is_(None),
+            models.AIBatch.created_at <= datetime.utcnow() - PREPARING_STALE_AFTER,
+        ).all():
+            try:
+                AIBatchService._recover(db, batch)
+            except Exception:
+                logger.exception("Recovering AI batch %s failed", batch.id)
+                db.rollback()
+
+        submitted = []
+        while AIBatchService._due(db):
+            batch = AIBatchService._submit(db)
+            if batch is None:
+                break
+            submitted.append(batch)
+        return submitted
+
+    @staticmethod
+    def _read_results(file_id: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        """Lines of a batch output or error file by custom_id."""
+        if not file_id:
+            return {}
+        content = get_client().files.content(file_id).text
+        results = {}
+        for line in content.splitlines():
+            if line.strip():
+                item = json.loads(line)
+                results[item["custom_id"]] = item
+        return results
+
+    @staticmethod
+    def _parse_line(item: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """{"result": normalized AI result} or {"error": message} for one output line."""
+        if item is None:
+            return {"error": "No result in batch output"}
+        if item.get("error"):
+            return {"error": json.dumps(item["error"])}
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            return {"error": f"HTTP {response.get('status_code')}: {json.dumps(response.get('body'))}"}
+        try:
+            content = response["body"]["choices"][0]["message"]["content"]
+            return {"result": AIService.parse_response(content)}
+        except Exception as e:
+            return {"error": f"Unparseable response: {e}"}
+
+    @staticmethod
+    def _finish(db: Session, batch: models.AIBatch, remote: Dict[str, Any]) -> bool:
+        """Store results of an ended batch and enqueue resume jobs. False if another worker finished it first."""
+        results = AIBatchService._read_results(remote.get("output_file_id"))
+        results.update(AIBatchService._read_results(remote.get("error_file_id")))
+        now = datetime.utcnow()
+
+        # Claim the batch in the same transaction as its results
+        claimed = db.query(models.AIBatch).filter(
+            models.AIBatch.id == batch.id,
+            models.AIBatch.completed_at.is_(None),
+        ).update(
+            {
+                models.AIBatch.status: remote["status"],
+                models.AIBatch.output_file_id: remote.get("output_file_id"),
+                models.AIBatch.error_file_id: remote.get("error_file_id"),
+                models.AIBatch.completed_at: now,
+            },
+            synchronize_session=False
+        )
+        if not claimed:
+            db.rollback()
+            return False
+
+        requests = db.query(models.AIBatchRequest).filter(
+            models.AIBatchRequest.batch_id == batch.id,
+            models.AIBatchRequest.status == models.AIBatchRequestStatus.SUBMITTED,
+        ).all()
+        for request in requests:
+            parsed = AIBatchService._parse_line(results.get(AIBatchService.custom_id(request.id)))
+            if "result" in parsed:
+                request.status = models.AIBatchRequestStatus.DONE
+                request.ai_response = json.dumps(parsed["result"], ensure_ascii=False)
+            else:
+                request.status = models.AIBatchRequestStatus.FAILED
+                request.error = parsed["error"]
+            request.completed_at = now
+            job_queue.enqueue(db, "resume_invoice", invoice_id=request.invoice_id, user_id=request.user_id, commit=False)
+        db.commit()
+        return True
+
+    @staticmethod
+    def poll(db: Session) -> int:
+        """
+        Check submitted batches; store results of ended ones. Returns the number of batches finished.
+
+        An error on one batch does not stop the others; a batch OpenAI no longer knows (404)
+        ends as failed, so its requests fall back to direct calls.
+        """
+        finished = 0
+        batches = db.query(models.AIBatch).filter(
+            models.AIBatch.status.in_(ACTIVE_STATUSES),
+            models.AIBatch.completed_at.is_(None),
+        ).all()
+        for batch in batches:
+            try:
+                try:
+                    remote = get_client().get(f"/batches/{batch.remote_id}", cast_to=object)
+                except NotFoundError:
+                    remote = {"status": "failed"}
+                if remote["status"] in ACTIVE_STATUSES:
+                    if remote["status"] != batch.status:
+                        batch.status = remote["status"]
+                        db.commit()
+                    continue
+                if AIBatchService._finish(db, batch, remote):
+                    finished += 1
+            except Exception:
+                logger.exception("Polling AI batch %s (%s) failed", batch.id, batch.remote_id)
+                db.rollback()
+        return finished
+
+    @staticmethod
+    def run_once(db: Session) -> Dict[str, int]:
+        """One submit + poll round (the worker calls this every AI_BATCH_POLL_INTERVAL_SECONDS)."""
+        submitted = AIBatchService.submit_pending(db)
+        finished = AIBatchService.poll(db)
+        return {"submitted": len(submitted), "finished": finished}
+
+
+ai_batch_service = AIBatchService()
@@ -0,0 +1,91 @@
+"""
+Cache of LLM suggestion responses.
+
+Re-uploads, rescans and recurring invoices from the same supplier often OCR to
+the same text. The answer is keyed by a hash of the whitespace-normalized OCR
+text, the prompt version (AIService.prompt_version) and the model, so changing
+the prompt or switching models never serves a stale answer. Entries older than
+AI_CACHE_TTL_HOURS are not used; expired and least recently used entries are
+evicted periodically by the worker once the table exceeds AI_CACHE_MAX_BYTES.
+"""
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+import hashlib
+import json
+from app.db import models
+from app.core.config import settings
+from app.services.ai_service import AIService
+from app.services.cache_eviction import evict_lru
+
+
+class AICacheService:
+    """Service for looking up and storing LLM responses by OCR text."""
+
+    @staticmethod
+    def cache_key(ocr_text: str) -> str:
+        """Cache key for the OCR text under the current prompt version and model."""
+        text_hash = hashlib.sha256(AIService.normalize_text(ocr_text).encode("utf-8")).hexdigest()
+        return hashlib.sha256(
+            f"{text_hash}:{AIService.prompt_version()}:{AIService.MODEL}".encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def _cutoff() -> datetime:
+        return datetime.utcnow() - timedelta(hours=settings.AI_CACHE_TTL_HOURS)
+
+    @staticmethod
+    def get(db: Session, ocr_text: str) -> Optional[models.AIResponseCacheEntry]:
+        """Unexpired cache entry for the OCR text (hit count and last use updated), or None."""
+        entry = db.query(models.AIResponseCacheEntry).filter(
+            models.AIResponseCacheEntry.cache_key == AICacheService.cache_key(ocr_text)
+        ).first()
+        if entry is None:
+            return None
+        if entry.created_at.replace(tzinfo=None) < AICacheService._cutoff():
+            db.delete(entry)
+            db.commit()
+            return None
+        entry.hit_count += 1
+        entry.last_used_at = datetime.utcnow()
+        db.commit()
+        return entry
+
+    @staticmethod
+    def get_result(entry: models.AIResponseCacheEntry) -> Dict[str, Any]:
+        """Decode the AI result stored in a cache entry."""
+        return json.loads(entry.response)
+
+    @staticmethod
+    def put(db: Session, ocr_text: str, result: Dict[str, Any]) -> None:
+        """Store the AI result for the OCR text."""
+        response = json.dumps(result, ensure_ascii=False)
+        now = datetime.utcnow()
+        db.add(models.AIResponseCacheEntry(
+            cache_key=AICacheService.cache_key(ocr_text),
+            model=AIService.MODEL,
+            prompt_version=AIService.prompt_version(),
+            response=response,
+            size_bytes=len(response.encode("utf-8")),
+            hit_count=0,
+            created_at=now,
+            last_used_at=now,
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker cached the same text concurrently
+            db.rollback()
+
+    @staticmethod
+    def evict(db: Session) -> int:
+        """Delete expired entries, then least recently used ones until the cache fits AI_CACHE_MAX_BYTES. Returns entries deleted."""
+        deleted = db.query(models.AIResponseCacheEntry).filter(
+            models.AIResponseCacheEntry.created_at < AICacheService._cutoff()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted + evict_lru(db, models.AIResponseCacheEntry, settings.AI_CACHE_MAX_BYTES)
+
+
+ai_cache_service = AICacheService()
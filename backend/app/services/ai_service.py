@@ -1,12 +1,70 @@
 """
 AI service for generating accounting suggestions using LLM.
+
+Two paths to the same request and response handling:
+
+- generate_suggestion: synchronous OpenAI client, blocks the calling thread.
+- generate_suggestion_async: AsyncOpenAI on a pooled httpx client (AI_MAX_CONNECTIONS,
+  keep-alive), for workflow steps running on an event loop (the worker). A semaphore
+  caps in-flight calls at AI_MAX_CONCURRENT_REQUESTS, so one worker process can keep
+  dozens of LLM requests in flight without a thread per request.
+
+Clients are created on first use. The async client and semaphore are per event loop
+(httpx connections belong to the loop they were opened on); the worker runs one loop.
 """
-from openai import OpenAI
-from typing import Dict, Optional
+from openai import AsyncOpenAI, OpenAI
+from typing import Any, Dict, Optional, Tuple
+from functools import lru_cache
 from app.core.config import settings
+import asyncio
+import hashlib
+import httpx
 import json
+import threading
+import weakref
+
+_client: Optional[OpenAI] = None
+_client_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[AsyncOpenAI, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_client() -> OpenAI:
+    """The synchronous OpenAI client of this process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
+        return _client
+
+
+def get_async_client() -> Tuple[AsyncOpenAI, asyncio.Semaphore]:
+    """The AsyncOpenAI client and in-flight semaphore of the running event loop."""
+    loop = asyncio.get_running_loop()
+    state = _async_clients.get(loop)
+    if state is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.AI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AI_MAX_CONNECTIONS,
+                keepalive_expiry=settings.AI_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(settings.AI_REQUEST_TIMEOUT_SECONDS, connect=10.0),
+        )
+        state = (
+            AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None, http_client=http_client),
+            asyncio.Semaphore(max(1, settings.AI_MAX_CONCURRENT_REQUESTS)),
+        )
+        _async_clients[loop] = state
+    return state
+
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+async def close_async_client() -> None:
+    """Close the running event loop's async client (its pooled connections)."""
+    state = _async_clients.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state[0].close()
 
 
 class AIService:
@@ -37,37 +95,71 @@ Flag high risk if:
 - Amounts are unusually large
 - Missing critical information"""
 
+    MODEL = "gpt-4o-mini"
+
     @staticmethod
-    def generate_suggestion(ocr_text: str) -> Dict:
-        """Generate accounting suggestion from OCR text."""
-        try:
-            user_prompt = f"""Analyze this invoice document and provide accounting suggestions:
+    def build_user_prompt(ocr_text: str) -> str:
+        return f"""Analyze this invoice document and provide accounting suggestions:
 
 {ocr_text}
 
 Provide your analysis in the required JSON format."""
-            
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": AIService.SYSTEM_PROMPT},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content
-            result = json.loads(content)
-            
-            # Validate and normalize response
-            return {
-                "account_number": result.get("account_number"),
-                "vat_code": result.get("vat_code"),
-                "confidence": float(result.get("confidence", 0.0)),
-                "risk_level": result.get("risk_level", "medium").lower(),
-                "reasoning": result.get("reasoning", "")
-            }
+
+    @staticmethod
+    def build_request(ocr_text: str) -> Dict[str, Any]:
+        """Chat completion parameters for an invoice's OCR text."""
+        return {
+            "model": AIService.MODEL,
+            "messages": [
+                {"role": "system", "content": AIService.SYSTEM_PROMPT},
+                {"role": "user", "content": AIService.build_user_prompt(ocr_text)},
+            ],
+            "temperature": 0.3,
+            "response_format": {"type": "json_object"},
+        }
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def prompt_version() -> str:
+        """Short hash of everything in a request besides the OCR text and model (system prompt, user prompt template, parameters)."""
+        template = AIService.build_request("{ocr_text}")
+        del template["model"]
+        return hashlib.sha256(json.dumps(template, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def normalize_text(ocr_text: str) -> str:
+        """OCR text with whitespace collapsed (line breaks and spacing vary between OCR runs of the same document)."""
+        return " ".join(ocr_text.split())
+
+    @staticmethod
+    def parse_response(content: str) -> Dict:
+        """Validate and normalize the model's JSON answer."""
+        result = json.loads(content)
+        return {
+            "account_number": result.get("account_number"),
+            "vat_code": result.get("vat_code"),
+            "confidence": float(result.get("confidence", 0.0)),
+            "risk_level": result.get("risk_level", "medium").lower(),
+            "reasoning": result.get("reasoning", "")
+        }
+
+    @staticmethod
+    def generate_suggestion(ocr_text: str) -> Dict:
+        """Generate accounting suggestion from OCR text (blocks the calling thread)."""
+        try:
+            response = get_client().chat.completions.create(**AIService.build_request(ocr_text))
+            return AIService.parse_response(response.choices[0].message.content)
+        except Exception as e:
+            raise Exception(f"AI suggestion generation failed: {str(e)}")
+
+    @staticmethod
+    async def generate_suggestion_async(ocr_text: str) -> Dict:
+        """Generate accounting suggestion from OCR text on the running event loop (at most AI_MAX_CONCURRENT_REQUESTS at once)."""
+        client, in_flight = get_async_client()
+        try:
+            async with in_flight:
+                response = await client.chat.completions.create(**AIService.build_request(ocr_text))
+            return AIService.parse_response(response.choices[0].message.content)
         except Exception as e:
             raise Exception(f"AI suggestion generation failed: {str(e)}")
     
@@ -76,11 +168,7 @@ Provide your analysis in the required JSON format."""
         """Get the full prompt used for AI processing (for audit logging)."""
         return f"""System: {AIService.SYSTEM_PROMPT}
 
-User: Analyze this invoice document and provide accounting suggestions:
-
-{ocr_text}
-
-Provide your analysis in the required JSON format."""
+User: {AIService.build_user_prompt(ocr_text)}"""
 
 
 ai_service = AIService()
@@ -1,8 +1,9 @@
 """
 Audit logging service for compliance and audit trails.
 """
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from app.db import models
 from datetime import datetime
 import json
@@ -22,9 +23,10 @@ class AuditService:
         ai_response: Optional[str] = None,
         metadata: Optional[Dict[str, Any]] = None,
         ip_address: Optional[str] = None,
-        user_agent: Optional[str] = None
+        user_agent: Optional[str] = None,
+        commit: bool = True
     ) -> models.AuditLog:
-        """Create an immutable audit log entry."""
+        """Create an immutable audit log entry. With commit=False the caller commits (same transaction as its own rows)."""
         audit_log = models.AuditLog(
             user_id=user_id,
             invoice_id=invoice_id,
@@ -39,11 +41,45 @@ class AuditService:
         )
         
         db.add(audit_log)
-        db.commit()
-        db.refresh(audit_log)
+        if commit:
+            db.commit()
+            db.refresh(audit_log)
         
         return audit_log
     
+    @staticmethod
+    def log_actions_bulk(
+        db: Session,
+        entries: List[Dict[str, Any]],
+        commit: bool = True
+    ) -> None:
+        """
+        Create many audit log entries in one batched INSERT (e.g. bulk uploads).
+        
+        Each entry takes the same keyword arguments as log_action (except db).
+        """
+        if not entries:
+            return
+        now = datetime.utcnow()
+        rows = []
+        for entry in entries:
+            metadata = entry.get("metadata")
+            rows.append({
+                "user_id": entry.get("user_id"),
+                "invoice_id": entry.get("invoice_id"),
+                "action": entry["action"],
+                "raw_ocr_output": entry.get("raw_ocr_output"),
+                "ai_prompt": entry.get("ai_prompt"),
+                "ai_response": entry.get("ai_response"),
+                "extra_data": json.dumps(metadata) if metadata else None,
+                "ip_address": entry.get("ip_address"),
+                "user_agent": entry.get("user_agent"),
+                "created_at": now,
+            })
+        db.execute(insert(models.AuditLog), rows)
+        if commit:
+            db.commit()
+    
     @staticmethod
     def log_upload(
         db: Session,
@@ -52,31 +88,39 @@ class AuditService:
         filename: str,
         file_size: int,
         ip_address: Optional[str] = None,
-        user_agent: Optional[str] = None
+        user_agent: Optional[str] = None,
+        sha256: Optional[str] = None,
+        commit: bool = True
     ):
         """Log invoice upload."""
+        metadata = {"filename": filename, "file_size": file_size}
+        if sha256:
+            metadata["sha256"] = sha256
         return AuditService.log_action(
             db=db,
             action="upload",
             user_id=user_id,
             invoice_id=invoice_id,
-            metadata={"filename": filename, "file_size": file_size},
+            metadata=metadata,
             ip_address=ip_address,
-            user_agent=user_agent
+            user_agent=user_agent,
+            commit=commit
         )
     
     @staticmethod
     def log_ocr_complete(
         db: Session,
         invoice_id: int,
-        ocr_output: str
+        ocr_output: str,
+        metadata: Optional[Dict[str, Any]] = None
     ):
         """Log OCR completion."""
         return AuditService.log_action(
             db=db,
             action="ocr_complete",
             invoice_id=invoice_id,
-            raw_ocr_output=ocr_output
+            raw_ocr_output=ocr_output,
+            metadata=metadata
         )
     
     @staticmethod
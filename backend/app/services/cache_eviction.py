@@ -0,0 +1,32 @@
+"""
+Least-recently-used eviction for the persistent caches (OCR documents, OCR pages,
+AI answers).
+
+Eviction sums the whole cache table, so it is not run after every write: the worker
+calls each cache's evict() every CACHE_EVICT_INTERVAL_SECONDS (see app/worker.py).
+Between runs a cache can exceed its limit by what was written in the interval.
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Any
+
+
+def evict_lru(db: Session, model: Any, max_bytes: int) -> int:
+    """
+    Delete least recently used rows of a cache table until their size_bytes total fits max_bytes.
+
+    model needs id, size_bytes and last_used_at columns. Returns the number of rows deleted.
+    """
+    total = db.query(func.coalesce(func.sum(model.size_bytes), 0)).scalar()
+    excess = total - max_bytes
+    if excess <= 0:
+        return 0
+    ids = []
+    for entry_id, size_bytes in db.query(model.id, model.size_bytes).order_by(model.last_used_at.asc()).yield_per(500):
+        ids.append(entry_id)
+        excess -= size_bytes
+        if excess <= 0:
+            break
+    db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+    return len(ids)
@@ -0,0 +1,50 @@
+"""
+Image normalization for uploaded photos/scans before OCR.
+
+Phone photos arrive as large color JPEGs; Tesseract only needs a grayscale image at
+roughly 300 DPI. The OCR step normalizes into temp space and OCRs the copy, which
+shrinks what OCR has to process. The copy is not stored: as a lossless PNG it is
+usually larger than the source JPEG, and the original stays the document of record.
+"""
+from PIL import Image, ImageOps
+from typing import Any, Dict
+import os
+from app.core.config import settings
+
+
+class ImageNormalizationService:
+    """Service for producing OCR-ready copies of photos."""
+
+    @staticmethod
+    def normalize(src_path: str, dest_path: str) -> Dict[str, Any]:
+        """
+        Write a normalized copy of src_path to dest_path (PNG) and return size statistics.
+
+        - JPEG draft mode: decode directly at reduced scale and in grayscale (much less work
+          than decoding 12 MP in color and resizing afterwards)
+        - EXIF orientation applied, so text is upright for Tesseract
+        - grayscale, downscaled so the long side is at most IMAGE_NORMALIZE_MAX_SIDE
+        - lossless PNG recompression
+        """
+        max_side = settings.IMAGE_NORMALIZE_MAX_SIDE
+        with Image.open(src_path) as img:
+            original_size = img.size
+            if img.format == "JPEG":
+                scale = min(1.0, max_side / max(img.size))
+                img.draft("L", (int(img.width * scale), int(img.height * scale)))
+            normalized = ImageOps.exif_transpose(img)
+            normalized = normalized.convert("L")
+            if max(normalized.size) > max_side:
+                normalized.thumbnail((max_side, max_side), Image.LANCZOS)
+            normalized.save(dest_path, format="PNG", optimize=True)
+            normalized_size = normalized.size
+
+        return {
+            "original_size": list(original_size),
+            "normalized_size": list(normalized_size),
+            "original_bytes": os.path.getsize(src_path),
+            "normalized_bytes": os.path.getsize(dest_path),
+        }
+
+
+image_normalization_service = ImageNormalizationService()
@@ -0,0 +1,203 @@
+"""
+Durable job queue backed by the jobs table.
+
+On PostgreSQL, workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED so many
+workers can poll the same table without blocking each other. Other databases
+(SQLite in development/tests) fall back to a plain SELECT; the claim is still
+safe because it is finalized with a conditional UPDATE (status must still be
+QUEUED), so two workers can never run the same job.
+
+Claiming is fair between tenants and users: the next job belongs to the tenant
+with the fewest running jobs (users without a tenant count on their own), then
+the user with the fewest running jobs, oldest first. A user who queued a large
+bulk upload therefore shares the workers with everyone else instead of holding
+them until the whole upload is done.
+"""
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime, timedelta
+from app.db import models
+from app.core.config import settings
+
+
+class JobQueue:
+    """Service for enqueuing, claiming and finishing background jobs."""
+
+    @staticmethod
+    def enqueue(
+        db: Session,
+        kind: str,
+        invoice_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        commit: bool = True
+    ) -> models.Job:
+        """Add a job to the queue. With commit=False the caller commits (same transaction as its own rows)."""
+        job = models.Job(
+            kind=kind,
+            invoice_id=invoice_id,
+            user_id=user_id,
+            status=models.JobStatus.QUEUED,
+            attempts=0,
+            max_attempts=settings.JOB_MAX_ATTEMPTS,
+            run_after=datetime.utcnow(),
+        )
+        db.add(job)
+        if commit:
+            db.commit()
+            db.refresh(job)
+        return job
+
+    @staticmethod
+    def enqueue_many(
+        db: Session,
+        kind: str,
+        invoice_ids: List[int],
+        user_id: Optional[int] = None,
+        commit: bool = True
+    ) -> None:
+        """Add one job per invoice in a single batched INSERT."""
+        if not invoice_ids:
+            return
+        now = datetime.utcnow()
+        db.execute(insert(models.Job), [
+            {
+                "kind": kind,
+                "invoice_id": invoice_id,
+                "user_id": user_id,
+                "status": models.JobStatus.QUEUED,
+                "attempts": 0,
+                "max_attempts": settings.JOB_MAX_ATTEMPTS,
+                "run_after": now,
+            }
+            for invoice_id in invoice_ids
+        ])
+        if commit:
+            db.commit()
+
+    @staticmethod
+    def claim(db: Session, worker_id: str) -> Optional[models.Job]:
+        """Claim the next runnable job for this worker (fair between tenants/users), or return None if the queue is empty."""
+        user_running = db.query(
+            models.Job.user_id.label("user_id"), func.count(models.Job.id).label("running")
+        ).filter(
+            models.Job.status == models.JobStatus.RUNNING
+        ).group_by(models.Job.user_id).subquery()
+        tenant_running = db.query(
+            models.User.tenant.label("tenant"), func.count(models.Job.id).label("running")
+        ).join(
+            models.User, models.User.id == models.Job.user_id
+        ).filter(
+            models.Job.status == models.JobStatus.RUNNING,
+            models.User.tenant.isnot(None)
+        ).group_by(models.User.tenant).subquery()
+
+        query = db.query(models.Job.id).outerjoin(
+            models.User, models.User.id == models.Job.user_id
+        ).outerjoin(
+            user_running, user_running.c.user_id == models.Job.user_id
+        ).outerjoin(
+            tenant_running, tenant_running.c.tenant == models.User.tenant
+        ).filter(
+            models.Job.status == models.JobStatus.QUEUED,
+            models.Job.run_after <= datetime.utcnow()
+        ).order_by(
+            func.coalesce(tenant_running.c.running, user_running.c.running, 0),
+            func.coalesce(user_running.c.running, 0),
+            models.Job.id
+        ).limit(1)
+
+        if db.bind.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True, of=models.Job)
+
+        row = query.first()
+        if row is None:
+            db.commit()
+            return None
+
+        # Conditional update: only succeeds if nobody claimed the job in between
+        claimed = db.query(models.Job).filter(
+            models.Job.id == row.id,
+            models.Job.status == models.JobStatus.QUEUED
+        ).update(
+            {
+                models.Job.status: models.JobStatus.RUNNING,
+                models.Job.locked_by: worker_id,
+                models.Job.locked_at: datetime.utcnow(),
+                models.Job.attempts: models.Job.attempts + 1,
+            },
+            synchronize_session=False
+        )
+        db.commit()
+        if not claimed:
+            return None
+
+        return db.query(models.Job).filter(models.Job.id == row.id).first()
+
+    @staticmethod
+    def complete(db: Session, job: models.Job) -> None:
+        """Mark a job as done."""
+        job.status = models.JobStatus.DONE
+        job.locked_by = None
+        job.last_error = None
+        db.commit()
+
+    @staticmethod
+    def fail(db: Session, job: models.Job, error: str) -> None:
+        """Record a failure; requeue with linear backoff until max_attempts is reached."""
+        job.last_error = error
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            job.status = models.JobStatus.QUEUED
+            job.run_after = datetime.utcnow() + timedelta(
+                seconds=settings.JOB_RETRY_BACKOFF_SECONDS * job.attempts
+            )
+        else:
+            job.status = models.JobStatus.FAILED
+        db.commit()
+
+    @staticmethod
+    def requeue_stale(db: Session) -> int:
+        """
+        Requeue RUNNING jobs locked longer than JOB_STALE_AFTER_SECONDS (worker crashed or was killed). Returns count.
+
+        Stale jobs that already used max_attempts are marked FAILED instead, so a job that
+        kills its worker every time is not retried forever.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.JOB_STALE_AFTER_SECONDS)
+        db.query(models.Job).filter(
+            models.Job.status == models.JobStatus.RUNNING,
+            models.Job.locked_at < cutoff,
+            models.Job.attempts >= models.Job.max_attempts
+        ).update(
+            {
+                models.Job.status: models.JobStatus.FAILED,
+                models.Job.locked_by: None,
+                models.Job.last_error: "Worker stopped while running the job (stale lock); attempts exhausted",
+            },
+            synchronize_session=False
+        )
+        count = db.query(models.Job).filter(
+            models.Job.status == models.JobStatus.RUNNING,
+            models.Job.locked_at < cutoff,
+            models.Job.attempts < models.Job.max_attempts
+        ).update(
+            {
+                models.Job.status: models.JobStatus.QUEUED,
+                models.Job.locked_by: None,
+                models.Job.run_after: datetime.utcnow(),
+            },
+            synchronize_session=False
+        )
+        db.commit()
+        return count
+
+    @staticmethod
+    def depth(db: Session) -> int:
+        """Number of jobs waiting to run."""
+        return db.query(models.Job).filter(
+            models.Job.status == models.JobStatus.QUEUED
+        ).count()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,89 @@
+"""
+Persistent cache of OCR results.
+
+OCR output depends only on the document bytes and the OCR configuration, so it is
+cached under a key derived from both: content hash, engine version, languages, DPI
+settings, text-layer and image-normalization settings. Reprocessing an unchanged
+document (job retry, prompt or rule change) then skips OCR entirely, while any
+configuration change produces a new key. Entries are evicted least recently used
+once their total size exceeds OCR_CACHE_MAX_BYTES (periodically, by the worker).
+"""
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import hashlib
+import json
+from app.db import models
+from app.core.config import settings
+from app.services.cache_eviction import evict_lru
+from app.services.ocr_service import ocr_service
+
+
+class OCRCacheService:
+    """Service for looking up and storing cached OCR results."""
+
+    @staticmethod
+    def config() -> Dict[str, Any]:
+        """Everything besides the document itself that affects OCR output."""
+        return {
+            "format": 2,  # page items include word layout
+            "engine": ocr_service.engine_version(),
+            "languages": settings.OCR_LANGUAGES,
+            "dpi": settings.OCR_DPI,
+            "adaptive_dpi": [settings.OCR_LOW_DPI, settings.OCR_MIN_CONFIDENCE] if settings.OCR_ADAPTIVE_DPI_ENABLED else None,
+            "max_page_pixels": settings.OCR_MAX_PAGE_PIXELS,
+            "text_layer": settings.PDF_TEXT_LAYER_MIN_CHARS if settings.PDF_TEXT_LAYER_ENABLED else None,
+            "normalize_image": settings.IMAGE_NORMALIZE_MAX_SIDE if settings.IMAGE_NORMALIZE_ENABLED else None,
+            "preprocess": sorted(settings.OCR_PREPROCESS_DOCUMENT_TYPES),
+        }
+
+    @staticmethod
+    def cache_key(content_hash: str) -> str:
+        config = json.dumps(OCRCacheService.config(), sort_keys=True)
+        return hashlib.sha256(f"{content_hash}:{config}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get(db: Session, content_hash: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached page items for a document, or None."""
+        if not settings.OCR_CACHE_ENABLED or not content_hash:
+            return None
+        entry = db.query(models.OCRCacheEntry).filter(
+            models.OCRCacheEntry.cache_key == OCRCacheService.cache_key(content_hash)
+        ).first()
+        if not entry:
+            return None
+        entry.hit_count += 1
+        entry.last_used_at = datetime.utcnow()
+        db.commit()
+        return json.loads(entry.pages)
+
+    @staticmethod
+    def put(db: Session, content_hash: str, pages: List[Dict[str, Any]]) -> None:
+        """Store page items for a document (results with failed or skipped pages are not cached)."""
+        if not settings.OCR_CACHE_ENABLED or not content_hash or any("error" in page or "skipped" in page for page in pages):
+            return
+        data = json.dumps(pages, ensure_ascii=False)
+        entry = models.OCRCacheEntry(
+            cache_key=OCRCacheService.cache_key(content_hash),
+            content_hash=content_hash,
+            engine=f"{ocr_service.engine_version()} {settings.OCR_LANGUAGES}",
+            pages=data,
+            size_bytes=len(data.encode("utf-8")),
+            hit_count=0,
+            last_used_at=datetime.utcnow(),
+        )
+        db.add(entry)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker cached the same document concurrently
+            db.rollback()
+
+    @staticmethod
+    def evict(db: Session) -> int:
+        """Delete least recently used entries until the cache fits OCR_CACHE_MAX_BYTES. Returns entries deleted."""
+        return evict_lru(db, models.OCRCacheEntry, settings.OCR_CACHE_MAX_BYTES)
+
+
+ocr_cache_service = OCRCacheService()
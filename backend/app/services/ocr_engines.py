@@ -0,0 +1,135 @@
+"""
+OCR engine backends.
+
+- "pytesseract": runs the tesseract CLI per image (temp file + process start + loading
+  traineddata every call). Always available where tesseract is installed.
+- "tesserocr": in-process bindings to libtesseract. Each process/thread keeps an
+  initialized API handle, so languages are loaded once and images are passed in memory.
+  Optional: pip install tesserocr (needs libtesseract-dev to build).
+
+OCR_ENGINE selects the backend; "auto" uses tesserocr if it is installed and falls
+back to pytesseract otherwise. Both return word-level data in pytesseract's
+image_to_data dict layout (text, conf, block_num, par_num, line_num, left, top,
+width, height), so callers do not depend on the backend.
+"""
+from PIL import Image
+from typing import Any, Dict, List, Optional
+import threading
+import pytesseract
+from app.core.config import settings
+
+# Set Tesseract command path if configured
+if settings.TESSERACT_CMD:
+    pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
+
+
+class OCREngine:
+    """Interface for OCR engine backends."""
+
+    name = ""
+
+    def version(self) -> str:
+        raise NotImplementedError
+
+    def image_to_data(self, image: Image.Image) -> Dict[str, List[Any]]:
+        """Recognize words in image; returns pytesseract's image_to_data dict layout."""
+        raise NotImplementedError
+
+
+class PytesseractEngine(OCREngine):
+    """Tesseract via the CLI (one subprocess per image)."""
+
+    name = "pytesseract"
+
+    def version(self) -> str:
+        return f"tesseract {pytesseract.get_tesseract_version()}"
+
+    def image_to_data(self, image: Image.Image) -> Dict[str, List[Any]]:
+        return pytesseract.image_to_data(image, lang=settings.OCR_LANGUAGES, output_type=pytesseract.Output.DICT)
+
+
+class TesserocrEngine(OCREngine):
+    """Tesseract in-process via tesserocr, with one persistent API handle per thread."""
+
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._local = threading.local()
+
+    def _api(self):
+        # A TessBaseAPI is not thread-safe; pool processes are single-threaded, so this is one per process there
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._tesserocr.PyTessBaseAPI(lang=settings.OCR_LANGUAGES)
+            self._local.api = api
+        return api
+
+    def version(self) -> str:
+        return self._tesserocr.tesseract_version().splitlines()[0].strip()
+
+    def image_to_data(self, image: Image.Image) -> Dict[str, List[Any]]:
+        RIL = self._tesserocr.RIL
+        api = self._api()
+        api.SetImage(image)
+        api.Recognize()
+
+        data: Dict[str, List[Any]] = {
+            key: [] for key in ("text", "conf", "block_num", "par_num", "line_num", "left", "top", "width", "height")
+        }
+        block = par = line = 0
+        iterator = api.GetIterator()
+        for word in self._tesserocr.iterate_level(iterator, RIL.WORD):
+            if word.IsAtBeginningOf(RIL.BLOCK):
+                block, par, line = block + 1, 0, 0
+            if word.IsAtBeginningOf(RIL.PARA):
+                par, line = par + 1, 0
+            if word.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+            text = word.GetUTF8Text(RIL.WORD)
+            box = word.BoundingBox(RIL.WORD)
+            if text is None or box is None:
+                continue
+            x1, y1, x2, y2 = box
+            data["text"].append(text)
+            data["conf"].append(word.Confidence(RIL.WORD))
+            data["block_num"].append(block)
+            data["par_num"].append(par)
+            data["line_num"].append(line)
+            data["left"].append(x1)
+            data["top"].append(y1)
+            data["width"].append(x2 - x1)
+            data["height"].append(y2 - y1)
+        api.Clear()
+        return data
+
+
+def create_ocr_engine() -> OCREngine:
+    """Create the OCR engine selected by OCR_ENGINE."""
+    if settings.OCR_ENGINE == "pytesseract":
+        return PytesseractEngine()
+    if settings.OCR_ENGINE == "tesserocr":
+        try:
+            return TesserocrEngine()
+        except ImportError:
+            raise RuntimeError("OCR_ENGINE=tesserocr requires tesserocr (pip install tesserocr)")
+    if settings.OCR_ENGINE == "auto":
+        try:
+            return TesserocrEngine()
+        except ImportError:
+            return PytesseractEngine()
+    raise ValueError(f"Unknown OCR_ENGINE: {settings.OCR_ENGINE}")
+
+
+_engine: Optional[OCREngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_ocr_engine() -> OCREngine:
+    """The OCR engine of this process (created on first use, so pool processes initialize their own)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_ocr_engine()
+        return _engine
@@ -0,0 +1,128 @@
+"""
+Page-level cache of OCR results.
+
+Suppliers often append the same pages (terms and conditions, payment information)
+to every invoice. Those pages render to identical images, so OCRService identifies
+each PDF page by a hash of a small render plus the OCR configuration (see
+OCRService.page_cache_key) and serves known pages from here instead of Tesseract.
+
+Two levels: an in-process LRU (OCR_PAGE_CACHE_MEMORY_BYTES) in front of the
+persistent ocr_page_cache_entries table (OCR_PAGE_CACHE_MAX_BYTES, least recently
+used entries evicted periodically by the worker). Without a database session only the in-process LRU is used.
+"""
+from collections import OrderedDict
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import json
+import threading
+from app.db import models
+from app.core.config import settings
+from app.services.cache_eviction import evict_lru
+
+
+class OCRPageCacheService:
+    """Service for looking up and storing OCR'd pages by page hash."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, str]" = OrderedDict()  # cache key -> JSON page item
+        self._memory_bytes = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, data: str) -> None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > settings.OCR_PAGE_CACHE_MEMORY_BYTES and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def get_many(self, db: Optional[Session], keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached page items for the given keys ({key: item}; missing keys are left out)."""
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for key in keys:
+                data = self._memory.get(key)
+                if data is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = json.loads(data)
+            self.memory_hits += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if db is not None and missing:
+            entries = db.query(models.OCRPageCacheEntry).filter(
+                models.OCRPageCacheEntry.cache_key.in_(missing)
+            ).all()
+            now = datetime.utcnow()
+            for entry in entries:
+                entry.hit_count += 1
+                entry.last_used_at = now
+                found[entry.cache_key] = json.loads(entry.data)
+                self._remember(entry.cache_key, entry.data)
+            if entries:
+                db.commit()
+            with self._lock:
+                self.db_hits += len(entries)
+
+        with self._lock:
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, db: Optional[Session], items: Dict[str, Dict[str, Any]], page_hashes: Dict[str, str]) -> None:
+        """Store page items ({key: item}); page_hashes maps each key to its page hash."""
+        if not items:
+            return
+        encoded = {key: json.dumps(item, ensure_ascii=False) for key, item in items.items()}
+        for key, data in encoded.items():
+            self._remember(key, data)
+        if db is None:
+            return
+
+        existing = {
+            key for (key,) in db.query(models.OCRPageCacheEntry.cache_key).filter(
+                models.OCRPageCacheEntry.cache_key.in_(list(encoded))
+            )
+        }
+        now = datetime.utcnow()
+        for key, data in encoded.items():
+            if key in existing:
+                continue
+            db.add(models.OCRPageCacheEntry(
+                cache_key=key,
+                page_hash=page_hashes[key],
+                data=data,
+                size_bytes=len(data.encode("utf-8")),
+                hit_count=0,
+                last_used_at=now,
+            ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker cached the same page concurrently
+            db.rollback()
+
+    @staticmethod
+    def evict(db: Session) -> int:
+        """Delete least recently used entries until the cache fits OCR_PAGE_CACHE_MAX_BYTES. Returns entries deleted."""
+        return evict_lru(db, models.OCRPageCacheEntry, settings.OCR_PAGE_CACHE_MAX_BYTES)
+
+    def stats(self) -> Dict[str, Any]:
+        """In-process counters and memory use."""
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+            }
+
+
+ocr_page_cache_service = OCRPageCacheService()
@@ -1,57 +1,500 @@
 """
 OCR service for extracting text from invoices.
 """
-import pytesseract
 from PIL import Image
 from pdf2image import convert_from_path
-from typing import Optional
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from sqlalchemy.orm import Session
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from functools import lru_cache
+import hashlib
 import io
+import json
+import math
+import re
+import subprocess
+import threading
+import time
+import zlib
 from app.core.config import settings
-
-# Set Tesseract command path if configured
-if settings.TESSERACT_CMD:
-    pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
+from app.core.executors import cpu_pool
+from app.services.ocr_engines import get_ocr_engine
+from app.services.image_preprocessing_service import image_preprocessing_service
+from app.services.ocr_page_cache_service import ocr_page_cache_service
 
 
 class OCRService:
     """Service for OCR text extraction."""
-    
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def engine_version() -> str:
+        """OCR engine and version, e.g. "tesserocr (tesseract 5.3.0)"; version "unknown" if it cannot be determined."""
+        engine = get_ocr_engine()
+        try:
+            version = engine.version()
+        except Exception:
+            version = "unknown"
+        return f"{engine.name} ({version})"
+
     @staticmethod
     def extract_text_from_image(image: Image.Image) -> str:
         """Extract text from a PIL Image."""
+        text, _ = OCRService.extract_text_with_confidence(image)
+        return text
+
+    @staticmethod
+    def recognize(image: Image.Image, preprocess: bool = False) -> Dict[str, Any]:
+        """
+        OCR a PIL Image. Returns {"text", "confidence", "layout"}.
+
+        confidence is the mean word confidence (0-100, 0 if no words). layout is the
+        page's word-level structure in columnar form (parallel arrays, one entry per word):
+        {"width", "height", "words", "boxes" (flat left, top, width, height), "conf", "line"}.
+
+        With preprocess, the image is cropped, deskewed and binarized first (see
+        ImagePreprocessingService); the result then also has "preprocess" (crop box, skew
+        angle, stage timings) and the layout refers to the preprocessed image, with
+        layout["preprocess"] = {"crop_box", "skew_angle"} to map it back.
+        """
+        preprocess_info = None
+        if preprocess:
+            image, preprocess_info = image_preprocessing_service.preprocess(image)
         try:
-            text = pytesseract.image_to_string(image, lang='nor+eng')
-            return text.strip()
+            data = get_ocr_engine().image_to_data(image)
         except Exception as e:
             raise Exception(f"OCR extraction failed: {str(e)}")
-    
+
+        layout: Dict[str, Any] = {
+            "width": image.width, "height": image.height, "words": [], "boxes": [], "conf": [], "line": []
+        }
+        line_ids: Dict[Tuple[int, int, int], int] = {}
+        for i, word in enumerate(data["text"]):
+            confidence = float(data["conf"][i])
+            if confidence < 0 or not word.strip():
+                continue
+            line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            layout["words"].append(word)
+            layout["boxes"].extend(int(data[k][i]) for k in ("left", "top", "width", "height"))
+            layout["conf"].append(round(confidence))
+            layout["line"].append(line_ids.setdefault(line_key, len(line_ids)))
+        if preprocess_info:
+            layout["preprocess"] = {k: preprocess_info[k] for k in ("crop_box", "skew_angle")}
+
+        # Rebuild the text in reading order: lines by newline, paragraphs by a blank line
+        line_keys = list(line_ids)
+        parts = []
+        for i, word in enumerate(layout["words"]):
+            if i > 0:
+                previous, current = line_keys[layout["line"][i - 1]], line_keys[layout["line"][i]]
+                parts.append(" " if previous == current else "\n\n" if previous[:2] != current[:2] else "\n")
+            parts.append(word)
+        confidences = layout["conf"]
+        result = {
+            "text": "".join(parts),
+            "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+            "layout": layout,
+        }
+        if preprocess_info:
+            result["preprocess"] = preprocess_info
+        return result
+
+    @staticmethod
+    def extract_text_with_confidence(image: Image.Image) -> Tuple[str, float]:
+        """Extract text and the mean word confidence (0-100, 0 if no words) from a PIL Image."""
+        result = OCRService.recognize(image)
+        return result["text"], result["confidence"]
+
+    @staticmethod
+    def pack_layout(pages: List[Dict[str, Any]]) -> bytes:
+        """Serialize page layouts for storage (columnar JSON, zlib-compressed)."""
+        return zlib.compress(json.dumps({"v": 1, "pages": pages}, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def unpack_layout(data: bytes) -> List[Dict[str, Any]]:
+        return json.loads(zlib.decompress(data).decode("utf-8"))["pages"]
+
     @staticmethod
-    def extract_text_from_pdf(pdf_path: str) -> str:
-        """Extract text from a PDF file."""
+    def extract_text_layer(pdf_path: str) -> Optional[List[str]]:
+        """
+        Embedded text of each page via poppler's pdftotext (no rasterizing, no OCR).
+
+        Returns one string per page (empty for scanned pages), or None if pdftotext
+        is unavailable or fails (e.g. encrypted or malformed PDF).
+        """
         try:
-            # Convert PDF to images
-            images = convert_from_path(pdf_path, dpi=300)
-            
-            # Extract text from each page
-            all_text = []
+            result = subprocess.run(
+                [settings.PDFTOTEXT_CMD, "-layout", "-enc", "UTF-8", pdf_path, "-"],
+                capture_output=True,
+                timeout=settings.PDFTOTEXT_TIMEOUT_SECONDS,
+                check=True,
+            )
+        except (OSError, subprocess.SubprocessError):
+            return None
+        text = result.stdout.decode("utf-8", errors="replace")
+        # pdftotext ends every page with a form feed
+        pages = text.split("\f")
+        if pages and pages[-1] == "":
+            pages.pop()
+        return pages
+
+    @staticmethod
+    def is_text_layer_sufficient(page_text: str) -> bool:
+        """True if a page's embedded text is substantial and not garbage (e.g. unmapped fonts)."""
+        compact = re.sub(r"\s+", "", page_text)
+        if len(compact) < settings.PDF_TEXT_LAYER_MIN_CHARS:
+            return False
+        alphanumeric = sum(1 for ch in compact if ch.isalnum())
+        return alphanumeric / len(compact) >= 0.5
+
+    @staticmethod
+    def pdf_info(pdf_path: str, last_page: int) -> Dict[str, Any]:
+        """
+        Page count and sizes (in points) of pages 1..last_page via poppler's pdfinfo.
+
+        Nothing is rendered, so this is cheap and safe to run before rasterizing.
+        Returns {"pages": int, "page_sizes": {page_number: (width_pt, height_pt)}}.
+        """
+        result = subprocess.run(
+            [settings.PDFINFO_CMD, "-f", "1", "-l", str(max(1, last_page)), pdf_path],
+            capture_output=True,
+            timeout=settings.PDFTOTEXT_TIMEOUT_SECONDS,
+            check=True,
+        )
+        output = result.stdout.decode("utf-8", errors="replace")
+        pages = re.search(r"^Pages:\s+(\d+)", output, re.MULTILINE)
+        if not pages:
+            raise ValueError("pdfinfo did not report a page count")
+        page_sizes = {
+            int(number): (float(width), float(height))
+            for number, width, height in re.findall(
+                r"^Page\s+(\d+)\s+size:\s+([\d.]+) x ([\d.]+)", output, re.MULTILINE
+            )
+        }
+        return {"pages": int(pages.group(1)), "page_sizes": page_sizes}
+
+    @staticmethod
+    def raster_dpi(page_size: Optional[Tuple[float, float]], dpi: int) -> int:
+        """dpi, lowered if needed so the rendered page stays within OCR_MAX_PAGE_PIXELS."""
+        if not page_size:
+            return dpi
+        width_pt, height_pt = page_size
+        pixels = (width_pt / 72 * dpi) * (height_pt / 72 * dpi)
+        if pixels <= settings.OCR_MAX_PAGE_PIXELS:
+            return dpi
+        return max(1, int(dpi * math.sqrt(settings.OCR_MAX_PAGE_PIXELS / pixels)))
+
+    @staticmethod
+    def ocr_pdf_page(
+        pdf_path: str, page_number: int, dpis: List[int], preprocess: bool = False, deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Rasterize and OCR a single PDF page. Runs in the cpu pool.
+
+        Tries each resolution in dpis (ascending) and stops at the first result whose mean
+        word confidence reaches OCR_MIN_CONFIDENCE; otherwise keeps the most confident one.
+        Only this page is rendered (grayscale, which is all Tesseract uses), and each image
+        is released as soon as it has been OCR'd.
+        Returns {"text", "confidence", "dpi", "layout"}, plus "preprocess" if preprocess (see recognize).
+
+        deadline (time.time() value) is the document's time budget: a page that starts after
+        it is skipped ({"text": "", "skipped": "time_budget"}), and a page is not re-rendered
+        at a higher DPI after it.
+        """
+        if OCRService._expired(deadline):
+            return {"text": "", "skipped": "time_budget"}
+        best: Optional[Dict[str, Any]] = None
+        for dpi in dpis:
+            images = convert_from_path(
+                pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True
+            )
+            try:
+                if not images:
+                    return {"text": "", "confidence": 0.0, "dpi": dpi, "layout": None}
+                result = OCRService.recognize(images[0], preprocess=preprocess)
+            finally:
+                for image in images:
+                    image.close()
+            if best is None or result["confidence"] > best["confidence"]:
+                best = {
+                    "text": result["text"],
+                    "confidence": round(result["confidence"], 1),
+                    "dpi": dpi,
+                    "layout": {**result["layout"], "dpi": dpi},
+                }
+                if "preprocess" in result:
+                    best["preprocess"] = result["preprocess"]
+            if result["confidence"] >= settings.OCR_MIN_CONFIDENCE or OCRService._expired(deadline):
+                break
+        return best
+
+    @staticmethod
+    def _expired(deadline: Optional[float]) -> bool:
+        return deadline is not None and time.time() >= deadline
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        """Seconds left until deadline (None: no deadline), for timeouts."""
+        return None if deadline is None else max(0.0, deadline - time.time())
+
+    @staticmethod
+    def ocr_dpis(page_size: Optional[Tuple[float, float]]) -> List[int]:
+        """Resolutions to try for a page: OCR_LOW_DPI first if adaptive DPI is enabled, then OCR_DPI."""
+        dpi = OCRService.raster_dpi(page_size, settings.OCR_DPI)
+        low_dpi = OCRService.raster_dpi(page_size, settings.OCR_LOW_DPI)
+        if settings.OCR_ADAPTIVE_DPI_ENABLED and low_dpi < dpi:
+            return [low_dpi, dpi]
+        return [dpi]
+
+    @staticmethod
+    def ocr_image_file(image_path: str, preprocess: bool = False) -> Dict[str, Any]:
+        """OCR an image file. Runs in the cpu pool. Returns {"text", "confidence", "layout"}, plus "preprocess" if preprocess."""
+        with Image.open(image_path) as image:
+            result = OCRService.recognize(image, preprocess=preprocess)
+        result["confidence"] = round(result["confidence"], 1)
+        return result
+
+    @staticmethod
+    def _submit_pages(fn: Callable, page_args: Dict[int, tuple], deadline: Optional[float]) -> Dict[int, Future]:
+        """
+        Submit fn(*args) per page to the cpu pool, at most OCR_MAX_PARALLEL_PAGES at a time
+        (blocks until the last page is submitted). Pages not submitted by deadline are left out.
+        """
+        slots = threading.BoundedSemaphore(max(1, settings.OCR_MAX_PARALLEL_PAGES))
+        futures = {}
+        for page_number, args in page_args.items():
+            if not slots.acquire(timeout=OCRService._remaining(deadline)):
+                break  # time budget used up waiting for a slot
+            future = cpu_pool.submit(fn, *args)
+            future.add_done_callback(lambda _: slots.release())
+            futures[page_number] = future
+        return futures
+
+    @staticmethod
+    def page_hash(pdf_path: str, page_number: int) -> Optional[str]:
+        """
+        Identity of a PDF page for the page cache: SHA-256 of a small grayscale render
+        (OCR_PAGE_CACHE_HASH_DPI). Identical pages in different files render identically.
+        Runs in the cpu pool; None if the page does not render.
+        """
+        images = convert_from_path(
+            pdf_path, dpi=settings.OCR_PAGE_CACHE_HASH_DPI, first_page=page_number, last_page=page_number, grayscale=True
+        )
+        try:
+            if not images:
+                return None
+            digest = hashlib.sha256(f"{images[0].width}x{images[0].height}:".encode("ascii"))
+            digest.update(images[0].tobytes())
+            return digest.hexdigest()
+        finally:
             for image in images:
-                text = OCRService.extract_text_from_image(image)
-                all_text.append(text)
-            
-            return "\n\n".join(all_text)
+                image.close()
+
+    @staticmethod
+    def page_cache_key(page_hash: str, preprocess: bool) -> str:
+        """Page cache key: page hash plus everything besides the page that affects its OCR output."""
+        config = {
+            "engine": OCRService.engine_version(),
+            "languages": settings.OCR_LANGUAGES,
+            "dpi": settings.OCR_DPI,
+            "adaptive_dpi": [settings.OCR_LOW_DPI, settings.OCR_MIN_CONFIDENCE] if settings.OCR_ADAPTIVE_DPI_ENABLED else None,
+            "max_page_pixels": settings.OCR_MAX_PAGE_PIXELS,
+            "preprocess": preprocess,
+        }
+        return hashlib.sha256(f"{page_hash}:{json.dumps(config, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _page_cache_lookup(
+        pdf_path: str, page_numbers: List[int], preprocess: bool, deadline: Optional[float], db: Optional[Session]
+    ) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, Tuple[str, str]]]:
+        """
+        Hash the pages (in the cpu pool) and look them up in the page cache.
+        Returns (page items served from the cache, {page_number: (page hash, cache key)}).
+        """
+        futures = OCRService._submit_pages(
+            OCRService.page_hash, {n: (pdf_path, n) for n in page_numbers}, deadline
+        )
+        page_keys: Dict[int, Tuple[str, str]] = {}
+        for page_number, future in futures.items():
+            try:
+                page_hash = future.result(timeout=OCRService._remaining(deadline))
+            except FuturesTimeoutError:
+                future.cancel()
+                continue
+            except Exception:
+                continue  # the page is OCR'd as usual, and fails there if it cannot be rendered
+            if page_hash:
+                page_keys[page_number] = (page_hash, OCRService.page_cache_key(page_hash, preprocess))
+
+        found = ocr_page_cache_service.get_many(db, list({key for _, key in page_keys.values()}))
+        cached = {
+            page_number: {"page": page_number, "source": "ocr", **found[key], "page_cache_hit": True}
+            for page_number, (_, key) in page_keys.items()
+            if key in found
+        }
+        return cached, page_keys
+
+    @staticmethod
+    def _page_cache_store(
+        ocr_pages: Dict[int, Dict[str, Any]], page_keys: Dict[int, Tuple[str, str]], db: Optional[Session]
+    ) -> None:
+        """Add newly OCR'd pages to the page cache (not failed or skipped ones)."""
+        items: Dict[str, Dict[str, Any]] = {}
+        page_hashes: Dict[str, str] = {}
+        for page_number, page in ocr_pages.items():
+            if page_number not in page_keys or "error" in page or "skipped" in page:
+                continue
+            page_hash, key = page_keys[page_number]
+            # Per-run details (page number, preprocessing timings) are not part of the cached result
+            items[key] = {k: v for k, v in page.items() if k not in ("page", "source", "preprocess")}
+            page_hashes[key] = page_hash
+        ocr_page_cache_service.put_many(db, items, page_hashes)
+
+    @staticmethod
+    def ocr_pdf_pages(
+        pdf_path: str, page_dpis: Dict[int, List[int]], preprocess: bool = False, deadline: Optional[float] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        OCR the given pages ({page_number: dpis to try}) in parallel in the cpu pool; returns {page_number: page item}.
+
+        At most OCR_MAX_PARALLEL_PAGES pages of this document are submitted at a time, so a
+        large PDF cannot occupy the whole pool. A failing page gets empty text and an "error"
+        instead of failing the document. Pages not done by deadline get empty text and
+        "skipped": "time_budget"; pages already running in the pool then finish there (at
+        most OCR_MAX_PARALLEL_PAGES, without DPI escalation) but their results are dropped.
+        """
+        futures = OCRService._submit_pages(
+            OCRService.ocr_pdf_page,
+            {page_number: (pdf_path, page_number, dpis, preprocess, deadline) for page_number, dpis in page_dpis.items()},
+            deadline,
+        )
+        pages = {}
+        for page_number in page_dpis:
+            skipped = {"page": page_number, "text": "", "source": "ocr", "skipped": "time_budget"}
+            future = futures.get(page_number)
+            if future is None:
+                pages[page_number] = skipped
+                continue
+            try:
+                pages[page_number] = {"page": page_number, "source": "ocr", **future.result(timeout=OCRService._remaining(deadline))}
+            except FuturesTimeoutError:
+                future.cancel()
+                pages[page_number] = skipped
+            except Exception as e:
+                pages[page_number] = {"page": page_number, "text": "", "source": "ocr", "error": str(e)}
+        return pages
+
+    @staticmethod
+    def extract_pages_from_pdf(
+        pdf_path: str, deadline: Optional[float] = None, db: Optional[Session] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Extract text per page of a PDF, in page order.
+
+        Born-digital pages use the embedded text layer; only pages without a usable
+        text layer are rasterized and OCR'd (in parallel, see ocr_pdf_pages).
+        Each item: {"page", "text", "source"}; OCR'd pages add "confidence", "dpi" and
+        "layout" (see recognize), or "error" if OCR failed. Scanned pages are preprocessed
+        if "scan" is in OCR_PREPROCESS_DOCUMENT_TYPES.
+
+        Partial results instead of failure for oversized documents: pages to OCR beyond
+        OCR_MAX_PDF_PAGES, and pages not OCR'd by deadline, get empty text and
+        "skipped": "page_limit" / "time_budget" (see is_truncated).
+
+        With OCR_PAGE_CACHE_ENABLED, pages seen before (e.g. a supplier's terms page) are
+        served from the page cache ("page_cache_hit": True) instead of being OCR'd again;
+        db enables its persistent level, otherwise only the in-process LRU is used.
+        """
+        try:
+            text_layer = OCRService.extract_text_layer(pdf_path) if settings.PDF_TEXT_LAYER_ENABLED else None
+
+            pages: Dict[int, Dict[str, Any]] = {}
+            info = None
+            if text_layer:
+                page_count = len(text_layer)
+                for i, page_text in enumerate(text_layer):
+                    if OCRService.is_text_layer_sufficient(page_text):
+                        pages[i + 1] = {"page": i + 1, "text": page_text.strip(), "source": "text_layer"}
+                to_ocr = [n for n in range(1, page_count + 1) if n not in pages]
+            else:
+                # No text layer information: OCR every page
+                info = OCRService.pdf_info(pdf_path, last_page=settings.OCR_MAX_PDF_PAGES)
+                page_count = info["pages"]
+                to_ocr = list(range(1, page_count + 1))
+
+            # Page cap, applied before anything is rasterized
+            for n in to_ocr[settings.OCR_MAX_PDF_PAGES:]:
+                pages[n] = {"page": n, "text": "", "source": "ocr", "skipped": "page_limit"}
+            to_ocr = to_ocr[:settings.OCR_MAX_PDF_PAGES]
+            if to_ocr and info is None:
+                info = OCRService.pdf_info(pdf_path, last_page=to_ocr[-1])
+            page_dpis = {n: OCRService.ocr_dpis(info["page_sizes"].get(n)) for n in to_ocr}
+            preprocess = "scan" in settings.OCR_PREPROCESS_DOCUMENT_TYPES
+
+            cached_pages: Dict[int, Dict[str, Any]] = {}
+            page_keys: Dict[int, Tuple[str, str]] = {}
+            if settings.OCR_PAGE_CACHE_ENABLED and page_dpis:
+                cached_pages, page_keys = OCRService._page_cache_lookup(pdf_path, to_ocr, preprocess, deadline, db)
+            ocr_pages = OCRService.ocr_pdf_pages(
+                pdf_path,
+                {n: dpis for n, dpis in page_dpis.items() if n not in cached_pages},
+                preprocess=preprocess,
+                deadline=deadline,
+            )
+            OCRService._page_cache_store(ocr_pages, page_keys, db)
+
+            attempted = [page for page in ocr_pages.values() if "skipped" not in page]
+            has_text = cached_pages or any(page["source"] == "text_layer" for page in pages.values())
+            if attempted and not has_text and all("error" in page for page in attempted):
+                raise Exception(attempted[0]["error"])
+            pages.update(cached_pages)
+            pages.update(ocr_pages)
+            return [pages[n] for n in range(1, page_count + 1)]
         except Exception as e:
             raise Exception(f"PDF OCR extraction failed: {str(e)}")
-    
+
     @staticmethod
-    def extract_text(file_path: str, mime_type: str) -> str:
-        """Extract text from a file based on its MIME type."""
+    def join_pages(pages: List[Dict[str, Any]]) -> str:
+        """Document text: page texts separated by a form feed line (like pdftotext), so pages can be told apart."""
+        return "\n\f\n".join(page["text"] for page in pages)
+
+    @staticmethod
+    def is_truncated(pages: List[Dict[str, Any]]) -> bool:
+        """True if pages were skipped (page cap or time budget), i.e. the text is partial."""
+        return any("skipped" in page for page in pages)
+
+    @staticmethod
+    def extract_text_from_pdf(pdf_path: str, db: Optional[Session] = None) -> str:
+        """Extract text from a PDF file (db: use the persistent page cache too)."""
+        pages = OCRService.extract_pages_from_pdf(pdf_path, db=db)
+        return OCRService.join_pages(pages)
+
+    @staticmethod
+    def extract_pages(file_path: str, mime_type: str, db: Optional[Session] = None) -> List[Dict[str, Any]]:
+        """
+        Extract text per page from a file based on its MIME type.
+
+        Call from a worker thread, not from the cpu pool: OCR itself is dispatched to the pool.
+        Images (photos) are preprocessed if "photo" is in OCR_PREPROCESS_DOCUMENT_TYPES.
+        PDFs are OCR'd within OCR_DOCUMENT_TIME_BUDGET_SECONDS, counted from this call, and
+        use the page cache (persistent level if db is given).
+        """
         if mime_type == "application/pdf":
-            return OCRService.extract_text_from_pdf(file_path)
+            budget = settings.OCR_DOCUMENT_TIME_BUDGET_SECONDS
+            deadline = time.time() + budget if budget > 0 else None
+            return OCRService.extract_pages_from_pdf(file_path, deadline=deadline, db=db)
         elif mime_type.startswith("image/"):
-            image = Image.open(file_path)
-            return OCRService.extract_text_from_image(image)
+            preprocess = "photo" in settings.OCR_PREPROCESS_DOCUMENT_TYPES
+            result = cpu_pool.submit(OCRService.ocr_image_file, file_path, preprocess).result()
+            return [{"page": 1, "source": "ocr", **result}]
         else:
             raise ValueError(f"Unsupported file type: {mime_type}")
 
+    @staticmethod
+    def extract_text(file_path: str, mime_type: str) -> str:
+        """Extract text from a file based on its MIME type."""
+        pages = OCRService.extract_pages(file_path, mime_type)
+        return OCRService.join_pages(pages)
+
 
 ocr_service = OCRService()
@@ -88,12 +88,27 @@ class RuleValidationService:
         }
     
     @staticmethod
-    def check_risk_rules(account_number: Optional[str], vat_code: Optional[str], confidence: float) -> RiskLevel:
-        """Apply risk assessment rules."""
+    def check_risk_rules(
+        account_number: Optional[str],
+        vat_code: Optional[str],
+        confidence: float,
+        ocr_truncated: bool = False,
+        unknown_vendor_account: bool = False,
+    ) -> RiskLevel:
+        """Apply risk assessment rules. ocr_truncated: only part of the document was OCR'd.
+        unknown_vendor_account: a known vendor's invoice names a bank account/IBAN never approved for it."""
         # High risk conditions
         if confidence < 0.5:
             return RiskLevel.HIGH
         
+        # The suggestion is based on partial text (e.g. totals on skipped pages)
+        if ocr_truncated:
+            return RiskLevel.HIGH
+        
+        # Changed payment details on a known vendor's invoice (possible invoice fraud)
+        if unknown_vendor_account:
+            return RiskLevel.HIGH
+        
         validation = RuleValidationService.validate_suggestion(account_number, vat_code)
         if not validation["is_valid"]:
             return RiskLevel.HIGH
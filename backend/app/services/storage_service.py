@@ -0,0 +1,343 @@
+"""
+Document storage backends.
+
+Blobs are content-addressed: stored under their SHA-256 in a sharded layout
+(ab/cd/abcd...ext) so no directory or key prefix grows unbounded. The backend is
+selected with STORAGE_BACKEND:
+
+- "local": filesystem under STORAGE_LOCAL_DIR (single node, or a shared volume)
+- "s3": S3-compatible object store (AWS S3, MinIO, ...), shared by all API and worker nodes
+
+Writes and reads stream in chunks; callers that need a real file path (Tesseract,
+poppler) use local_path(), which downloads to a temp file for remote backends.
+Resumable uploads keep their partial data in the backend too (partials/<upload_id>),
+so any node can accept the next chunk.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from app.core.config import settings
+
+
+class FileTooLargeError(ValueError):
+    """Raised by a BlobWriter when more than max_size bytes are written."""
+
+
+def shard_key(sha256: str, file_ext: str) -> str:
+    """Storage key for a blob: two levels of 2-hex-char shards, then the full hash."""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{file_ext}"
+
+
+class BlobWriter:
+    """
+    Streams a blob into storage chunk by chunk, computing size and SHA-256 on the fly.
+
+    Data is spooled to a local temp file; commit() moves it to its content-addressed key
+    (skipping the copy if a blob with the same content already exists).
+    """
+
+    def __init__(self, backend: "StorageBackend", file_ext: str, max_size: Optional[int] = None):
+        self.backend = backend
+        self.file_ext = file_ext
+        self.max_size = max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._tmp_path = backend.temp_dir() / f"{uuid.uuid4()}{file_ext}.part"
+        self._file = open(self._tmp_path, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise FileTooLargeError(f"File too large. Maximum size: {self.max_size / 1024 / 1024}MB")
+        self._sha256.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self) -> Tuple[str, int, str]:
+        """Finish the blob. Returns (key, size, sha256 hex)."""
+        self._file.close()
+        sha256 = self._sha256.hexdigest()
+        key = shard_key(sha256, self.file_ext)
+        try:
+            if not self.backend.exists(key):
+                self.backend.put_file(key, self._tmp_path)
+        finally:
+            self._tmp_path.unlink(missing_ok=True)
+        return key, self.size, sha256
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+class PartWriter:
+    """Writes one chunk (PATCH body) of a resumable upload at a given offset."""
+
+    def write(self, chunk: bytes) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Persist what was written so far."""
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        """Discard what was written by this writer."""
+        raise NotImplementedError
+
+
+class StorageBackend:
+    """Interface for document storage backends."""
+
+    def open_writer(self, file_ext: str, max_size: Optional[int] = None) -> BlobWriter:
+        """Start streaming a new blob; see BlobWriter."""
+        return BlobWriter(self, file_ext, max_size)
+
+    def temp_dir(self) -> Path:
+        """Local directory for spooling partial writes."""
+        return Path(tempfile.gettempdir())
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def put_file(self, key: str, path: Path) -> None:
+        """Store a local file under key (the file may be moved or copied)."""
+        raise NotImplementedError
+
+    def open_read(self, key: str) -> BinaryIO:
+        """Open a blob for streaming reads."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def iter_chunks(self, key: str, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+        """Stream a blob in chunks."""
+        chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+        with self.open_read(key) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
+    def open_part_writer(self, upload_id: str, offset: int) -> PartWriter:
+        """Start writing resumable-upload data at offset (the caller tracks and validates offsets)."""
+        raise NotImplementedError
+
+    def iter_partial(self, upload_id: str) -> Iterator[bytes]:
+        """Stream the data received so far for a resumable upload, in offset order."""
+        raise NotImplementedError
+
+    def delete_partial(self, upload_id: str) -> None:
+        raise NotImplementedError
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[str]:
+        """Yield a local filesystem path with the blob's contents (temp copy for remote backends)."""
+        suffix = Path(key).suffix
+        fd, tmp = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in self.iter_chunks(key):
+                    out.write(chunk)
+            yield tmp
+        finally:
+            os.unlink(tmp)
+
+
+class _LocalPartWriter(PartWriter):
+    def __init__(self, path: Path, offset: int):
+        self.offset = offset
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "r+b" if path.exists() else "wb")
+        self._file.seek(offset)
+        self._file.truncate()
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def abort(self) -> None:
+        self._file.truncate(self.offset)
+        self._file.close()
+
+
+class _SpooledPartWriter(PartWriter):
+    """Spools a chunk to a temp file, then stores it as its own blob (for object stores)."""
+
+    def __init__(self, backend: "StorageBackend", key: str):
+        self.backend = backend
+        self.key = key
+        self._tmp_path = backend.temp_dir() / f"{uuid.uuid4()}.part"
+        self._file = open(self._tmp_path, "wb")
+        self._written = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._written += len(chunk)
+
+    def close(self) -> None:
+        self._file.close()
+        try:
+            if self._written:
+                self.backend.put_file(self.key, self._tmp_path)
+        finally:
+            self._tmp_path.unlink(missing_ok=True)
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+class LocalStorage(StorageBackend):
+    """Sharded local filesystem storage."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        path = self.root / key
+        if not path.exists() and Path(key).exists():
+            # Rows from before sharded storage hold a path relative to the working directory
+            return Path(key)
+        return path
+
+    def temp_dir(self) -> Path:
+        tmp = self.root / "tmp"
+        tmp.mkdir(parents=True, exist_ok=True)
+        return tmp
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def put_file(self, key: str, path: Path) -> None:
+        dest = self.root / key
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(path), dest)
+
+    def open_read(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def _partial_path(self, upload_id: str) -> Path:
+        return self.root / "partials" / upload_id
+
+    def open_part_writer(self, upload_id: str, offset: int) -> PartWriter:
+        return _LocalPartWriter(self._partial_path(upload_id), offset)
+
+    def iter_partial(self, upload_id: str) -> Iterator[bytes]:
+        with open(self._partial_path(upload_id), "rb") as f:
+            for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                yield chunk
+
+    def delete_partial(self, upload_id: str) -> None:
+        self._partial_path(upload_id).unlink(missing_ok=True)
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[str]:
+        yield str(self._path(key))
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible object storage (AWS S3, MinIO, ...). Requires boto3."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+    ):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        if not bucket:
+            raise ValueError("S3_BUCKET must be set when STORAGE_BACKEND=s3")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_file(self, key: str, path: Path) -> None:
+        # upload_file switches to multipart uploads for large files
+        self.client.upload_file(str(path), self.bucket, self._key(key))
+
+    def open_read(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def _part_keys(self, upload_id: str) -> list:
+        """Keys of the stored chunks for an upload, in offset order (keys are zero-padded offsets)."""
+        prefix = self._key(f"partials/{upload_id}/")
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []))
+        return sorted(keys)
+
+    def open_part_writer(self, upload_id: str, offset: int) -> PartWriter:
+        # Objects are immutable, so every PATCH is stored as its own object keyed by offset.
+        # Parts at or past the offset are left over from chunks that were not counted (the
+        # request failed after storing them); they would be read back after the new part.
+        for full_key in self._part_keys(upload_id):
+            if int(full_key.rsplit("/", 1)[1]) >= offset:
+                self.client.delete_object(Bucket=self.bucket, Key=full_key)
+        return _SpooledPartWriter(self, f"partials/{upload_id}/{offset:015d}")
+
+    def iter_partial(self, upload_id: str) -> Iterator[bytes]:
+        for full_key in self._part_keys(upload_id):
+            body = self.client.get_object(Bucket=self.bucket, Key=full_key)["Body"]
+            for chunk in iter(lambda: body.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                yield chunk
+
+    def delete_partial(self, upload_id: str) -> None:
+        for full_key in self._part_keys(upload_id):
+            self.client.delete_object(Bucket=self.bucket, Key=full_key)
+
+
+def create_storage() -> StorageBackend:
+    """Create the storage backend selected by STORAGE_BACKEND."""
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage(settings.STORAGE_LOCAL_DIR)
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            bucket=settings.S3_BUCKET,
+            prefix=settings.S3_PREFIX,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+
+
+storage = create_storage()
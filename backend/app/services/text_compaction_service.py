@@ -0,0 +1,170 @@
+"""
+Compaction of OCR text before it is sent to the LLM.
+
+Raw OCR text repeats page headers and footers on every page, carries whitespace
+runs, page numbers and legal boilerplate (terms, late payment interest, privacy
+notices), all of which cost prompt tokens and latency without helping the
+suggestion. compact():
+
+1. normalizes whitespace and drops empty lines,
+2. drops lines already seen on an earlier page (headers/footers repeated per page;
+   pages are separated by form feeds, see OCRService.join_pages). Lines with amounts
+   are never dropped, so repeated invoice lines ("Konsulenttime 1 950,00") stay,
+3. drops boilerplate lines (page numbers, legal text, links, OCR noise),
+4. if the text is still over AI_PROMPT_TOKEN_BUDGET tokens, keeps lines by priority
+   until the budget is used: the document header (vendor name) and lines with
+   dates, org numbers, account numbers/IBAN/KID, company names or invoice labels
+   (totals, VAT, due date) first, then other lines with amounts (invoice lines),
+   then neighbours of those lines (labels printed above a value), then the rest.
+   Kept lines stay in document order.
+
+Boilerplate patterns only apply to lines without key data, so e.g. a payment
+terms line that states the due date or terms ("14 dager netto") is kept.
+
+Tokens are counted with tiktoken (the model's encoding) when it is installed;
+otherwise they are estimated at 4 characters per token.
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import math
+import re
+from app.core.config import settings
+from app.services.ai_service import AIService
+
+# Lines at the top of the document that are always kept first (vendor name and address)
+HEADER_LINES = 5
+
+_AMOUNT = r"\d[\d .]*,\d{2}\b|\b\d+\.\d{2}\b|\b(?:nok|kr|eur|usd|sek|dkk)\b"
+_DATE = r"\b\d{1,2}[./-]\d{1,2}[./-]\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b"
+_ORG_NUMBER = r"\b\d{3} ?\d{3} ?\d{3}\b|\borg\.? ?nr|\borganisasjonsnummer|\bforetaksregisteret"
+_ACCOUNT = r"\b\d{4}[ .]?\d{2}[ .]?\d{5}\b|\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}\b|\b(?:kid|iban|bic|swift|konto(?:nr|nummer)?)\b"
+# Company form at the end of a name ("Hønefoss Elektro AS", "Firma ASA, Bergen")
+_COMPANY = r"\b(?:as|asa|ans|da|enk|sa|nuf|ab|aps|oy|gmbh|ltd|inc)\b(?=\s*(?:$|[,.(]))"
+_LABEL = r"\b(?:faktura\w*|invoice|mva|vat|sum|total\w*|beløp|å betale|amount|forfall\w*|due|dato|date)\b"
+# Payment terms ("Betalingsbetingelser: 14 dager netto", "Net 30")
+_TERMS = r"\b\d+\s*(?:dager|days)\b|\bnetto\b|\bnet\s*\d+\b"
+IDENTIFIER_PATTERN = re.compile("|".join([_DATE, _ORG_NUMBER, _ACCOUNT, _COMPANY, _LABEL, _TERMS]), re.IGNORECASE)
+AMOUNT_PATTERN = re.compile(_AMOUNT, re.IGNORECASE)
+
+BOILERPLATE_PATTERN = re.compile(
+    r"^(?:side|page|s\.)\s*\d+\s*(?:av|of|/)\s*\d+$"
+    r"|^\d+\s*/\s*\d+$"
+    r"|^[\W_]{1,}$"
+    r"|^\S{1,2}$"
+    r"|betingelser|vilkår|terms and conditions|forsinkelsesrente|purregebyr|inkasso|angrerett|reklamasjon"
+    r"|personopplysninger|personvern|gdpr|privacy|https?://|www\.",
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional[Any]:
+    """The model's tiktoken encoding, or None if tiktoken is not installed (or its encoding cannot be loaded)."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(AIService.MODEL)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+
+class TextCompactionService:
+    """Service for reducing OCR text to what the LLM needs, within a token budget."""
+
+    @staticmethod
+    def tokenizer_name() -> str:
+        encoding = _encoding()
+        return f"tiktoken {encoding.name}" if encoding is not None else "estimate (4 chars/token)"
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        """Prompt tokens of the text (tiktoken if installed, else an estimate)."""
+        encoding = _encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+        return math.ceil(len(text) / 4)
+
+    @staticmethod
+    def is_key_line(line: str) -> bool:
+        """True if the line holds an amount, date, org number, account number, company name or invoice label."""
+        return IDENTIFIER_PATTERN.search(line) is not None or AMOUNT_PATTERN.search(line) is not None
+
+    @staticmethod
+    def is_boilerplate(line: str) -> bool:
+        return BOILERPLATE_PATTERN.search(line) is not None and not TextCompactionService.is_key_line(line)
+
+    @staticmethod
+    def _fit_budget(lines: List[str], budget: int) -> List[str]:
+        """Lines to keep within budget tokens, by priority (header and identifiers, amounts, their neighbours, the rest), in document order."""
+        priority = [
+            0 if i < HEADER_LINES or IDENTIFIER_PATTERN.search(line) else 1 if AMOUNT_PATTERN.search(line) else 3
+            for i, line in enumerate(lines)
+        ]
+        for i in range(len(lines)):
+            if priority[i] == 3 and ((i > 0 and priority[i - 1] < 2) or (i + 1 < len(lines) and priority[i + 1] < 2)):
+                priority[i] = 2
+        # One extra token per line for the line break
+        cost = [TextCompactionService.count_tokens(line) + 1 for line in lines]
+        kept = set()
+        used = 0
+        for level in (0, 1, 2, 3):
+            for i in range(len(lines)):
+                if priority[i] == level and used + cost[i] <= budget:
+                    kept.add(i)
+                    used += cost[i]
+        return [line for i, line in enumerate(lines) if i in kept]
+
+    @staticmethod
+    def compact(text: str, budget: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Compact OCR text for the prompt. Returns (compacted text, stats).
+
+        budget: token budget (default AI_PROMPT_TOKEN_BUDGET; 0 = none). stats has
+        tokens_before/after, lines_before/after, lines dropped per reason and the tokenizer.
+        """
+        budget = settings.AI_PROMPT_TOKEN_BUDGET if budget is None else budget
+        raw_lines = text.splitlines()
+        pages = [
+            [line for line in (" ".join(raw.split()) for raw in page.splitlines()) if line]
+            for page in text.split("\f")
+        ]
+        lines = [line for page in pages for line in page]
+
+        first_page: Dict[str, int] = {}
+        for number, page in enumerate(pages):
+            for line in page:
+                first_page.setdefault(line.casefold(), number)
+        unique = [
+            line
+            for number, page in enumerate(pages)
+            for line in page
+            if first_page[line.casefold()] == number or AMOUNT_PATTERN.search(line)
+        ]
+        content = [line for line in unique if not TextCompactionService.is_boilerplate(line)]
+
+        compacted = "\n".join(content)
+        within_budget = content
+        if budget and TextCompactionService.count_tokens(compacted) > budget:
+            within_budget = TextCompactionService._fit_budget(content, budget)
+            compacted = "\n".join(within_budget)
+
+        stats = {
+            "tokenizer": TextCompactionService.tokenizer_name(),
+            "token_budget": budget,
+            "tokens_before": TextCompactionService.count_tokens(text),
+            "tokens_after": TextCompactionService.count_tokens(compacted),
+            "lines_before": len(raw_lines),
+            "lines_after": len(within_budget),
+            "dropped_duplicate": len(lines) - len(unique),
+            "dropped_boilerplate": len(unique) - len(content),
+            "dropped_budget": len(content) - len(within_budget),
+        }
+        return compacted, stats
+
+
+text_compaction_service = TextCompactionService()
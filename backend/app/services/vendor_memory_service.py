@@ -0,0 +1,332 @@
+"""
+Vendor memory: account and VAT code bookings learned from approved suggestions.
+
+Most invoices come from recurring vendors whose invoices always get the same
+account and VAT code once approved. Each approval or rejection of a suggestion
+is counted per vendor identifier found in the invoice's OCR text:
+
+- org_number:   Norwegian organization number (mod 11 check digit validated)
+- iban:         IBAN (mod 97 validated)
+- bank_account: Norwegian 11-digit bank account number on a "konto"/"account" line (mod 11 validated)
+- name:         normalized company name from the document header (line ending in AS, ASA, ...)
+
+Invoices also print the recipient, i.e. the accounting firm's client, often with its
+own org number. Identifiers are therefore only taken from the vendor's context: the
+recipient block (a "Fakturamottaker", "Kunde", "Leveringsadresse", ... heading and the
+lines after it, up to a blank line) and other lines naming the customer are skipped,
+and org numbers count only in the header (above the first recipient heading) or on
+lines that mark the seller's registration ("Foretaksregisteret", "MVA").
+
+Counts are kept per tenant (users.tenant of the uploading users, like admission
+control); users without a tenant (public mail domains) each have their own memory.
+
+lookup() scores the most approved booking of each identifier found in a new
+invoice with a smoothed (Laplace) estimate of the chance it gets approved:
+
+    confidence = weight(identifier type) * (approvals + 1) / (all approvals for the identifier + rejections + 2)
+
+so a vendor booked the same way 3 times scores 0.8 by org number, and bookings that
+vary or get rejected score lower. A match is strong enough to skip the LLM with
+VENDOR_MEMORY_MIN_APPROVALS approvals and VENDOR_MEMORY_MIN_CONFIDENCE, and only if
+an org number, IBAN or bank account confirms the booking (a name alone is easy to
+print on a forged invoice). It is a conflict, and never strong, if another identifier
+in the document points to a different booking, or if a bank account or IBAN in the
+document was never approved in this memory: changed payment details on a known
+vendor's invoice are the classic invoice fraud, so rule validation flags them as
+high risk.
+"""
+from collections import defaultdict
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Tuple
+import re
+from app.db import models
+from app.core.config import settings
+
+# Weight of each identifier type in the confidence (names are the least specific)
+IDENTIFIER_WEIGHTS = {"org_number": 1.0, "iban": 0.98, "bank_account": 0.98, "name": 0.9}
+# Identifiers the vendor is paid to; unknown ones on a matched vendor's invoice are a conflict
+ACCOUNT_IDENTIFIERS = ("iban", "bank_account")
+# Non-empty lines at the top of the document searched for the vendor name
+NAME_LINES = 5
+# Non-empty lines after a recipient heading that belong to the recipient block (name, address, org number)
+RECIPIENT_LINES = 6
+
+_CUSTOMER_LINE = re.compile(r"\b(?:kunde\w*|customer|kjøper|buyer|leveringsadresse|fakturaadresse|deres)\b", re.IGNORECASE)
+# Heading of the recipient block ("Fakturamottaker:", "Kunde: Klient Holding AS", "Bill to")
+_RECIPIENT_HEADING = re.compile(
+    r"^(?:(?:faktura|vare)?mottaker|kunde|customer|kjøper|buyer|leveringsadresse|fakturaadresse"
+    r"|faktura til|levert til|bill(?:ed)? to|sold to|ship to)\b",
+    re.IGNORECASE,
+)
+# Lines stating the seller's registration; their org number is the vendor's wherever they are printed
+_SELLER_REGISTRATION = re.compile(r"foretaksregisteret|\bmva\b", re.IGNORECASE)
+_ORG_NUMBER = re.compile(
+    r"(?:org\.?\s*(?:nr|nummer)\.?|organisasjonsnummer|foretaksregisteret|\bNO)\s*:?\s*(\d{3}\s?\d{3}\s?\d{3})(?!\s?\d)",
+    re.IGNORECASE,
+)
+_ACCOUNT_LINE = re.compile(r"konto|account|bank", re.IGNORECASE)
+_BANK_ACCOUNT = re.compile(r"(?<![\d.])(\d{4})[ .]?(\d{2})[ .]?(\d{5})(?![\d.])")
+_IBAN = re.compile(r"\b([A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?)\b")
+_COMPANY_NAME = re.compile(r"^(.*\w.*\b(?:as|asa|ans|da|enk|sa|nuf|ab|aps|oy|gmbh|ltd|inc))\.?$", re.IGNORECASE)
+
+
+def _mod11_valid(digits: str, weights: List[int]) -> bool:
+    remainder = 11 - sum(int(d) * w for d, w in zip(digits, weights)) % 11
+    check = 0 if remainder == 11 else remainder
+    return check != 10 and check == int(digits[-1])
+
+
+def _iban_valid(iban: str) -> bool:
+    if not 15 <= len(iban) <= 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+
+class VendorMemoryService:
+    """Service for learning and looking up vendor bookings."""
+
+    @staticmethod
+    def _vendor_lines(ocr_text: str) -> List[Tuple[str, bool]]:
+        """Non-empty lines outside recipient blocks and customer lines, as (line, in header)."""
+        vendor_lines: List[Tuple[str, bool]] = []
+        header = True
+        recipient_lines = 0  # lines left in the current recipient block
+        for raw in ocr_text.splitlines():
+            line = " ".join(raw.split())
+            if not line:
+                recipient_lines = 0
+                continue
+            if _RECIPIENT_HEADING.match(line):
+                header = False
+                recipient_lines = RECIPIENT_LINES
+                continue
+            if _CUSTOMER_LINE.search(line):
+                # Customer number, "Deres ref." and the like
+                continue
+            if recipient_lines:
+                recipient_lines -= 1
+                continue
+            vendor_lines.append((line, header))
+        return vendor_lines
+
+    @staticmethod
+    def extract_identifiers(ocr_text: str) -> List[Tuple[str, str]]:
+        """Vendor identifiers (type, normalized value) in OCR text, in document order, without duplicates."""
+        found: List[Tuple[str, str]] = []
+        vendor_lines = VendorMemoryService._vendor_lines(ocr_text)
+
+        for line, in_header in vendor_lines[:NAME_LINES]:
+            match = _COMPANY_NAME.match(line) if in_header else None
+            if match:
+                found.append(("name", " ".join(re.sub(r"[^\w]+", " ", match.group(1).casefold()).split())))
+                break
+
+        for line, in_header in vendor_lines:
+            org_numbers = _ORG_NUMBER.finditer(line) if in_header or _SELLER_REGISTRATION.search(line) else ()
+            for match in org_numbers:
+                digits = re.sub(r"\s", "", match.group(1))
+                if _mod11_valid(digits, [3, 2, 7, 6, 5, 4, 3, 2]):
+                    found.append(("org_number", digits))
+            for match in _IBAN.finditer(line):
+                iban = match.group(1).replace(" ", "")
+                if _iban_valid(iban):
+                    found.append(("iban", iban))
+            if _ACCOUNT_LINE.search(line):
+                for match in _BANK_ACCOUNT.finditer(line):
+                    digits = "".join(match.groups())
+                    if _mod11_valid(digits, [5, 4, 3, 2, 7, 6, 5, 4, 3, 2]):
+                        found.append(("bank_account", digits))
+
+        return list(dict.fromkeys(found))
+
+    @staticmethod
+    def memory_key(tenant: Optional[str], user_id: int) -> str:
+        """Whose vendor memory an invoice uses: the uploader's tenant, or the uploader alone without one."""
+        return tenant or f"user:{user_id}"
+
+    @staticmethod
+    def tenant_of_invoice(db: Session, invoice: models.Invoice) -> Optional[str]:
+        """Vendor memory key of the invoice's uploader (see memory_key), or None if the uploader is unknown."""
+        user = db.query(models.User).filter(models.User.id == invoice.uploaded_by).first()
+        return VendorMemoryService.memory_key(user.tenant, user.id) if user else None
+
+    @staticmethod
+    def lookup_invoice(db: Session, invoice: models.Invoice, ocr_text: str) -> Optional[Dict[str, Any]]:
+        """lookup() in the vendor memory of the invoice's uploader, or None."""
+        tenant = VendorMemoryService.tenant_of_invoice(db, invoice)
+        identifiers = VendorMemoryService.extract_identifiers(ocr_text)
+        return VendorMemoryService.lookup(db, tenant, identifiers) if tenant else None
+
+    @staticmethod
+    def _apply(
+        db: Session,
+        tenant: str,
+        identifiers: List[Tuple[str, str]],
+        account_number: str,
+        vat_code: str,
+        approved_delta: int,
+        rejected_delta: int,
+    ) -> None:
+        for identifier_type, identifier in identifiers:
+            entry = db.query(models.VendorMemoryEntry).filter(
+                models.VendorMemoryEntry.tenant == tenant,
+                models.VendorMemoryEntry.identifier_type == identifier_type,
+                models.VendorMemoryEntry.identifier == identifier,
+                models.VendorMemoryEntry.account_number == account_number,
+                models.VendorMemoryEntry.vat_code == vat_code,
+            ).first()
+            if entry is None:
+                entry = models.VendorMemoryEntry(
+                    tenant=tenant,
+                    identifier_type=identifier_type,
+                    identifier=identifier,
+                    account_number=account_number,
+                    vat_code=vat_code,
+                    approved_count=0,
+                    rejected_count=0,
+                )
+                db.add(entry)
+            entry.approved_count = max(0, entry.approved_count + approved_delta)
+            entry.rejected_count = max(0, entry.rejected_count + rejected_delta)
+
+    @staticmethod
+    def record_decision(
+        db: Session,
+        invoice: models.Invoice,
+        suggestion: models.Suggestion,
+        previous_status: models.ApprovalStatus,
+    ) -> None:
+        """Count an approval/rejection of the suggestion (undoing the previous decision if it is changed)."""
+        if not suggestion.account_number or not invoice.ocr_text:
+            return
+        current = suggestion.approval_status
+        if current == previous_status:
+            return
+        approved_delta = (current == models.ApprovalStatus.APPROVED) - (previous_status == models.ApprovalStatus.APPROVED)
+        rejected_delta = (current == models.ApprovalStatus.REJECTED) - (previous_status == models.ApprovalStatus.REJECTED)
+        identifiers = VendorMemoryService.extract_identifiers(invoice.ocr_text)
+        tenant = VendorMemoryService.tenant_of_invoice(db, invoice)
+        if not identifiers or tenant is None:
+            return
+        args = (db, tenant, identifiers, suggestion.account_number, suggestion.vat_code or "", approved_delta, rejected_delta)
+        VendorMemoryService._apply(*args)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another approval created the same entry concurrently; it exists now
+            db.rollback()
+            VendorMemoryService._apply(*args)
+            db.commit()
+
+    @staticmethod
+    def lookup(db: Session, tenant: str, identifiers: List[Tuple[str, str]]) -> Optional[Dict[str, Any]]:
+        """
+        Best known booking for the identifiers, or None.
+
+        Returns {"account_number", "vat_code", "confidence", "approvals", "identifier_type",
+        "identifier", "unknown_accounts", "conflict", "strong"}; strong means the LLM can be skipped.
+        unknown_accounts lists the bank accounts and IBANs in the identifiers that were never approved.
+        """
+        if not identifiers:
+            return None
+        entries = db.query(models.VendorMemoryEntry).filter(
+            models.VendorMemoryEntry.tenant == tenant,
+            models.VendorMemoryEntry.identifier.in_([identifier for _, identifier in identifiers]),
+        ).all()
+        by_identifier: Dict[Tuple[str, str], List[models.VendorMemoryEntry]] = defaultdict(list)
+        for entry in entries:
+            by_identifier[(entry.identifier_type, entry.identifier)].append(entry)
+
+        candidates = []
+        for key in identifiers:
+            bookings = by_identifier.get(key)
+            if not bookings:
+                continue
+            top = max(bookings, key=lambda entry: (entry.approved_count, -entry.rejected_count))
+            if not top.approved_count:
+                continue
+            total_approved = sum(entry.approved_count for entry in bookings)
+            confidence = IDENTIFIER_WEIGHTS[key[0]] * (top.approved_count + 1) / (total_approved + top.rejected_count + 2)
+            candidates.append((confidence, key, top))
+        if not candidates:
+            return None
+
+        confidence, (identifier_type, identifier), top = max(candidates, key=lambda candidate: candidate[0])
+        booking = (top.account_number, top.vat_code)
+        unknown_accounts = [
+            identifier
+            for identifier_type, identifier in identifiers
+            if identifier_type in ACCOUNT_IDENTIFIERS
+            and not any(entry.approved_count for entry in by_identifier.get((identifier_type, identifier), []))
+        ]
+        conflict = bool(unknown_accounts) or any(
+            (other.account_number, other.vat_code) != booking and other.approved_count >= settings.VENDOR_MEMORY_MIN_APPROVALS
+            for _, _, other in candidates
+        )
+        confirmed = any(
+            other_type != "name" and (other.account_number, other.vat_code) == booking
+            for _, (other_type, _), other in candidates
+        )
+        return {
+            "account_number": top.account_number,
+            "vat_code": top.vat_code or None,
+            "confidence": round(confidence, 3),
+            "approvals": top.approved_count,
+            "identifier_type": identifier_type,
+            "identifier": identifier,
+            "unknown_accounts": unknown_accounts,
+            "conflict": conflict,
+            "strong": (
+                not conflict
+                and confirmed
+                and top.approved_count >= settings.VENDOR_MEMORY_MIN_APPROVALS
+                and confidence >= settings.VENDOR_MEMORY_MIN_CONFIDENCE
+            ),
+        }
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Recount the whole vendor memory from approved and rejected suggestions. Returns entries written."""
+        counts: Dict[Tuple[str, str, str, str, str], List[int]] = defaultdict(lambda: [0, 0])
+        rows = db.query(
+            models.Suggestion.account_number,
+            models.Suggestion.vat_code,
+            models.Suggestion.approval_status,
+            models.Invoice.ocr_text,
+            models.User.tenant,
+            models.User.id,
+        ).join(
+            models.Invoice, models.Invoice.id == models.Suggestion.invoice_id
+        ).join(
+            models.User, models.User.id == models.Invoice.uploaded_by
+        ).filter(
+            models.Suggestion.approval_status.in_([models.ApprovalStatus.APPROVED, models.ApprovalStatus.REJECTED]),
+            models.Suggestion.account_number.isnot(None),
+            models.Invoice.ocr_text.isnot(None),
+        ).yield_per(500)
+        for account_number, vat_code, approval_status, ocr_text, user_tenant, user_id in rows:
+            tenant = VendorMemoryService.memory_key(user_tenant, user_id)
+            column = 0 if approval_status == models.ApprovalStatus.APPROVED else 1
+            for identifier_type, identifier in VendorMemoryService.extract_identifiers(ocr_text):
+                counts[(tenant, identifier_type, identifier, account_number, vat_code or "")][column] += 1
+
+        db.query(models.VendorMemoryEntry).delete(synchronize_session=False)
+        db.bulk_insert_mappings(models.VendorMemoryEntry, [
+            {
+                "tenant": tenant,
+                "identifier_type": identifier_type,
+                "identifier": identifier,
+                "account_number": account_number,
+                "vat_code": vat_code,
+                "approved_count": approved,
+                "rejected_count": rejected,
+            }
+            for (tenant, identifier_type, identifier, account_number, vat_code), (approved, rejected) in counts.items()
+        ])
+        db.commit()
+        return len(counts)
+
+
+vendor_memory_service = VendorMemoryService()
@@ -4,17 +4,20 @@ Workflow engine: Zapier/Make-style steps with safe dataflow.
 - Data moves only through a single context dict; each step has allowed inputs/outputs.
 - Every step run and every external call is audited.
 - Steps cannot read or write outside their allowed keys.
+- Steps may be async (e.g. LLM calls); run_workflow_async awaits them on the event loop.
 """
-from typing import Dict, Any, List, Callable, Optional
+from typing import Dict, Any, List, Callable, Optional, Awaitable, Union
 from sqlalchemy.orm import Session
+import asyncio
 import time
 
 from app.db import models
-from app.services import audit_service
+from app.core.executors import run_io
+from app.services.audit_service import audit_service
 
 
-# Type for a step runner: (context, db) -> context_updates
-StepRunner = Callable[[Dict[str, Any], Session], Dict[str, Any]]
+# Type for a step runner: (context, db) -> context_updates, or a coroutine function returning them
+StepRunner = Callable[[Dict[str, Any], Session], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]]
 
 
 class StepDef:
@@ -46,7 +49,43 @@ def _validate_output(updates: Dict[str, Any], allowed_outputs: List[str]) -> Non
             raise ValueError(f"Step produced disallowed output key: {k}")
 
 
-def run_workflow(
+def _log_step(
+    db: Session,
+    trigger: str,
+    step: StepDef,
+    input_keys: List[str],
+    duration_ms: float,
+    user_id: Optional[int],
+    invoice_id: Optional[int],
+    output_keys: Optional[List[str]] = None,
+    error: Optional[Exception] = None,
+) -> None:
+    """Audit one step run (success with its output keys, or failure with the error)."""
+    metadata: Dict[str, Any] = {
+        "trigger": trigger,
+        "step": step.name,
+        "input_keys": input_keys,
+        "output_keys": output_keys or [],
+        "success": error is None,
+    }
+    if error is not None:
+        metadata["error"] = str(error)
+    metadata["duration_ms"] = round(duration_ms, 2)
+    audit_service.log_action(
+        db=db,
+        action="workflow_step",
+        user_id=user_id,
+        invoice_id=invoice_id,
+        metadata=metadata,
+    )
+
+
+def is_async_step(step: StepDef) -> bool:
+    """True if the step's runner is a coroutine function (awaited by run_workflow_async)."""
+    return asyncio.iscoroutinefunction(step.run)
+
+
+async def run_workflow_async(
     trigger: str,
     context: Dict[str, Any],
     steps: List[StepDef],
@@ -61,6 +100,8 @@ def run_workflow(
     - steps: list of StepDef. Each step receives only allowed_inputs from context,
       returns a dict of allowed_outputs which are merged into context for the next step.
     - user_id / invoice_id: used for audit logs.
+    Runs on the caller's event loop (the worker): async steps are awaited on it, sync
+    steps and the audit writes run in the io pool so they do not block it.
     Returns final context.
     """
     for step in steps:
@@ -68,40 +109,18 @@ def run_workflow(
         input_keys = [k for k in step.allowed_inputs if k in context]
         try:
             step_input = _filter_context(context, step.allowed_inputs)
-            updates = step.run(step_input, db)
+            if is_async_step(step):
+                updates = await step.run(step_input, db)
+            else:
+                updates = await run_io(step.run, step_input, db)
             _validate_output(updates, step.allowed_outputs)
             context.update(updates)
             duration_ms = (time.time() - start) * 1000
-            audit_service.log_action(
-                db=db,
-                action="workflow_step",
-                user_id=user_id,
-                invoice_id=invoice_id,
-                metadata={
-                    "trigger": trigger,
-                    "step": step.name,
-                    "input_keys": input_keys,
-                    "output_keys": list(updates.keys()),
-                    "success": True,
-                    "duration_ms": round(duration_ms, 2),
-                },
+            await run_io(
+                _log_step, db, trigger, step, input_keys, duration_ms, user_id, invoice_id, output_keys=list(updates.keys())
             )
         except Exception as e:
             duration_ms = (time.time() - start) * 1000
-            audit_service.log_action(
-                db=db,
-                action="workflow_step",
-                user_id=user_id,
-                invoice_id=invoice_id,
-                metadata={
-                    "trigger": trigger,
-                    "step": step.name,
-                    "input_keys": input_keys,
-                    "output_keys": [],
-                    "success": False,
-                    "error": str(e),
-                    "duration_ms": round(duration_ms, 2),
-                },
-            )
+            await run_io(_log_step, db, trigger, step, input_keys, duration_ms, user_id, invoice_id, error=e)
             raise
     return context
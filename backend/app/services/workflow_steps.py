@@ -4,17 +4,32 @@ Default workflow steps for the invoice pipeline (safe dataflow).
 Each step has declared allowed_inputs and allowed_outputs; the workflow engine
 enforces that only these keys are read from / written to the context.
 """
-from typing import Dict, Any, List
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from sqlalchemy.orm import Session
+import json
+import uuid
 
 from app.db import models
+from app.core.config import settings
+from app.core.executors import cpu_pool, run_io
+from app.services.image_normalization_service import image_normalization_service
 from app.services.ocr_service import ocr_service
+from app.services.ocr_cache_service import ocr_cache_service
 from app.services.ai_service import ai_service
+from app.services.ai_cache_service import ai_cache_service
+from app.services.ai_batch_service import ai_batch_service
+from app.services.text_compaction_service import text_compaction_service
+from app.services.vendor_memory_service import vendor_memory_service
 from app.services.rule_validation_service import rule_validation_service
 from app.services.confidence_scoring_service import confidence_scoring_service
 from app.services.audit_service import audit_service
+from app.services.storage_service import storage
 from app.services.workflow_engine import StepDef
 
+TRUNCATED_OCR_NOTE = "OCR incomplete: the document exceeded the OCR page limit or time budget, so only part of it was read."
+UNKNOWN_VENDOR_ACCOUNT_NOTE = "Payment details changed: a known vendor's invoice names a bank account or IBAN never approved for it."
+
 
 def _get_invoice(db: Session, invoice_id: int) -> models.Invoice:
     invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
@@ -23,47 +38,291 @@ def _get_invoice(db: Session, invoice_id: int) -> models.Invoice:
     return invoice
 
 
+def _get_prior_ai_result(db: Session, duplicate_of_id: Optional[int], ocr_text: str) -> Optional[Dict[str, Any]]:
+    """AI result of the original invoice for a duplicate document, if it ran on the same OCR text."""
+    if not duplicate_of_id:
+        return None
+    original = db.query(models.Invoice).filter(models.Invoice.id == duplicate_of_id).first()
+    if not original or original.ocr_text != ocr_text:
+        return None
+    suggestion = db.query(models.Suggestion).filter(
+        models.Suggestion.invoice_id == duplicate_of_id,
+        models.Suggestion.ai_response.isnot(None)
+    ).order_by(models.Suggestion.id.desc()).first()
+    return json.loads(suggestion.ai_response) if suggestion else None
+
+
+@contextmanager
+def _ocr_source(db: Session, invoice_id: int, file_path: str, mime_type: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (local path, mime type) of the file to OCR. Photos are normalized (grayscale, downscaled)
+    into temp space first; the derivative is never stored, only the original document is kept.
+    """
+    with storage.local_path(file_path) as local_path:
+        if not settings.IMAGE_NORMALIZE_ENABLED or not mime_type.startswith("image/"):
+            yield local_path, mime_type
+            return
+        tmp_path = storage.temp_dir() / f"{uuid.uuid4()}.png"
+        try:
+            try:
+                stats = cpu_pool.submit(image_normalization_service.normalize, local_path, str(tmp_path)).result()
+            except OSError as e:
+                # Unreadable for PIL: OCR the original file
+                audit_service.log_action(
+                    db=db, action="image_normalization_failed", invoice_id=invoice_id, metadata={"error": str(e)}
+                )
+                yield local_path, mime_type
+                return
+            audit_service.log_action(db=db, action="image_normalized", invoice_id=invoice_id, metadata=stats)
+            yield str(tmp_path), "image/png"
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+
+def _save_ocr_layout(db: Session, invoice_id: int, layout: List[Dict[str, Any]]) -> None:
+    """Store (replace) the word-level OCR layout of an invoice."""
+    db.query(models.OCRLayout).filter(models.OCRLayout.invoice_id == invoice_id).delete(synchronize_session=False)
+    if layout:
+        db.add(models.OCRLayout(
+            invoice_id=invoice_id,
+            page_count=len(layout),
+            word_count=sum(len(page["words"]) for page in layout),
+            data=ocr_service.pack_layout(layout),
+        ))
+
+
 def step_ocr(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
-    """Extract text from invoice file. Allowed in: invoice_id, file_path, mime_type. Out: ocr_text."""
+    """Extract text and word layout from invoice file (or reuse them from a duplicate). Allowed in: invoice_id, file_path (storage key), mime_type, duplicate_of_id. Out: ocr_text, ocr_layout."""
     invoice_id = ctx["invoice_id"]
     file_path = ctx["file_path"]
     mime_type = ctx["mime_type"]
+    duplicate_of_id = ctx.get("duplicate_of_id")
     invoice = _get_invoice(db, invoice_id)
     invoice.status = models.ProcessingStatus.PROCESSING
     db.commit()
 
-    ocr_text = ocr_service.extract_text(file_path, mime_type)
-    audit_service.log_ocr_complete(db=db, invoice_id=invoice_id, ocr_output=ocr_text)
+    original = _get_invoice(db, duplicate_of_id) if duplicate_of_id else None
+    if original and original.ocr_text is not None:
+        ocr_text = original.ocr_text
+        original_layout = db.query(models.OCRLayout).filter(models.OCRLayout.invoice_id == original.id).first()
+        layout = ocr_service.unpack_layout(original_layout.data) if original_layout else []
+        ocr_truncated = original.ocr_truncated
+        metadata = {"reused_from_invoice_id": original.id, "truncated": ocr_truncated}
+    else:
+        pages = ocr_cache_service.get(db, invoice.content_hash)
+        cache_hit = pages is not None
+        if not cache_hit:
+            with _ocr_source(db, invoice_id, file_path, mime_type) as (local_path, source_mime_type):
+                # Pages are OCR'd in the cpu process pool; this thread only waits
+                pages = ocr_service.extract_pages(local_path, source_mime_type, db=db)
+            ocr_cache_service.put(db, invoice.content_hash, pages)
+        ocr_text = ocr_service.join_pages(pages)
+        ocr_truncated = ocr_service.is_truncated(pages)
+        # Word layout of OCR'd pages (text-layer pages have none)
+        layout = [{"page": page["page"], **page["layout"]} for page in pages if page.get("layout")]
+        metadata = {
+            "cache_hit": cache_hit,
+            "pages": len(pages),
+            "text_layer_pages": sum(1 for page in pages if page["source"] == "text_layer"),
+            "failed_pages": [page["page"] for page in pages if "error" in page],
+            "ocr_dpi": {str(page["page"]): page["dpi"] for page in pages if page.get("dpi")},
+            "truncated": ocr_truncated,
+            "page_cache_hits": [page["page"] for page in pages if page.get("page_cache_hit")],
+        }
+        if ocr_truncated:
+            skipped: Dict[str, List[int]] = {}
+            for page in pages:
+                if "skipped" in page:
+                    skipped.setdefault(page["skipped"], []).append(page["page"])
+            metadata["skipped_pages"] = skipped
+        preprocessed = [page for page in pages if page.get("preprocess")]
+        if preprocessed:
+            stages = preprocessed[0]["preprocess"]["ms"]
+            metadata["preprocess_ms"] = {
+                stage: round(sum(page["preprocess"]["ms"][stage] for page in preprocessed), 1) for stage in stages
+            }
+            metadata["skew_angles"] = {str(page["page"]): page["preprocess"]["skew_angle"] for page in preprocessed}
+    audit_service.log_ocr_complete(db=db, invoice_id=invoice_id, ocr_output=ocr_text, metadata=metadata)
 
+    invoice.ocr_text = ocr_text
+    invoice.ocr_truncated = ocr_truncated
+    _save_ocr_layout(db, invoice_id, layout)
     invoice.status = models.ProcessingStatus.OCR_COMPLETE
     db.commit()
-    return {"ocr_text": ocr_text}
+    return {"ocr_text": ocr_text, "ocr_layout": layout, "ocr_truncated": ocr_truncated}
 
 
-def step_ai_suggestion(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
-    """Call AI for accounting suggestion. In: ocr_text. Out: ai_result (dict). External – audited."""
+def step_compact_text(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
+    """Compact OCR text for the LLM prompt (whitespace, duplicate and boilerplate lines, AI_PROMPT_TOKEN_BUDGET). In: ocr_text, invoice_id. Out: prompt_text."""
     ocr_text = ctx["ocr_text"]
+    if not settings.AI_COMPACTION_ENABLED:
+        return {"prompt_text": ocr_text}
+    prompt_text, stats = text_compaction_service.compact(ocr_text)
+    if ctx.get("invoice_id"):
+        audit_service.log_action(
+            db=db,
+            action="ocr_text_compacted",
+            invoice_id=ctx["invoice_id"],
+            metadata=stats,
+        )
+    return {"prompt_text": prompt_text}
+
+
+def step_vendor_memory(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
+    """Suggest the vendor's approved account/VAT code when vendor memory has a strong match (the LLM is then skipped). In: ocr_text, invoice_id. Out: ai_result (on a strong match), vendor_unknown_accounts (bank accounts/IBANs of a known vendor never approved)."""
     invoice_id = ctx.get("invoice_id")
+    if not settings.VENDOR_MEMORY_ENABLED or not invoice_id:
+        return {}
+    match = vendor_memory_service.lookup_invoice(db, _get_invoice(db, invoice_id), ctx["ocr_text"])
+    if match is None:
+        return {}
+    if match["unknown_accounts"]:
+        audit_service.log_action(
+            db=db,
+            action="vendor_account_unknown",
+            invoice_id=invoice_id,
+            metadata={key: match[key] for key in ("identifier_type", "identifier", "unknown_accounts")},
+        )
+        return {"vendor_unknown_accounts": match["unknown_accounts"]}
+    if not match["strong"]:
+        return {}
+
+    ai_result = {
+        "account_number": match["account_number"],
+        "vat_code": match["vat_code"],
+        "confidence": match["confidence"],
+        "risk_level": "low",
+        "reasoning": (
+            f"Vendor memory: {match['approvals']} approved invoices from this vendor "
+            f"({match['identifier_type']} {match['identifier']}) were booked to account "
+            f"{match['account_number']} with VAT code {match['vat_code']}."
+        ),
+        "source": "vendor_memory",
+    }
+    audit_service.log_action(
+        db=db,
+        action="vendor_memory_hit",
+        invoice_id=invoice_id,
+        ai_response=str(ai_result),
+        metadata={key: match[key] for key in ("identifier_type", "identifier", "approvals", "confidence")},
+    )
+    return {"ai_result": ai_result}
+
+
+def _begin_ai_suggestion(
+    db: Session, invoice_id: Optional[int], duplicate_of_id: Optional[int], ocr_text: str, prompt_text: str
+) -> Optional[Dict[str, Any]]:
+    """Mark the invoice as in AI processing; returns the duplicate's or cached AI result to reuse (audited), if any.
+
+    Duplicates are matched on the full OCR text, the cache on the prompt text.
+    """
     invoice = _get_invoice(db, invoice_id) if invoice_id else None
     if invoice:
         invoice.status = models.ProcessingStatus.AI_PROCESSING
         db.commit()
 
-    ai_prompt = ai_service.get_prompt_for_audit(ocr_text)
-    ai_result = ai_service.generate_suggestion(ocr_text)
+    prior_result = _get_prior_ai_result(db, duplicate_of_id, ocr_text)
+    if prior_result is not None:
+        audit_service.log_action(
+            db=db,
+            action="ai_suggestion_reused",
+            invoice_id=invoice_id,
+            metadata={"reused_from_invoice_id": duplicate_of_id},
+        )
+    elif settings.AI_CACHE_ENABLED:
+        entry = ai_cache_service.get(db, prompt_text)
+        if entry is not None:
+            prior_result = ai_cache_service.get_result(entry)
+            audit_service.log_action(
+                db=db,
+                action="ai_suggestion_cache_hit",
+                invoice_id=invoice_id,
+                ai_response=str(prior_result),
+                metadata={
+                    "model": entry.model,
+                    "prompt_version": entry.prompt_version,
+                    "cached_at": entry.created_at.isoformat(),
+                    "hit_count": entry.hit_count,
+                },
+            )
+    # End the transaction, so no connection is held while the LLM call is awaited
+    db.commit()
+    return prior_result
+
+
+def _log_ai_suggestion(db: Session, invoice_id: Optional[int], prompt_text: str, ai_result: Dict[str, Any]) -> None:
     if invoice_id:
         audit_service.log_ai_suggestion(
             db=db,
             invoice_id=invoice_id,
-            ai_prompt=ai_prompt,
+            ai_prompt=ai_service.get_prompt_for_audit(prompt_text),
             ai_response=str(ai_result),
         )
+    if settings.AI_CACHE_ENABLED:
+        ai_cache_service.put(db, prompt_text, ai_result)
+
+
+def _defer_ai_suggestion(db: Session, invoice_id: int, user_id: Optional[int], ocr_text: str) -> None:
+    request = ai_batch_service.defer(db, invoice_id, user_id, ocr_text)
+    audit_service.log_action(
+        db=db,
+        action="ai_suggestion_batched",
+        user_id=user_id,
+        invoice_id=invoice_id,
+        metadata={"ai_batch_request_id": request.id},
+    )
+
+
+async def step_ai_suggestion(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
+    """Call AI for accounting suggestion (or reuse it from a duplicate or the AI response cache). In: ocr_text, prompt_text, ai_result, duplicate_of_id, use_batch_api, user_id. Out: ai_result (dict) or ai_deferred. External – audited.
+
+    Skipped if ai_result is already set (vendor memory). The model gets prompt_text (compacted OCR text) if present, else ocr_text.
+
+    Async: the LLM call is awaited on the event loop (bounded by AI_MAX_CONCURRENT_REQUESTS), database work runs in the io pool.
+    With use_batch_api the request is queued for the Batch API instead (ai_deferred); the workflow resumes with AI_BATCH_RESUME_STEPS.
+    """
+    if ctx.get("ai_result") is not None:
+        return {}
+    ocr_text = ctx["ocr_text"]
+    prompt_text = ctx.get("prompt_text", ocr_text)
+    invoice_id = ctx.get("invoice_id")
+    prior_result = await run_io(_begin_ai_suggestion, db, invoice_id, ctx.get("duplicate_of_id"), ocr_text, prompt_text)
+    if prior_result is not None:
+        return {"ai_result": prior_result}
+
+    if ctx.get("use_batch_api") and invoice_id:
+        await run_io(_defer_ai_suggestion, db, invoice_id, ctx.get("user_id"), prompt_text)
+        return {"ai_deferred": True}
+
+    ai_result = await ai_service.generate_suggestion_async(prompt_text)
+    await run_io(_log_ai_suggestion, db, invoice_id, prompt_text, ai_result)
+    return {"ai_result": ai_result}
+
+
+def _load_batch_result(db: Session, invoice_id: int) -> Dict[str, Any]:
+    request = ai_batch_service.get_request(db, invoice_id)
+    if request is None:
+        raise ValueError(f"No batch request for invoice {invoice_id}")
+    result = json.loads(request.ai_response) if request.status == models.AIBatchRequestStatus.DONE else None
+    return {"ocr_text": request.ocr_text, "ai_result": result, "error": request.error}
+
+
+async def step_ai_batch_result(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
+    """Take the suggestion from the invoice's completed batch request (direct API call if the batch had no result). In: invoice_id. Out: ai_result. External – audited."""
+    invoice_id = ctx["invoice_id"]
+    loaded = await run_io(_load_batch_result, db, invoice_id)
+    ai_result = loaded["ai_result"]
+    if ai_result is None:
+        ai_result = await ai_service.generate_suggestion_async(loaded["ocr_text"])
+    await run_io(_log_ai_suggestion, db, invoice_id, loaded["ocr_text"], ai_result)
     return {"ai_result": ai_result}
 
 
 def step_rule_validation(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
-    """Apply rule validation and confidence scoring. In: ai_result. Out: risk_level, confidence_score, notes."""
+    """Apply rule validation and confidence scoring. In: ai_result, ocr_truncated, vendor_unknown_accounts. Out: risk_level, confidence_score, notes."""
     ai_result = ctx["ai_result"]
+    ocr_truncated = bool(ctx.get("ocr_truncated"))
+    unknown_accounts = ctx.get("vendor_unknown_accounts") or []
     final_confidence = confidence_scoring_service.calculate_final_confidence(
         ai_confidence=ai_result["confidence"],
         account_number=ai_result.get("account_number"),
@@ -73,8 +332,14 @@ def step_rule_validation(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
         account_number=ai_result.get("account_number"),
         vat_code=ai_result.get("vat_code"),
         confidence=final_confidence,
+        ocr_truncated=ocr_truncated,
+        unknown_vendor_account=bool(unknown_accounts),
     )
     notes = ai_result.get("reasoning", "")
+    if unknown_accounts:
+        notes = f"{UNKNOWN_VENDOR_ACCOUNT_NOTE} ({', '.join(unknown_accounts)}) {notes}".strip()
+    if ocr_truncated:
+        notes = f"{TRUNCATED_OCR_NOTE} {notes}".strip()
     return {
         "risk_level": risk_level,
         "confidence_score": final_confidence,
@@ -98,6 +363,7 @@ def step_save_suggestion(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
         confidence_score=confidence_score,
         risk_level=risk_level,
         notes=notes,
+        ai_response=json.dumps(ai_result),
     )
     db.add(suggestion)
     invoice.status = models.ProcessingStatus.COMPLETE
@@ -105,25 +371,39 @@ def step_save_suggestion(ctx: Dict[str, Any], db: Session) -> Dict[str, Any]:
     return {}
 
 
-# Default workflow for trigger "invoice_uploaded": OCR → AI → Rules → Save
+# Default workflow for trigger "invoice_uploaded": OCR → Compact → Vendor memory → AI → Rules → Save
 DEFAULT_INVOICE_STEPS: List[StepDef] = [
     StepDef(
         name="ocr",
-        allowed_inputs=["invoice_id", "file_path", "mime_type"],
-        allowed_outputs=["ocr_text"],
+        allowed_inputs=["invoice_id", "file_path", "mime_type", "duplicate_of_id"],
+        allowed_outputs=["ocr_text", "ocr_layout", "ocr_truncated"],
         is_external=False,
         run=step_ocr,
     ),
     StepDef(
-        name="ai_suggestion",
+        name="compact_text",
         allowed_inputs=["ocr_text", "invoice_id"],
-        allowed_outputs=["ai_result"],
+        allowed_outputs=["prompt_text"],
+        is_external=False,
+        run=step_compact_text,
+    ),
+    StepDef(
+        name="vendor_memory",
+        allowed_inputs=["ocr_text", "invoice_id"],
+        allowed_outputs=["ai_result", "vendor_unknown_accounts"],
+        is_external=False,
+        run=step_vendor_memory,
+    ),
+    StepDef(
+        name="ai_suggestion",
+        allowed_inputs=["ocr_text", "prompt_text", "ai_result", "invoice_id", "duplicate_of_id", "use_batch_api", "user_id"],
+        allowed_outputs=["ai_result", "ai_deferred"],
         is_external=True,
         run=step_ai_suggestion,
     ),
     StepDef(
         name="rule_validation",
-        allowed_inputs=["ai_result"],
+        allowed_inputs=["ai_result", "ocr_truncated", "vendor_unknown_accounts"],
         allowed_outputs=["risk_level", "confidence_score", "notes"],
         is_external=False,
         run=step_rule_validation,
@@ -136,3 +416,18 @@ DEFAULT_INVOICE_STEPS: List[StepDef] = [
         run=step_save_suggestion,
     ),
 ]
+
+# Batch API mode: the workflow runs up to ai_suggestion; if that deferred the request
+# (ai_deferred), a "resume_invoice" job later runs AI_BATCH_RESUME_STEPS (see ai_batch_service)
+_AI_STEP_END = [step.name for step in DEFAULT_INVOICE_STEPS].index("ai_suggestion") + 1
+INVOICE_STEPS_UNTIL_AI: List[StepDef] = DEFAULT_INVOICE_STEPS[:_AI_STEP_END]
+INVOICE_STEPS_AFTER_AI: List[StepDef] = DEFAULT_INVOICE_STEPS[_AI_STEP_END:]
+AI_BATCH_RESUME_STEPS: List[StepDef] = [
+    StepDef(
+        name="ai_batch_result",
+        allowed_inputs=["invoice_id"],
+        allowed_outputs=["ai_result"],
+        is_external=True,
+        run=step_ai_batch_result,
+    ),
+] + INVOICE_STEPS_AFTER_AI
@@ -0,0 +1,327 @@
+"""
+Background worker: claims jobs from the job queue and runs them.
+
+Run one or more worker processes next to the API:
+    python -m app.worker
+"""
+import argparse
+import asyncio
+import inspect
+import logging
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.executors import run_io, shutdown_pools
+from app.db.database import SessionLocal
+from app.db import models
+from app.services.ai_batch_service import ai_batch_service
+from app.services.ai_cache_service import ai_cache_service
+from app.services.ai_service import close_async_client
+from app.services.job_queue import job_queue
+from app.services.ocr_cache_service import ocr_cache_service
+from app.services.ocr_page_cache_service import ocr_page_cache_service
+from app.services.vendor_memory_service import vendor_memory_service
+from app.services.workflow_engine import run_workflow_async
+from app.services.workflow_steps import (
+    AI_BATCH_RESUME_STEPS,
+    DEFAULT_INVOICE_STEPS,
+    INVOICE_STEPS_AFTER_AI,
+    INVOICE_STEPS_UNTIL_AI,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _load_process_context(db: Session, invoice_id: int, user_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
+    if not invoice:
+        return None
+    return {
+        "invoice_id": invoice_id,
+        "file_path": invoice.file_path,
+        "mime_type": invoice.mime_type,
+        "duplicate_of_id": invoice.duplicate_of_id,
+        "user_id": user_id or invoice.uploaded_by,
+        "use_batch_api": ai_batch_service.use_batch_api(invoice),
+    }
+
+
+def _load_resume_context(db: Session, invoice_id: int, user_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
+    if not invoice:
+        return None
+    context = {
+        "invoice_id": invoice_id,
+        "ocr_truncated": invoice.ocr_truncated,
+        "user_id": user_id or invoice.uploaded_by,
+    }
+    # step_vendor_memory's output from before the deferral, for rule validation
+    if settings.VENDOR_MEMORY_ENABLED and invoice.ocr_text:
+        match = vendor_memory_service.lookup_invoice(db, invoice, invoice.ocr_text)
+        if match is not None and match["unknown_accounts"]:
+            context["vendor_unknown_accounts"] = match["unknown_accounts"]
+    return context
+
+
+def _mark_invoice_error(db: Session, invoice_id: int) -> None:
+    db.rollback()
+    invoice = db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
+    if invoice:
+        invoice.status = models.ProcessingStatus.ERROR
+        db.commit()
+
+
+async def process_invoice(db: Session, invoice_id: int, user_id: Optional[int] = None):
+    """Process an invoice via the default workflow (OCR → compact → vendor memory → AI → rules → save). Safe dataflow, every step audited.
+
+    In Batch API mode the workflow stops once the suggestion request is queued; resume_invoice finishes it.
+    """
+    context = await run_io(_load_process_context, db, invoice_id, user_id)
+    if context is None:
+        return
+    try:
+        if not context["use_batch_api"]:
+            await run_workflow_async(
+                trigger="invoice_uploaded",
+                context=context,
+                steps=DEFAULT_INVOICE_STEPS,
+                db=db,
+                user_id=context["user_id"],
+                invoice_id=invoice_id,
+            )
+            return
+        context = await run_workflow_async(
+            trigger="invoice_uploaded",
+            context=context,
+            steps=INVOICE_STEPS_UNTIL_AI,
+            db=db,
+            user_id=context["user_id"],
+            invoice_id=invoice_id,
+        )
+        if context.get("ai_deferred"):
+            return
+        await run_workflow_async(
+            trigger="invoice_uploaded",
+            context=context,
+            steps=INVOICE_STEPS_AFTER_AI,
+            db=db,
+            user_id=context["user_id"],
+            invoice_id=invoice_id,
+        )
+    except Exception:
+        await run_io(_mark_invoice_error, db, invoice_id)
+        raise
+
+
+async def resume_invoice(db: Session, invoice_id: int, user_id: Optional[int] = None):
+    """Finish an invoice whose suggestion came back from the Batch API (batch result → rules → save)."""
+    context = await run_io(_load_resume_context, db, invoice_id, user_id)
+    if context is None:
+        return
+    try:
+        await run_workflow_async(
+            trigger="ai_batch_completed",
+            context=context,
+            steps=AI_BATCH_RESUME_STEPS,
+            db=db,
+            user_id=context["user_id"],
+            invoice_id=invoice_id,
+        )
+    except Exception:
+        await run_io(_mark_invoice_error, db, invoice_id)
+        raise
+
+
+# Job kind -> handler(db, job); coroutine functions are awaited, plain functions run in the io pool
+JOB_HANDLERS: Dict[str, Callable[[Session, models.Job], Any]] = {
+    "process_invoice": lambda db, job: process_invoice(db, job.invoice_id, job.user_id),
+    "resume_invoice": lambda db, job: resume_invoice(db, job.invoice_id, job.user_id),
+}
+
+
+async def run_job(db: Session, job: models.Job) -> None:
+    """Run a claimed job and record its outcome."""
+    handler = JOB_HANDLERS.get(job.kind)
+    if handler is None:
+        await run_io(job_queue.fail, db, job, f"Unknown job kind: {job.kind}")
+        return
+    try:
+        result = handler(db, job)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        await run_io(db.rollback)
+        await run_io(job_queue.fail, db, job, str(e))
+        return
+    await run_io(job_queue.complete, db, job)
+
+
+async def _job_loop(
+    worker_id: str,
+    reserve: Callable[[], bool],
+    release: Callable[[], None],
+    stop_when_empty: bool,
+    requeue_due: Callable[[], bool],
+) -> int:
+    """One job slot: claim and run jobs until reserve() refuses (max_jobs reached) or the queue is drained.
+
+    When requeue_due() says so, the slot first requeues jobs of crashed workers (JOB_REQUEUE_STALE_INTERVAL_SECONDS).
+    """
+    processed = 0
+    db = SessionLocal()
+    try:
+        while reserve():
+            if requeue_due():
+                await run_io(job_queue.requeue_stale, db)
+            job = await run_io(job_queue.claim, db, worker_id)
+            if job is None:
+                release()
+                if stop_when_empty:
+                    break
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+                continue
+            await run_job(db, job)
+            processed += 1
+    finally:
+        await run_io(db.close)
+    return processed
+
+
+async def _ai_batch_loop(stop: asyncio.Event) -> None:
+    """Submit due Batch API requests and poll running batches every AI_BATCH_POLL_INTERVAL_SECONDS until stopped."""
+    db = SessionLocal()
+    try:
+        while not stop.is_set():
+            try:
+                await run_io(ai_batch_service.run_once, db)
+            except Exception:
+                logger.exception("AI batch round failed")
+                await run_io(db.rollback)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=settings.AI_BATCH_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await run_io(db.close)
+
+
+def _evict_caches(db: Session) -> Dict[str, int]:
+    """Trim each persistent cache to its size limit (AI answers also drop expired entries). Returns entries deleted per cache."""
+    return {
+        "ocr": ocr_cache_service.evict(db),
+        "ocr_page": ocr_page_cache_service.evict(db),
+        "ai": ai_cache_service.evict(db),
+    }
+
+
+async def _cache_eviction_loop(stop: asyncio.Event) -> None:
+    """Evict cache entries every CACHE_EVICT_INTERVAL_SECONDS until stopped (puts never evict themselves)."""
+    db = SessionLocal()
+    try:
+        while not stop.is_set():
+            try:
+                await run_io(_evict_caches, db)
+            except Exception:
+                logger.exception("Cache eviction failed")
+                await run_io(db.rollback)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=settings.CACHE_EVICT_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await run_io(db.close)
+
+
+async def _run_slots(worker_id: str, concurrency: int, max_jobs: Optional[int], stop_when_empty: bool) -> int:
+    reserved = 0
+
+    # Slots are coroutines on one event loop, so the counter needs no lock
+    def reserve() -> bool:
+        nonlocal reserved
+        if max_jobs is not None and reserved >= max_jobs:
+            return False
+        reserved += 1
+        return True
+
+    def release() -> None:
+        nonlocal reserved
+        reserved -= 1
+
+    # run_worker requeues stale jobs on start; afterwards one slot does it per interval
+    next_requeue = time.monotonic() + settings.JOB_REQUEUE_STALE_INTERVAL_SECONDS
+
+    def requeue_due() -> bool:
+        nonlocal next_requeue
+        now = time.monotonic()
+        if now < next_requeue:
+            return False
+        next_requeue = now + settings.JOB_REQUEUE_STALE_INTERVAL_SECONDS
+        return True
+
+    stop_batches = asyncio.Event()
+    batch_loop = asyncio.create_task(_ai_batch_loop(stop_batches)) if settings.AI_BATCH_MODE != "off" else None
+    stop_eviction = asyncio.Event()
+    eviction_loop = asyncio.create_task(_cache_eviction_loop(stop_eviction))
+    try:
+        counts = await asyncio.gather(*(
+            _job_loop(f"{worker_id}/{i}", reserve, release, stop_when_empty, requeue_due) for i in range(concurrency)
+        ))
+        return sum(counts)
+    finally:
+        if batch_loop is not None:
+            stop_batches.set()
+            await batch_loop
+        stop_eviction.set()
+        await eviction_loop
+        await close_async_client()
+
+
+def run_worker(
+    worker_id: Optional[str] = None,
+    max_jobs: Optional[int] = None,
+    stop_when_empty: bool = False,
+    concurrency: Optional[int] = None,
+) -> int:
+    """
+    Poll the queue and run jobs until stopped.
+
+    - concurrency: job slots in this process. Slots are coroutines on one event loop:
+      LLM calls are awaited (bounded by AI_MAX_CONCURRENT_REQUESTS), while OCR runs in
+      the cpu process pool and other blocking work in the io pool, so a single worker
+      keeps many jobs in flight without a thread per job.
+    - max_jobs / stop_when_empty: let tests and scripts drain the queue in-process.
+    Returns the number of jobs run.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    concurrency = concurrency or settings.WORKER_CONCURRENCY
+    db = SessionLocal()
+    try:
+        job_queue.requeue_stale(db)
+    finally:
+        db.close()
+
+    try:
+        return asyncio.run(_run_slots(worker_id, concurrency, max_jobs, stop_when_empty))
+    finally:
+        shutdown_pools()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a background job worker.")
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument("--max-jobs", type=int, default=None)
+    parser.add_argument("--stop-when-empty", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logger.info("Worker starting (poll interval %ss)", settings.JOB_POLL_INTERVAL_SECONDS)
+    run_worker(
+        worker_id=args.worker_id,
+        max_jobs=args.max_jobs,
+        stop_when_empty=args.stop_when_empty,
+        concurrency=args.concurrency,
+    )
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+OCR throughput benchmark on a synthetic Norwegian invoice corpus (see corpus.py).
+
+Usage (from backend/):
+    python -m benchmarks.ocr_benchmark
+    python -m benchmarks.ocr_benchmark --configs defaults,fixed-300dpi --documents 40 --concurrency 4
+    python -m benchmarks.ocr_benchmark --json results.json
+    python -m benchmarks.ocr_benchmark --baseline results.json   # exit 1 on regression
+
+Each configuration runs OCRService over the corpus in a fresh subprocess, with its
+settings passed as environment variables. That way the cpu pool's spawned processes
+get the same configuration, and peak RSS is measured per configuration. Reported per
+configuration: throughput (pages/s), document latency percentiles, peak RSS of the
+process and of its children (pool processes, tesseract), and character-level accuracy
+against the ground truth.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Name -> settings overrides (environment variables); {} = application defaults
+CONFIGS: Dict[str, Dict[str, str]] = {
+    "defaults": {},
+    "fixed-300dpi": {"OCR_ADAPTIVE_DPI_ENABLED": "false", "OCR_DPI": "300"},
+    "no-normalize": {"IMAGE_NORMALIZE_ENABLED": "false"},
+    "no-preprocess": {"OCR_PREPROCESS_DOCUMENT_TYPES": "[]"},
+    "preprocess-all": {"OCR_PREPROCESS_DOCUMENT_TYPES": '["photo", "scan"]'},
+    "page-cache": {"OCR_PAGE_CACHE_ENABLED": "true"},
+    "pytesseract": {"OCR_ENGINE": "pytesseract"},
+}
+
+
+def levenshtein(a: str, b: str) -> int:
+    """Edit distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def char_errors(pages: List[str], truth: List[str]) -> Dict[str, int]:
+    """Character edit distance against ground truth, page by page (whitespace-normalized)."""
+    errors = chars = 0
+    for i, expected in enumerate(truth):
+        expected = _normalize_text(expected)
+        actual = _normalize_text(pages[i]) if i < len(pages) else ""
+        errors += levenshtein(actual, expected)
+        chars += len(expected)
+    return {"errors": errors, "chars": chars}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_config(corpus_dir: str, concurrency: int, warmup: int) -> Dict[str, Any]:
+    """Benchmark the current settings over the corpus (runs inside the per-configuration subprocess)."""
+    from app.core.config import settings
+    from app.core.executors import cpu_pool, shutdown_pools
+    from app.services.image_normalization_service import image_normalization_service
+    from app.services.ocr_service import ocr_service
+
+    corpus = Path(corpus_dir)
+    documents = json.loads((corpus / "manifest.json").read_text(encoding="utf-8"))["documents"]
+
+    def process(document: Dict[str, Any]) -> Dict[str, Any]:
+        file_path, mime_type = str(corpus / document["file"]), document["mime_type"]
+        start = time.perf_counter()
+        error = None
+        pages: List[Dict[str, Any]] = []
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                # Same as the ocr workflow step (_ocr_source)
+                if settings.IMAGE_NORMALIZE_ENABLED and mime_type.startswith("image/"):
+                    normalized = str(Path(tmp) / "normalized.png")
+                    cpu_pool.submit(image_normalization_service.normalize, file_path, normalized).result()
+                    file_path, mime_type = normalized, "image/png"
+                pages = ocr_service.extract_pages(file_path, mime_type)
+        except Exception as e:
+            error = str(e)
+        seconds = time.perf_counter() - start
+        return {
+            "file": document["file"],
+            "kind": document["kind"],
+            "pages": document["pages"],
+            "seconds": seconds,
+            "error": error,
+            **char_errors([page["text"] for page in pages], document["truth"]),
+        }
+
+    for document in documents[:warmup]:
+        process(document)  # pool start-up, engine initialization, traineddata loading
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(process, documents))
+    wall_seconds = time.perf_counter() - start
+    shutdown_pools()  # children must have exited for RUSAGE_CHILDREN to include them
+
+    def accuracy(rows: List[Dict[str, Any]]) -> Optional[float]:
+        chars = sum(row["chars"] for row in rows)
+        return round(1 - sum(row["errors"] for row in rows) / chars, 4) if chars else None
+
+    latencies_ms = [row["seconds"] * 1000 for row in results]
+    total_pages = sum(row["pages"] for row in results)
+    kinds = sorted({row["kind"] for row in results})
+    return {
+        "settings": {
+            "OCR_ENGINE": settings.OCR_ENGINE,
+            "OCR_DPI": settings.OCR_DPI,
+            "OCR_ADAPTIVE_DPI_ENABLED": settings.OCR_ADAPTIVE_DPI_ENABLED,
+            "OCR_LOW_DPI": settings.OCR_LOW_DPI,
+            "IMAGE_NORMALIZE_ENABLED": settings.IMAGE_NORMALIZE_ENABLED,
+            "OCR_PREPROCESS_DOCUMENT_TYPES": settings.OCR_PREPROCESS_DOCUMENT_TYPES,
+            "OCR_DOCUMENT_TIME_BUDGET_SECONDS": settings.OCR_DOCUMENT_TIME_BUDGET_SECONDS,
+            "OCR_PAGE_CACHE_ENABLED": settings.OCR_PAGE_CACHE_ENABLED,
+            "engine": ocr_service.engine_version(),
+        },
+        "documents": len(results),
+        "pages": total_pages,
+        "errors": sum(1 for row in results if row["error"]),
+        "first_error": next((row["error"] for row in results if row["error"]), None),
+        "wall_seconds": round(wall_seconds, 3),
+        "pages_per_second": round(total_pages / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies_ms, 50), 1),
+            "p90": round(percentile(latencies_ms, 90), 1),
+            "p99": round(percentile(latencies_ms, 99), 1),
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "char_accuracy": accuracy(results),
+        "char_accuracy_by_kind": {kind: accuracy([row for row in results if row["kind"] == kind]) for kind in kinds},
+    }
+
+
+def _run_in_subprocess(name: str, corpus_dir: str, concurrency: int, warmup: int) -> Dict[str, Any]:
+    env = os.environ.copy()
+    env.update(CONFIGS[name])
+    env.setdefault("DATABASE_URL", "sqlite://")  # required by Settings; the benchmark never connects
+    env.setdefault("OCR_PAGE_CACHE_ENABLED", "false")  # measure OCR, not cache hits on warmup documents
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.ocr_benchmark", "--worker", corpus_dir,
+         "--concurrency", str(concurrency), "--warmup", str(warmup)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Configuration {name} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _print_report(results: Dict[str, Dict[str, Any]]) -> None:
+    header = f"{'config':<16}{'pages/s':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'RSS MB':>9}{'child MB':>10}{'accuracy':>10}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        accuracy = f"{r['char_accuracy']:.2%}" if r["char_accuracy"] is not None else "-"
+        print(
+            f"{name:<16}{r['pages_per_second']:>9.2f}{r['latency_ms']['p50']:>10.0f}{r['latency_ms']['p90']:>10.0f}"
+            f"{r['latency_ms']['p99']:>10.0f}{r['peak_rss_mb']:>9.0f}{r['peak_child_rss_mb']:>10.0f}{accuracy:>10}{r['errors']:>8}"
+        )
+    for name, r in results.items():
+        if r["errors"]:
+            print(f"\n{name}: {r['errors']} document(s) failed, e.g.: {r['first_error']}")
+
+
+def _regressions(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                 max_slowdown: float, max_accuracy_drop: float) -> List[str]:
+    problems = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["pages_per_second"] and r["pages_per_second"] < base["pages_per_second"] * (1 - max_slowdown):
+            problems.append(f"{name}: throughput {r['pages_per_second']} pages/s vs baseline {base['pages_per_second']}")
+        if base["char_accuracy"] is not None and (r["char_accuracy"] or 0) < base["char_accuracy"] - max_accuracy_drop:
+            problems.append(f"{name}: accuracy {r['char_accuracy']} vs baseline {base['char_accuracy']}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark OCR throughput, latency, memory and accuracy.")
+    parser.add_argument("--corpus", default=str(BACKEND_DIR / "benchmarks" / "corpus"), help="corpus directory (generated if missing)")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--regenerate", action="store_true", help="regenerate the corpus even if it exists")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help=f"comma-separated, from: {', '.join(CONFIGS)}")
+    parser.add_argument("--concurrency", type=int, default=1, help="documents processed at once (like worker job slots)")
+    parser.add_argument("--warmup", type=int, default=1, help="documents processed before timing starts")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file to compare against; exit 1 on regression")
+    parser.add_argument("--max-slowdown", type=float, default=0.10, help="allowed throughput drop vs baseline (fraction)")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01, help="allowed accuracy drop vs baseline (absolute)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_config(args.worker, args.concurrency, args.warmup)))
+        return 0
+
+    names = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CONFIGS]
+    if unknown:
+        parser.error(f"unknown configuration(s): {', '.join(unknown)}")
+
+    from benchmarks.corpus import generate_corpus
+    manifest = Path(args.corpus) / "manifest.json"
+    existing = json.loads(manifest.read_text(encoding="utf-8")) if manifest.exists() else None
+    if args.regenerate or not existing or existing["seed"] != args.seed or len(existing["documents"]) != args.documents:
+        print(f"Generating corpus: {args.documents} documents, seed {args.seed} -> {args.corpus}")
+        generate_corpus(args.corpus, documents=args.documents, seed=args.seed)
+
+    results = {}
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        results[name] = _run_in_subprocess(name, args.corpus, args.concurrency, args.warmup)
+    print()
+    _print_report(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        problems = _regressions(
+            results, json.loads(Path(args.baseline).read_text()), args.max_slowdown, args.max_accuracy_drop
+        )
+        if problems:
+            print("\nRegressions vs baseline:")
+            for problem in problems:
+                print(f"  {problem}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
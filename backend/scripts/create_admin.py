@@ -13,6 +13,7 @@ from sqlalchemy.orm import Session
 from app.db.database import SessionLocal
 from app.db import models
 from app.core.security import get_password_hash
+from app.services.admission_service import admission_service
 
 
 def create_admin(email: str, password: str, full_name: str):
@@ -29,6 +30,7 @@ def create_admin(email: str, password: str, full_name: str):
         # Create admin user
         admin = models.User(
             email=email,
+            tenant=admission_service.tenant_of(email),
             hashed_password=get_password_hash(password),
             full_name=full_name,
             role=models.UserRole.ADMIN,
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI Files, Batches (create, retrieve, list) and Chat
+Completions endpoints, for running the Batch API mode (AI_BATCH_MODE) without an API key.
+
+Usage: python scripts/openai_batch_stub.py [--port 8090] [--delay 5] [--fail-every 0]
+Then run the API and worker with OPENAI_BASE_URL=http://localhost:8090/v1.
+
+Batches complete --delay seconds after creation. Every request gets the same canned
+suggestion; with --fail-every N, every Nth line of a batch is answered with an error
+(those invoices fall back to a direct chat completion call).
+"""
+import argparse
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SUGGESTION = {
+    "account_number": "6300",
+    "vat_code": "1",
+    "confidence": 0.8,
+    "risk_level": "low",
+    "reasoning": "Stand-in response",
+}
+
+_lock = threading.RLock()
+_files = {}  # id -> {"meta": dict, "content": bytes}
+_batches = {}  # id -> batch object
+_options = argparse.Namespace(delay=5.0, fail_every=0)
+
+
+def _chat_completion(body):
+    return {
+        "id": f"chatcmpl-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", ""),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(SUGGESTION)},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _add_file(filename, purpose, content):
+    with _lock:
+        file_id = f"file-{len(_files) + 1}"
+        meta = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        _files[file_id] = {"meta": meta, "content": content}
+    return meta
+
+
+def _complete(batch):
+    """Answer every line of the batch's input file (called once the delay has passed)."""
+    lines = _files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+    output, errors = [], []
+    for number, line in enumerate(filter(None, lines), start=1):
+        request = json.loads(line)
+        if _options.fail_every and number % _options.fail_every == 0:
+            errors.append({
+                "id": f"batch_req_{number}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 500, "body": {"error": {"message": "Stand-in failure"}}},
+                "error": None,
+            })
+            continue
+        output.append({
+            "id": f"batch_req_{number}",
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "body": _chat_completion(request["body"])},
+            "error": None,
+        })
+    to_jsonl = lambda items: "".join(json.dumps(item) + "\n" for item in items).encode("utf-8")
+    batch["output_file_id"] = _add_file("output.jsonl", "batch_output", to_jsonl(output))["id"] if output else None
+    batch["error_file_id"] = _add_file("errors.jsonl", "batch_output", to_jsonl(errors))["id"] if errors else None
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+    batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _send(self, status, payload, raw=False):
+        body = payload if raw else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        if self.path == "/v1/chat/completions":
+            self._send(200, _chat_completion(json.loads(self._body())))
+        elif self.path == "/v1/files":
+            header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+            message = BytesParser(policy=HTTP).parsebytes(header + self._body())
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            file_part = fields["file"]
+            self._send(200, _add_file(
+                file_part.get_filename(), fields["purpose"].get_content().strip(), file_part.get_payload(decode=True)
+            ))
+        elif self.path == "/v1/batches":
+            body = json.loads(self._body())
+            with _lock:
+                batch_id = f"batch_{len(_batches) + 1}"
+                batch = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "endpoint": body["endpoint"],
+                    "input_file_id": body["input_file_id"],
+                    "completion_window": body["completion_window"],
+                    "status": "validating",
+                    "output_file_id": None,
+                    "error_file_id": None,
+                    "created_at": int(time.time()),
+                    "metadata": body.get("metadata"),
+                }
+                _batches[batch_id] = batch
+            self._send(200, batch)
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts == ["v1", "batches"]:
+            query = parse_qs(url.query)
+            limit = int(query.get("limit", ["20"])[0])
+            with _lock:
+                batches = sorted(_batches.values(), key=lambda batch: int(batch["id"].split("_")[1]), reverse=True)
+            if "after" in query:
+                ids = [batch["id"] for batch in batches]
+                batches = batches[ids.index(query["after"][0]) + 1:] if query["after"][0] in ids else []
+            page = batches[:limit]
+            self._send(200, {
+                "object": "list",
+                "data": page,
+                "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None,
+                "has_more": len(batches) > limit,
+            })
+        elif parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in _batches:
+            with _lock:
+                batch = _batches[parts[2]]
+                if batch["status"] == "validating":
+                    batch["status"] = "in_progress"
+                elif batch["status"] == "in_progress" and time.time() - batch["created_at"] >= _options.delay:
+                    _complete(batch)
+                self._send(200, batch)
+        elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in _files:
+            self._send(200, _files[parts[2]]["content"], raw=True)
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Batch API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=5.0, help="seconds until a batch completes")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth batch line with an error")
+    args = parser.parse_args()
+    _options.delay = args.delay
+    _options.fail_every = args.fail_every
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"OpenAI batch stand-in on http://{args.host}:{args.port}/v1 (batches complete after {args.delay}s)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Shared fixtures. Tests run against a throwaway SQLite database; settings are read
+from the environment, so it is configured before the app is imported.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="borge-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ.setdefault("SECRET_KEY", "test-secret-key-for-the-test-suite-only")
+os.environ["STORAGE_LOCAL_DIR"] = os.path.join(_tmp, "uploads")
+
+import pytest
+
+from app.db import models  # noqa: F401  (registers the tables)
+from app.db.database import Base, SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    """A session on empty tables."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(email="accountant@firma.no", tenant="firma.no", hashed_password="x", full_name="Accountant")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def make_user(db):
+    """Create users: make_user("name@domain") (tenant set like on registration)."""
+    from app.services.admission_service import admission_service
+
+    def make(email: str) -> models.User:
+        user = models.User(email=email, tenant=admission_service.tenant_of(email), hashed_password="x", full_name=email)
+        db.add(user)
+        db.commit()
+        return user
+
+    return make
+
+
+@pytest.fixture
+def client(db):
+    """API test client (worker-side processing is not started)."""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(user):
+    from app.core.security import create_access_token
+
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
@@ -0,0 +1,101 @@
+import io
+import zipfile
+
+import pytest
+
+from app.api.v1 import invoices as invoices_api
+from app.core.config import settings
+from app.db import models
+from app.services.admission_service import AdmissionRejected, admission_service
+from app.services.ai_batch_service import ai_batch_service
+from app.services.job_queue import job_queue
+
+
+def _zip(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name in names:
+            archive.writestr(name, f"%PDF {name}")
+    return buffer.getvalue()
+
+
+def test_tenant_is_email_domain_except_public_mail():
+    assert admission_service.tenant_of("Ola@Firma.NO") == "firma.no"
+    assert admission_service.tenant_of("ola@gmail.com") is None
+    assert admission_service.tenant_of("kari@outlook.com") is None
+
+
+def test_tenant_limit_counts_colleagues_only(db, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT_PER_USER", 0)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT_PER_TENANT", 2)
+    first, colleague = make_user("a@firma.no"), make_user("b@firma.no")
+    gmail_users = [make_user("a@gmail.com"), make_user("b@gmail.com")]
+    for owner in [first, colleague] + gmail_users:
+        job_queue.enqueue(db, "process_invoice", user_id=owner.id)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission_service.check(db, colleague)
+    assert rejected.value.reason == "tenant_limit"
+    # Users of public mail providers are not one tenant
+    admission_service.check(db, gmail_users[0], new_jobs=2)
+
+
+def test_suggestions_waiting_for_a_batch_are_in_flight(db, user, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT_PER_USER", 2)
+    invoice = models.Invoice(filename="f.pdf", file_path="f.pdf", file_size=1, mime_type="application/pdf", uploaded_by=user.id)
+    db.add(invoice)
+    db.commit()
+    job_queue.enqueue(db, "process_invoice", user_id=user.id)
+    request = ai_batch_service.defer(db, invoice.id, user.id, "Faktura 1001")
+
+    assert admission_service.user_in_flight(db, user.id) == 2
+    assert admission_service.tenant_in_flight(db, "firma.no") == 2
+    assert admission_service.levels(db)["users"][0]["in_flight"] == 2
+    with pytest.raises(AdmissionRejected):
+        admission_service.check(db, user)
+
+    request.status = models.AIBatchRequestStatus.DONE
+    db.commit()
+    admission_service.check(db, user)
+
+
+def test_upload_admitted_concurrently_with_another_is_refused_at_registration(client, auth_headers, db, user, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT_PER_USER", 1)
+    stream = invoices_api._stream_upload
+
+    async def stream_while_another_upload_is_admitted(file, file_ext):
+        job_queue.enqueue(db, "process_invoice", user_id=user.id)
+        return await stream(file, file_ext)
+
+    monkeypatch.setattr(invoices_api, "_stream_upload", stream_while_another_upload_is_admitted)
+    response = client.post(
+        "/api/v1/invoices/upload", files={"file": ("faktura.pdf", b"%PDF faktura", "application/pdf")}, headers=auth_headers
+    )
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert db.query(models.Invoice).count() == 0
+    assert db.query(models.AuditLog).filter(models.AuditLog.action == "upload").count() == 0
+    assert db.query(models.Job).count() == 1
+
+
+def test_bulk_zip_is_admitted_by_document_count(client, auth_headers, db, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT_PER_USER", 3)
+    archive = ("files", ("januar.zip", _zip(["1.pdf", "2.pdf", "3.pdf", "4.pdf", "notes.txt"]), "application/zip"))
+
+    response = client.post("/api/v1/invoices/bulk", files=[archive], headers=auth_headers)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert db.query(models.Invoice).count() == 0
+
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT_PER_USER", 4)
+    response = client.post("/api/v1/invoices/bulk", files=[archive], headers=auth_headers)
+    assert response.status_code == 202
+    assert response.json()["queued"] == 4
+    assert response.json()["skipped"] == ["notes.txt"]
+
+
+def test_bulk_over_max_files_is_rejected_before_storing(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_BULK_FILES", 2)
+    archive = ("files", ("januar.zip", _zip(["1.pdf", "2.pdf", "3.pdf"]), "application/zip"))
+    response = client.post("/api/v1/invoices/bulk", files=[archive], headers=auth_headers)
+    assert response.status_code == 400
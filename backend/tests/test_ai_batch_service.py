@@ -0,0 +1,150 @@
+import importlib.util
+import logging
+import threading
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import pytest
+from openai import APIConnectionError, OpenAI
+
+from app.core.config import settings
+from app.db import models
+from app.services import ai_batch_service as ai_batch_module
+from app.services.ai_batch_service import AIBatchService, ai_batch_service
+
+_spec = importlib.util.spec_from_file_location(
+    "openai_batch_stub", Path(__file__).resolve().parents[1] / "scripts" / "openai_batch_stub.py"
+)
+stub = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(stub)
+
+
+@pytest.fixture
+def openai_client(monkeypatch):
+    """OpenAI client talking to scripts/openai_batch_stub.py (batches complete on the second poll)."""
+    stub._files.clear()
+    stub._batches.clear()
+    stub._options.delay = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub.Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    openai_client = OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+    monkeypatch.setattr(ai_batch_module, "get_client", lambda: openai_client)
+    monkeypatch.setattr(settings, "AI_BATCH_MAX_WAIT_SECONDS", 0)
+    yield openai_client
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pending(db, user):
+    return [ai_batch_service.defer(db, invoice_id, user.id, f"Faktura {invoice_id}\nSum 1 250,00") for invoice_id in (1, 2)]
+
+
+def _statuses(db, requests):
+    for request in requests:
+        db.refresh(request)
+    return [request.status for request in requests]
+
+
+def test_submit_and_poll_stores_results_and_enqueues_resume_jobs(db, openai_client, pending):
+    [batch] = ai_batch_service.submit_pending(db)
+    assert batch.remote_id in stub._batches
+    assert batch.input_file_id and batch.request_count == 2
+
+    assert ai_batch_service.poll(db) == 0  # validating -> in_progress
+    assert ai_batch_service.poll(db) == 1
+    assert _statuses(db, pending) == [models.AIBatchRequestStatus.DONE] * 2
+    assert db.query(models.Job).filter(models.Job.kind == "resume_invoice").count() == 2
+
+
+def test_batch_created_before_a_failure_is_adopted_not_resubmitted(db, openai_client, pending, monkeypatch):
+    create = openai_client.post
+
+    def create_then_drop_connection(*args, **kwargs):
+        create(*args, **kwargs)
+        raise APIConnectionError(request=httpx.Request("POST", "http://stub/v1/batches"))
+
+    monkeypatch.setattr(openai_client, "post", create_then_drop_connection)
+    with pytest.raises(APIConnectionError):
+        ai_batch_service.submit_pending(db)
+
+    [batch] = db.query(models.AIBatch).all()
+    assert batch.remote_id == "batch_1"
+    assert batch.request_count == 2
+    assert _statuses(db, pending) == [models.AIBatchRequestStatus.SUBMITTED] * 2
+    monkeypatch.setattr(openai_client, "post", create)
+    assert ai_batch_service.submit_pending(db) == []
+    assert len(stub._batches) == 1
+
+
+def test_failed_creation_releases_requests(db, openai_client, pending, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise APIConnectionError(request=httpx.Request("POST", "http://stub/v1/batches"))
+
+    monkeypatch.setattr(openai_client, "post", refuse)
+    with pytest.raises(APIConnectionError):
+        ai_batch_service.submit_pending(db)
+
+    [batch] = db.query(models.AIBatch).all()
+    assert batch.status == "failed" and batch.remote_id is None
+    assert _statuses(db, pending) == [models.AIBatchRequestStatus.PENDING] * 2
+
+
+def test_stale_preparing_batch_is_adopted_when_it_exists_remotely(db, openai_client, pending, monkeypatch):
+    monkeypatch.setattr(settings, "AI_BATCH_MAX_WAIT_SECONDS", 3600)
+    batch = models.AIBatch(status="preparing", request_count=0, input_file_id="file-1")
+    db.add(batch)
+    db.commit()
+    for request in pending:
+        request.batch_id = batch.id
+        request.status = models.AIBatchRequestStatus.SUBMITTED
+    batch.created_at = datetime.utcnow() - timedelta(hours=2)
+    db.commit()
+    # The worker died after creating the batch, before storing its id
+    openai_client.post("/batches", cast_to=object, body={
+        "input_file_id": "file-1",
+        "endpoint": "/v1/chat/completions",
+        "completion_window": "24h",
+        "metadata": {"ai_batch_id": str(batch.id)},
+    })
+
+    ai_batch_service.submit_pending(db)
+    db.refresh(batch)
+    assert batch.remote_id == "batch_1" and batch.status == "validating"
+    assert _statuses(db, pending) == [models.AIBatchRequestStatus.SUBMITTED] * 2
+
+
+def test_poll_error_on_one_batch_does_not_stop_the_others(db, openai_client, pending):
+    [batch] = ai_batch_service.submit_pending(db)
+    lost = models.AIBatch(status="in_progress", remote_id="batch_gone", request_count=1, submitted_at=datetime.utcnow())
+    db.add(lost)
+    db.commit()
+    orphan = ai_batch_service.defer(db, 3, None, "Faktura 3")
+    orphan.batch_id = lost.id
+    orphan.status = models.AIBatchRequestStatus.SUBMITTED
+    db.commit()
+
+    ai_batch_service.poll(db)
+    assert ai_batch_service.poll(db) == 1
+    db.refresh(lost)
+    assert lost.status == "failed" and lost.completed_at is not None
+    assert _statuses(db, [orphan]) == [models.AIBatchRequestStatus.FAILED]
+    assert _statuses(db, pending) == [models.AIBatchRequestStatus.DONE] * 2
+
+
+def test_poll_errors_are_logged_with_traceback(db, openai_client, pending, monkeypatch, caplog):
+    [batch] = ai_batch_service.submit_pending(db)
+    ai_batch_service.poll(db)
+
+    def broken_finish(db, batch, remote):
+        raise RuntimeError("output file unreadable")
+
+    monkeypatch.setattr(AIBatchService, "_finish", staticmethod(broken_finish))
+    with caplog.at_level(logging.ERROR, logger="app.services.ai_batch_service"):
+        assert ai_batch_service.poll(db) == 0
+    [record] = caplog.records
+    assert record.getMessage() == f"Polling AI batch {batch.id} ({batch.remote_id}) failed"
+    assert record.exc_info[1].args == ("output file unreadable",)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.db import models
+from app.services import workflow_steps
+from app.services.ai_cache_service import ai_cache_service
+from app.services.ai_service import AIService
+
+OCR_TEXT = "Hønefoss Elektro AS\nFaktura 1001\nKonsulenttime 1 950,00"
+RESULT = {"account_number": "6540", "vat_code": "1", "confidence": 0.9, "risk_level": "low", "reasoning": "Inventar"}
+
+
+def _age(db, hours):
+    db.query(models.AIResponseCacheEntry).update(
+        {models.AIResponseCacheEntry.created_at: datetime.utcnow() - timedelta(hours=hours)}
+    )
+    db.commit()
+
+
+def test_key_ignores_whitespace_but_not_model_or_prompt_version(monkeypatch):
+    key = ai_cache_service.cache_key(OCR_TEXT)
+    assert ai_cache_service.cache_key("  " + OCR_TEXT.replace("\n", "\n\n  ")) == key
+    assert ai_cache_service.cache_key(OCR_TEXT + " 2") != key
+
+    with monkeypatch.context() as m:
+        m.setattr(AIService, "MODEL", "gpt-4o")
+        assert ai_cache_service.cache_key(OCR_TEXT) != key
+    with monkeypatch.context() as m:
+        m.setattr(AIService, "prompt_version", staticmethod(lambda: "0123456789abcdef"))
+        assert ai_cache_service.cache_key(OCR_TEXT) != key
+
+
+def test_hit_within_ttl(db):
+    ai_cache_service.put(db, OCR_TEXT, RESULT)
+    entry = ai_cache_service.get(db, OCR_TEXT)
+    assert ai_cache_service.get_result(entry) == RESULT
+    assert entry.hit_count == 1
+    assert entry.model == AIService.MODEL and entry.prompt_version == AIService.prompt_version()
+
+
+def test_model_change_misses(db, monkeypatch):
+    ai_cache_service.put(db, OCR_TEXT, RESULT)
+    monkeypatch.setattr(AIService, "MODEL", "gpt-4o")
+    assert ai_cache_service.get(db, OCR_TEXT) is None
+
+
+def test_expired_entry_is_not_used_and_deleted(db, monkeypatch):
+    monkeypatch.setattr(settings, "AI_CACHE_TTL_HOURS", 24)
+    ai_cache_service.put(db, OCR_TEXT, RESULT)
+    _age(db, 25)
+    assert ai_cache_service.get(db, OCR_TEXT) is None
+    assert db.query(models.AIResponseCacheEntry).count() == 0
+
+
+def test_evict_drops_expired_then_least_recently_used(db, monkeypatch):
+    monkeypatch.setattr(settings, "AI_CACHE_TTL_HOURS", 24)
+    ai_cache_service.put(db, "expired", RESULT)
+    _age(db, 25)
+    ai_cache_service.put(db, "old", RESULT)
+    ai_cache_service.put(db, "new", RESULT)
+    db.query(models.AIResponseCacheEntry).filter(
+        models.AIResponseCacheEntry.cache_key == ai_cache_service.cache_key("old")
+    ).update({models.AIResponseCacheEntry.last_used_at: datetime.utcnow() - timedelta(hours=1)})
+    db.commit()
+    size = db.query(models.AIResponseCacheEntry).first().size_bytes
+
+    monkeypatch.setattr(settings, "AI_CACHE_MAX_BYTES", size)
+    assert ai_cache_service.evict(db) == 2
+    assert ai_cache_service.get(db, "new") is not None
+    assert db.query(models.AIResponseCacheEntry).count() == 1
+
+
+def test_cache_hit_skips_the_llm_and_is_audited(db, user, monkeypatch):
+    async def no_llm(prompt_text):
+        raise AssertionError("LLM called on a cache hit")
+
+    monkeypatch.setattr(workflow_steps.ai_service, "generate_suggestion_async", no_llm)
+    monkeypatch.setattr(settings, "AI_CACHE_ENABLED", True)
+    ai_cache_service.put(db, OCR_TEXT, RESULT)
+
+    out = asyncio.run(workflow_steps.step_ai_suggestion({"ocr_text": OCR_TEXT, "prompt_text": OCR_TEXT}, db))
+    assert out == {"ai_result": RESULT}
+
+    audit = db.query(models.AuditLog).filter(models.AuditLog.action == "ai_suggestion_cache_hit").one()
+    metadata = json.loads(audit.extra_data)
+    assert metadata["model"] == AIService.MODEL
+    assert metadata["prompt_version"] == AIService.prompt_version()
+    assert metadata["hit_count"] == 1
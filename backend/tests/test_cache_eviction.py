@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from app.db import models
+from app.services.cache_eviction import evict_lru
+
+
+def _entry(db, key, size_bytes, minutes_ago):
+    db.add(models.OCRCacheEntry(
+        cache_key=key, content_hash=key, engine="test", pages="[]", size_bytes=size_bytes, hit_count=0,
+        last_used_at=datetime.utcnow() - timedelta(minutes=minutes_ago),
+    ))
+    db.commit()
+
+
+def _keys(db):
+    return sorted(key for (key,) in db.query(models.OCRCacheEntry.cache_key))
+
+
+def test_evicts_least_recently_used_until_under_limit(db):
+    _entry(db, "oldest", 400, 30)
+    _entry(db, "old", 400, 20)
+    _entry(db, "recent", 400, 10)
+    _entry(db, "newest", 400, 0)
+
+    assert evict_lru(db, models.OCRCacheEntry, 1000) == 2
+    assert _keys(db) == ["newest", "recent"]
+
+
+def test_nothing_evicted_within_limit(db):
+    _entry(db, "a", 400, 1)
+    _entry(db, "b", 400, 0)
+    assert evict_lru(db, models.OCRCacheEntry, 800) == 0
+    assert _keys(db) == ["a", "b"]
+
+
+def test_worker_evicts_all_caches(db, monkeypatch):
+    from app.core.config import settings
+    from app.worker import _evict_caches
+
+    monkeypatch.setattr(settings, "OCR_CACHE_MAX_BYTES", 500)
+    _entry(db, "old", 400, 10)
+    _entry(db, "new", 400, 0)
+    assert _evict_caches(db) == {"ocr": 1, "ocr_page": 0, "ai": 0}
+    assert _keys(db) == ["new"]
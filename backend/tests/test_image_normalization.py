@@ -0,0 +1,52 @@
+import io
+import json
+import os
+
+from PIL import Image
+
+from app.db import models
+from app.services.storage_service import storage
+from app.services.workflow_steps import _ocr_source
+
+
+def _store(data: bytes, ext: str) -> str:
+    writer = storage.open_writer(ext)
+    writer.write(data)
+    return writer.commit()[0]
+
+
+def _photo(size=(4000, 3000)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (220, 210, 200)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _stored_files():
+    return {str(p) for p in storage.root.rglob("*") if p.is_file()}
+
+
+def test_photos_are_ocrd_from_a_temp_copy_that_is_not_stored(db):
+    key = _store(_photo(), ".jpg")
+    stored = _stored_files()
+
+    with _ocr_source(db, None, key, "image/jpeg") as (path, mime_type):
+        assert mime_type == "image/png"
+        with Image.open(path) as img:
+            assert img.mode == "L" and max(img.size) == 3000
+    assert not os.path.exists(path)
+    assert _stored_files() == stored
+
+    stats = json.loads(db.query(models.AuditLog).filter(models.AuditLog.action == "image_normalized").one().extra_data)
+    assert stats["original_size"] == [4000, 3000]
+
+
+def test_pdfs_and_unreadable_images_use_the_original(db):
+    pdf = _store(b"%PDF-1.4\n", ".pdf")
+    with _ocr_source(db, None, pdf, "application/pdf") as (path, mime_type):
+        assert mime_type == "application/pdf"
+        assert open(path, "rb").read() == b"%PDF-1.4\n"
+
+    broken = _store(b"not a jpeg", ".jpg")
+    with _ocr_source(db, None, broken, "image/jpeg") as (path, mime_type):
+        assert mime_type == "image/jpeg"
+    assert db.query(models.AuditLog).filter(models.AuditLog.action == "image_normalization_failed").count() == 1
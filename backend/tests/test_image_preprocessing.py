@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services.image_preprocessing_service import CROP_MARGIN, image_preprocessing_service as service
+
+
+def _text_lines(height=600, width=800, angle=0.0, rows=range(100, 500, 40)):
+    """White page with dark horizontal 'text lines' (3 px strokes), sheared by angle degrees."""
+    pixels = np.full((height, width), 255, dtype=np.uint8)
+    xs = np.arange(100, 700)
+    for row in rows:
+        ys = np.round(row + xs * np.tan(np.radians(angle))).astype(int)
+        for dy in range(3):
+            pixels[ys + dy, xs] = 0
+    return pixels
+
+
+@pytest.mark.parametrize("angle", [0.0, 2.0, -3.0])
+def test_estimate_skew(angle):
+    assert service.estimate_skew(_text_lines(angle=angle)) == pytest.approx(angle, abs=0.15)
+
+
+def test_blank_page_has_no_skew():
+    assert service.estimate_skew(np.full((300, 300), 255, dtype=np.uint8)) == 0.0
+
+
+def test_crop_strips_dark_border_and_empty_margin():
+    pixels = np.full((400, 500), 255, dtype=np.uint8)
+    pixels[:30, :] = pixels[-30:, :] = 20  # scanner lid border
+    pixels[:, :25] = 20
+    pixels[150:160, 200:300] = 0  # ink
+
+    cropped, (left, top, right, bottom) = service.crop_borders(pixels)
+    assert (left, top, right, bottom) == (200 - CROP_MARGIN, 150 - CROP_MARGIN, 300 + CROP_MARGIN, 160 + CROP_MARGIN)
+    assert cropped.shape == (bottom - top, right - left)
+
+
+def test_adaptive_threshold_handles_uneven_light():
+    # Background brightens from 90 (shadow) to 250 left to right; strokes are 60 darker than their surroundings
+    background = np.tile(np.linspace(90, 250, 400), (200, 1))
+    pixels = background.copy()
+    pixels[50:53, 20:380] -= 60
+    pixels[120:123, 20:380] -= 60
+    binary = service.adaptive_threshold(pixels.astype(np.uint8))
+
+    assert set(np.unique(binary)) == {0, 255}
+    assert (binary[50:53, 20:380] == 0).mean() > 0.95
+    assert (binary[120:123, 20:380] == 0).mean() > 0.95
+    assert (binary[80:110, :] == 255).mean() > 0.99  # shadowed background is not ink
+
+
+def test_preprocess_reports_stages_and_deskews():
+    image, info = service.preprocess(Image.fromarray(_text_lines(angle=2.0)))
+    assert set(info) == {"crop_box", "skew_angle", "ms"}
+    assert set(info["ms"]) == {"crop", "deskew", "threshold"}
+    assert info["skew_angle"] == pytest.approx(2.0, abs=0.15)
+    assert image.mode == "L"
+    # After rotation the lines are horizontal again
+    assert abs(service.estimate_skew(np.asarray(image))) <= 0.2
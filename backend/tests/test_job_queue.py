@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from app.db import models
+from app.services.job_queue import job_queue
+
+
+def _job(db, user, **fields):
+    job = job_queue.enqueue(db, "process_invoice", user_id=user.id)
+    for key, value in fields.items():
+        setattr(job, key, value)
+    db.commit()
+    return job
+
+
+def test_claim_takes_oldest_runnable_job_once(db, user):
+    first = _job(db, user)
+    _job(db, user, run_after=datetime.utcnow() + timedelta(hours=1))
+
+    claimed = job_queue.claim(db, "worker-1")
+    assert claimed.id == first.id
+    assert claimed.status == models.JobStatus.RUNNING
+    assert claimed.locked_by == "worker-1"
+    assert claimed.attempts == 1
+    # The other job is not runnable yet
+    assert job_queue.claim(db, "worker-2") is None
+
+
+def test_fail_requeues_with_backoff_then_fails(db, user):
+    job = _job(db, user, max_attempts=2)
+
+    job_queue.fail(db, job_queue.claim(db, "w"), "boom")
+    db.refresh(job)
+    assert job.status == models.JobStatus.QUEUED
+    assert job.run_after > datetime.utcnow()
+    assert job.last_error == "boom"
+
+    job.run_after = datetime.utcnow()
+    db.commit()
+    job_queue.fail(db, job_queue.claim(db, "w"), "boom again")
+    db.refresh(job)
+    assert job.status == models.JobStatus.FAILED
+    assert job.attempts == 2
+
+
+def test_requeue_stale_requeues_and_fails_exhausted_jobs(db, user):
+    old = datetime.utcnow() - timedelta(hours=1)
+    retryable = _job(db, user, status=models.JobStatus.RUNNING, locked_by="dead", locked_at=old, attempts=1)
+    exhausted = _job(db, user, status=models.JobStatus.RUNNING, locked_by="dead", locked_at=old, attempts=3, max_attempts=3)
+    fresh = _job(db, user, status=models.JobStatus.RUNNING, locked_by="alive", locked_at=datetime.utcnow(), attempts=1)
+
+    assert job_queue.requeue_stale(db) == 1
+    for job in (retryable, exhausted, fresh):
+        db.refresh(job)
+    assert retryable.status == models.JobStatus.QUEUED and retryable.locked_by is None
+    assert exhausted.status == models.JobStatus.FAILED
+    assert fresh.status == models.JobStatus.RUNNING
+
+
+def test_claim_shares_workers_between_users(db, user, make_user):
+    bulk = [_job(db, user) for _ in range(3)]
+    other = make_user("regnskap@annet.no")
+    single = _job(db, other)
+
+    assert job_queue.claim(db, "w").id == bulk[0].id
+    # The bulk uploader already has a running job; the other tenant goes next despite queueing later
+    assert job_queue.claim(db, "w").id == single.id
+    assert job_queue.claim(db, "w").id == bulk[1].id
+
+
+def test_claim_is_fair_per_tenant_then_user(db, user, make_user):
+    colleague = make_user("kollega@firma.no")
+    private = make_user("someone@gmail.com")
+    _job(db, user, status=models.JobStatus.RUNNING)
+    colleague_job = _job(db, colleague)
+    private_jobs = [_job(db, private) for _ in range(2)]
+
+    # firma.no has a running job; the gmail user (no tenant) counts on their own
+    assert job_queue.claim(db, "w").id == private_jobs[0].id
+    # One running job each; the colleague has none of their own, so firma.no goes next
+    assert job_queue.claim(db, "w").id == colleague_job.id
+    assert job_queue.claim(db, "w").id == private_jobs[1].id
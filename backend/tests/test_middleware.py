@@ -0,0 +1,37 @@
+from app.core.config import settings
+
+ORIGIN = "http://localhost:3000"
+
+
+def test_oversized_upload_rejected_with_cors_headers(client, auth_headers):
+    response = client.post(
+        "/api/v1/invoices/upload",
+        content=b"x",
+        headers={
+            **auth_headers,
+            "Origin": ORIGIN,
+            "Content-Length": str(settings.MAX_UPLOAD_SIZE + settings.MULTIPART_OVERHEAD + 1),
+            "Content-Type": "multipart/form-data; boundary=x",
+        },
+    )
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+def test_streamed_oversized_upload_rejected(client, auth_headers):
+    chunks = (b"x" * (1024 * 1024) for _ in range(settings.MAX_UPLOAD_SIZE // (1024 * 1024) + 2))
+    response = client.post(
+        "/api/v1/invoices/upload",
+        content=chunks,
+        headers={**auth_headers, "Origin": ORIGIN, "Content-Type": "multipart/form-data; boundary=x"},
+    )
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+def test_resumable_upload_paths_not_limited_as_upload(client, auth_headers):
+    response = client.head(
+        "/api/v1/invoices/uploads/does-not-exist",
+        headers={**auth_headers, "Content-Length": str(settings.MAX_UPLOAD_SIZE * 10)},
+    )
+    assert response.status_code != 413
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.db import models
+from app.services.ocr_cache_service import ocr_cache_service
+from app.services.ocr_page_cache_service import OCRPageCacheService
+from app.services.ocr_service import ocr_service
+
+PAGES = [
+    {"page": 1, "text": "Faktura 1001", "source": "text_layer"},
+    {"page": 2, "text": "Sum 12 500,00", "source": "ocr", "confidence": 91.0, "dpi": 150, "layout": None},
+]
+
+
+def test_cache_key_covers_document_and_ocr_settings(monkeypatch):
+    key = ocr_cache_service.cache_key("a" * 64)
+    assert key == ocr_cache_service.cache_key("a" * 64)
+    assert key != ocr_cache_service.cache_key("b" * 64)
+
+    for name, value in (("OCR_DPI", 400), ("OCR_LANGUAGES", "eng"), ("OCR_ADAPTIVE_DPI_ENABLED", False)):
+        with monkeypatch.context() as m:
+            m.setattr(settings, name, value)
+            assert ocr_cache_service.cache_key("a" * 64) != key, name
+
+
+def test_put_then_get_is_a_hit(db):
+    assert ocr_cache_service.get(db, "a" * 64) is None
+    ocr_cache_service.put(db, "a" * 64, PAGES)
+    assert ocr_cache_service.get(db, "a" * 64) == PAGES
+    assert ocr_cache_service.get(db, "a" * 64) == PAGES
+
+    entry = db.query(models.OCRCacheEntry).one()
+    assert entry.hit_count == 2 and entry.content_hash == "a" * 64
+
+    # Same document again (another worker): no second entry
+    ocr_cache_service.put(db, "a" * 64, PAGES)
+    assert db.query(models.OCRCacheEntry).count() == 1
+
+
+def test_settings_change_misses(db, monkeypatch):
+    ocr_cache_service.put(db, "a" * 64, PAGES)
+    monkeypatch.setattr(settings, "OCR_DPI", 400)
+    assert ocr_cache_service.get(db, "a" * 64) is None
+
+
+def test_partial_or_failed_results_are_not_cached(db):
+    ocr_cache_service.put(db, "a" * 64, PAGES + [{"page": 3, "text": "", "source": "ocr", "skipped": "page_limit"}])
+    ocr_cache_service.put(db, "b" * 64, PAGES + [{"page": 3, "text": "", "source": "ocr", "error": "broken"}])
+    assert db.query(models.OCRCacheEntry).count() == 0
+
+
+def test_disabled_cache_stores_nothing(db, monkeypatch):
+    monkeypatch.setattr(settings, "OCR_CACHE_ENABLED", False)
+    ocr_cache_service.put(db, "a" * 64, PAGES)
+    assert db.query(models.OCRCacheEntry).count() == 0
+
+
+def test_evict_drops_least_recently_used_documents(db, monkeypatch):
+    for content_hash in ("a" * 64, "b" * 64, "c" * 64):
+        ocr_cache_service.put(db, content_hash, PAGES)
+    size = db.query(models.OCRCacheEntry).first().size_bytes
+    # b used most recently, a least
+    for content_hash, minutes_ago in (("a" * 64, 30), ("b" * 64, 0), ("c" * 64, 10)):
+        db.query(models.OCRCacheEntry).filter(models.OCRCacheEntry.content_hash == content_hash).update(
+            {models.OCRCacheEntry.last_used_at: datetime.utcnow() - timedelta(minutes=minutes_ago)}
+        )
+    db.commit()
+
+    monkeypatch.setattr(settings, "OCR_CACHE_MAX_BYTES", 2 * size)
+    assert ocr_cache_service.evict(db) == 1
+    assert ocr_cache_service.get(db, "a" * 64) is None
+    assert ocr_cache_service.get(db, "b" * 64) == PAGES
+
+
+# Page-level cache
+
+PAGE_ITEM = {"text": "Salgs- og leveringsbetingelser", "confidence": 88.0, "dpi": 150, "layout": None}
+
+
+@pytest.fixture
+def page_cache():
+    """A fresh page cache (empty in-process LRU)."""
+    return OCRPageCacheService()
+
+
+def test_page_cache_key_covers_page_and_ocr_settings(monkeypatch):
+    key = ocr_service.page_cache_key("p" * 64, preprocess=False)
+    assert key != ocr_service.page_cache_key("q" * 64, preprocess=False)
+    assert key != ocr_service.page_cache_key("p" * 64, preprocess=True)
+    monkeypatch.setattr(settings, "OCR_LOW_DPI", 200)
+    assert key != ocr_service.page_cache_key("p" * 64, preprocess=False)
+
+
+def test_page_cache_serves_from_memory_then_database(db, page_cache):
+    page_cache.put_many(db, {"k1": PAGE_ITEM}, {"k1": "p" * 64})
+    assert page_cache.get_many(db, ["k1", "k2"]) == {"k1": PAGE_ITEM}
+    assert (page_cache.memory_hits, page_cache.db_hits, page_cache.misses) == (1, 0, 1)
+
+    # Another process: empty memory, persistent entry
+    other = OCRPageCacheService()
+    assert other.get_many(db, ["k1"]) == {"k1": PAGE_ITEM}
+    assert other.db_hits == 1
+    assert db.query(models.OCRPageCacheEntry).one().hit_count == 1
+    assert other.get_many(db, ["k1"]) == {"k1": PAGE_ITEM} and other.memory_hits == 1
+
+
+def test_page_cache_without_database_uses_memory_only(db, page_cache):
+    page_cache.put_many(None, {"k1": PAGE_ITEM}, {"k1": "p" * 64})
+    assert page_cache.get_many(None, ["k1"]) == {"k1": PAGE_ITEM}
+    assert db.query(models.OCRPageCacheEntry).count() == 0
+
+
+def test_page_cache_memory_is_bounded(monkeypatch, page_cache):
+    monkeypatch.setattr(settings, "OCR_PAGE_CACHE_MEMORY_BYTES", 200)
+    for i in range(5):
+        page_cache.put_many(None, {f"k{i}": PAGE_ITEM}, {f"k{i}": "p" * 64})
+    assert page_cache.stats()["memory_bytes"] <= 200
+    assert page_cache.get_many(None, ["k0"]) == {}
+    assert page_cache.get_many(None, ["k4"]) == {"k4": PAGE_ITEM}
+
+
+def test_page_cache_evicts_least_recently_used_pages(db, page_cache, monkeypatch):
+    page_cache.put_many(db, {"old": PAGE_ITEM}, {"old": "a" * 64})
+    db.query(models.OCRPageCacheEntry).update(
+        {models.OCRPageCacheEntry.last_used_at: datetime.utcnow() - timedelta(hours=1)}
+    )
+    db.commit()
+    page_cache.put_many(db, {"new": PAGE_ITEM}, {"new": "b" * 64})
+    size = db.query(models.OCRPageCacheEntry).first().size_bytes
+
+    monkeypatch.setattr(settings, "OCR_PAGE_CACHE_MAX_BYTES", size)
+    assert page_cache.evict(db) == 1
+    assert [key for (key,) in db.query(models.OCRPageCacheEntry.cache_key)] == ["new"]
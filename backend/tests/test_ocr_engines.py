@@ -0,0 +1,51 @@
+import sys
+import types
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.services import ocr_engines
+from app.services.ocr_engines import PytesseractEngine, TesserocrEngine, create_ocr_engine
+
+
+@pytest.fixture
+def no_tesserocr(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tesserocr", None)  # import raises ImportError
+
+
+def test_auto_falls_back_to_pytesseract_without_tesserocr(monkeypatch, no_tesserocr):
+    monkeypatch.setattr(settings, "OCR_ENGINE", "auto")
+    assert isinstance(create_ocr_engine(), PytesseractEngine)
+
+
+def test_auto_prefers_tesserocr_when_installed(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tesserocr", types.ModuleType("tesserocr"))
+    monkeypatch.setattr(settings, "OCR_ENGINE", "auto")
+    assert isinstance(create_ocr_engine(), TesserocrEngine)
+
+
+def test_explicit_tesserocr_without_the_package_is_an_error(monkeypatch, no_tesserocr):
+    monkeypatch.setattr(settings, "OCR_ENGINE", "tesserocr")
+    with pytest.raises(RuntimeError, match="pip install tesserocr"):
+        create_ocr_engine()
+
+
+def test_unknown_engine_is_an_error(monkeypatch):
+    monkeypatch.setattr(settings, "OCR_ENGINE", "easyocr")
+    with pytest.raises(ValueError):
+        create_ocr_engine()
+
+
+def test_pytesseract_engine_runs_the_cli_with_the_configured_languages(monkeypatch):
+    calls = []
+
+    def image_to_data(image, lang, output_type):
+        calls.append((image.size, lang, output_type))
+        return {"text": ["Faktura"], "conf": [95]}
+
+    monkeypatch.setattr(ocr_engines.pytesseract, "image_to_data", image_to_data)
+    monkeypatch.setattr(settings, "OCR_LANGUAGES", "nor+eng")
+    data = PytesseractEngine().image_to_data(Image.new("L", (100, 50), 255))
+    assert data["text"] == ["Faktura"]
+    assert calls == [((100, 50), "nor+eng", ocr_engines.pytesseract.Output.DICT)]
@@ -0,0 +1,322 @@
+"""
+OCR pipeline tests. Poppler and Tesseract are replaced by fakes (pdftotext/pdfinfo
+output, a rasterizer that records its calls, an engine whose confidence depends on
+the image size) and the cpu pool runs work inline, so no binaries are needed.
+"""
+import subprocess
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.services import ocr_service as ocr_module
+from app.services.ocr_service import ocr_service
+
+A4 = (595.0, 842.0)  # points
+TEXT_PAGE = "Faktura 1001\nHønefoss Elektro AS  Org.nr. 974 760 673 MVA\nSum å betale 12 500,00"
+
+
+class InlinePool:
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class FakeEngine:
+    """Recognizes one word per page; confidence 60 below 2000 px width (~ < 240 DPI for A4), else 90."""
+
+    name = "fake"
+
+    def version(self):
+        return "fake 1.0"
+
+    def image_to_data(self, image):
+        conf = 60 if image.width < 2000 else 90
+        return {
+            "text": [f"w{image.width}"], "conf": [conf], "block_num": [1], "par_num": [1], "line_num": [1],
+            "left": [0], "top": [0], "width": [10], "height": [10],
+        }
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """Inline cpu pool, fake engine and rasterizer; returns the rasterizer calls (page, dpi)."""
+    renders = []
+
+    def convert_from_path(pdf_path, dpi, first_page, last_page, grayscale):
+        assert first_page == last_page and grayscale
+        renders.append((first_page, dpi))
+        return [Image.new("L", (int(A4[0] / 72 * dpi), int(A4[1] / 72 * dpi)), 255)]
+
+    monkeypatch.setattr(ocr_module, "cpu_pool", InlinePool())
+    monkeypatch.setattr(ocr_module, "convert_from_path", convert_from_path)
+    monkeypatch.setattr(ocr_module, "get_ocr_engine", lambda: FakeEngine())
+    monkeypatch.setattr(settings, "OCR_PAGE_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "OCR_PREPROCESS_DOCUMENT_TYPES", [])
+    return renders
+
+
+def _poppler(monkeypatch, text_layer, page_count=None, page_sizes=None):
+    """Fake text layer (list of page texts, or None) and pdfinfo page count/sizes."""
+    monkeypatch.setattr(ocr_module.OCRService, "extract_text_layer", staticmethod(lambda path: text_layer))
+    page_count = page_count if page_count is not None else len(text_layer)
+    sizes = page_sizes or {n: A4 for n in range(1, page_count + 1)}
+    monkeypatch.setattr(
+        ocr_module.OCRService, "pdf_info",
+        staticmethod(lambda path, last_page: {"pages": page_count, "page_sizes": {n: s for n, s in sizes.items() if n <= last_page}}),
+    )
+
+
+def _completed(stdout):
+    return subprocess.CompletedProcess(args=[], returncode=0, stdout=stdout.encode("utf-8"), stderr=b"")
+
+
+# Text layer (pdftotext) and sufficiency
+
+def test_text_layer_is_split_into_pages(monkeypatch):
+    monkeypatch.setattr(ocr_module.subprocess, "run", lambda *a, **k: _completed(f"{TEXT_PAGE}\f\f  \n\f"))
+    assert ocr_service.extract_text_layer("invoice.pdf") == [TEXT_PAGE, "", "  \n"]
+
+
+def test_text_layer_is_none_when_pdftotext_fails(monkeypatch):
+    def missing(*args, **kwargs):
+        raise FileNotFoundError("pdftotext")
+
+    def failing(*args, **kwargs):
+        raise subprocess.CalledProcessError(1, "pdftotext")
+
+    for run in (missing, failing):
+        monkeypatch.setattr(ocr_module.subprocess, "run", run)
+        assert ocr_service.extract_text_layer("invoice.pdf") is None
+
+
+def test_text_layer_sufficiency():
+    assert ocr_service.is_text_layer_sufficient(TEXT_PAGE)
+    assert not ocr_service.is_text_layer_sufficient("Side 1")  # too short: scanned page with a stamp
+    assert not ocr_service.is_text_layer_sufficient("\x01\x02\x03 ,.;:-_ " * 10)  # unmapped font glyphs
+
+
+def test_only_pages_without_usable_text_layer_are_ocrd(monkeypatch, fake_ocr):
+    _poppler(monkeypatch, [TEXT_PAGE, "", "Side 2", TEXT_PAGE])
+    pages = ocr_service.extract_pages_from_pdf("invoice.pdf")
+
+    assert [page["source"] for page in pages] == ["text_layer", "ocr", "ocr", "text_layer"]
+    assert pages[0]["text"] == TEXT_PAGE
+    assert sorted({page for page, _ in fake_ocr}) == [2, 3]
+    assert not ocr_service.is_truncated(pages)
+
+
+# Parallel page OCR
+
+def test_a_failing_page_does_not_fail_the_document(monkeypatch, fake_ocr):
+    _poppler(monkeypatch, None, page_count=3)
+    render = ocr_module.convert_from_path
+
+    def convert_from_path(pdf_path, dpi, first_page, last_page, grayscale):
+        if first_page == 2:
+            raise RuntimeError("broken page")
+        return render(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page, grayscale=grayscale)
+
+    monkeypatch.setattr(ocr_module, "convert_from_path", convert_from_path)
+    pages = ocr_service.extract_pages_from_pdf("invoice.pdf")
+    assert [page["page"] for page in pages] == [1, 2, 3]
+    assert pages[1]["error"] == "broken page" and pages[1]["text"] == ""
+    assert pages[0]["text"] and pages[2]["text"]
+
+
+def test_document_fails_when_every_page_fails(monkeypatch, fake_ocr):
+    _poppler(monkeypatch, None, page_count=2)
+
+    def convert_from_path(*args, **kwargs):
+        raise RuntimeError("not a PDF")
+
+    monkeypatch.setattr(ocr_module, "convert_from_path", convert_from_path)
+    with pytest.raises(Exception, match="not a PDF"):
+        ocr_service.extract_pages_from_pdf("invoice.pdf")
+
+
+# Page-by-page rasterization with pdfinfo page and pixel guards
+
+PDFINFO_OUTPUT = """Title:          Faktura 1001
+Producer:       Skanner 3000
+Pages:          3
+Encrypted:      no
+Page    1 size: 595.276 x 841.89 pts (A4)
+Page    1 rot:  0
+Page    2 size: 2384 x 3370 pts (A0)
+Page    2 rot:  0
+File size:      48211 bytes
+"""
+
+
+def test_pdf_info_parses_page_count_and_sizes(monkeypatch):
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        return _completed(PDFINFO_OUTPUT)
+
+    monkeypatch.setattr(ocr_module.subprocess, "run", run)
+    info = ocr_service.pdf_info("invoice.pdf", last_page=2)
+    assert info == {"pages": 3, "page_sizes": {1: (595.276, 841.89), 2: (2384.0, 3370.0)}}
+    assert calls[0][1:5] == ["-f", "1", "-l", "2"]
+
+    monkeypatch.setattr(ocr_module.subprocess, "run", lambda *a, **k: _completed("Syntax Error: broken\n"))
+    with pytest.raises(ValueError):
+        ocr_service.pdf_info("invoice.pdf", last_page=1)
+
+
+def test_pixel_guard_lowers_dpi_for_oversized_pages(monkeypatch):
+    monkeypatch.setattr(settings, "OCR_MAX_PAGE_PIXELS", 25_000_000)
+    assert ocr_service.raster_dpi(A4, 300) == 300
+    assert ocr_service.raster_dpi(None, 300) == 300
+
+    a0_dpi = ocr_service.raster_dpi((2384.0, 3370.0), 300)
+    assert a0_dpi < 300
+    assert (2384 / 72 * a0_dpi) * (3370 / 72 * a0_dpi) <= 25_000_000
+
+
+def test_pages_are_rendered_one_at_a_time_and_capped(monkeypatch, fake_ocr):
+    monkeypatch.setattr(settings, "OCR_MAX_PDF_PAGES", 2)
+    monkeypatch.setattr(settings, "OCR_ADAPTIVE_DPI_ENABLED", False)
+    monkeypatch.setattr(settings, "OCR_DPI", 300)
+    _poppler(monkeypatch, None, page_count=4, page_sizes={1: A4, 2: (2384.0, 3370.0), 3: A4, 4: A4})
+
+    pages = ocr_service.extract_pages_from_pdf("invoice.pdf")
+    assert fake_ocr == [(1, 300), (2, ocr_service.raster_dpi((2384.0, 3370.0), 300))]
+    assert [page.get("skipped") for page in pages] == [None, None, "page_limit", "page_limit"]
+    assert pages[2]["text"] == "" and ocr_service.is_truncated(pages)
+
+
+# Adaptive DPI
+
+def test_ocr_dpis(monkeypatch):
+    monkeypatch.setattr(settings, "OCR_DPI", 300)
+    monkeypatch.setattr(settings, "OCR_LOW_DPI", 150)
+    monkeypatch.setattr(settings, "OCR_ADAPTIVE_DPI_ENABLED", True)
+    assert ocr_service.ocr_dpis(A4) == [150, 300]
+
+    # Pixel guard brings both below the low DPI: one render only
+    monkeypatch.setattr(settings, "OCR_MAX_PAGE_PIXELS", 1_000_000)
+    assert len(ocr_service.ocr_dpis(A4)) == 1
+
+    monkeypatch.setattr(settings, "OCR_ADAPTIVE_DPI_ENABLED", False)
+    monkeypatch.setattr(settings, "OCR_MAX_PAGE_PIXELS", 25_000_000)
+    assert ocr_service.ocr_dpis(A4) == [300]
+
+
+def test_low_confidence_page_is_rerendered_at_full_dpi(monkeypatch, fake_ocr):
+    monkeypatch.setattr(settings, "OCR_MIN_CONFIDENCE", 80.0)
+    page = ocr_service.ocr_pdf_page("invoice.pdf", 1, [150, 300])
+    assert fake_ocr == [(1, 150), (1, 300)]
+    assert page["dpi"] == 300 and page["confidence"] == 90 and page["layout"]["dpi"] == 300
+
+
+def test_confident_low_dpi_page_is_not_rerendered(monkeypatch, fake_ocr):
+    monkeypatch.setattr(settings, "OCR_MIN_CONFIDENCE", 50.0)
+    page = ocr_service.ocr_pdf_page("invoice.pdf", 1, [150, 300])
+    assert fake_ocr == [(1, 150)]
+    assert page["dpi"] == 150 and page["confidence"] == 60
+
+
+def test_no_escalation_after_the_time_budget(monkeypatch, fake_ocr):
+    monkeypatch.setattr(settings, "OCR_MIN_CONFIDENCE", 80.0)
+    clock = iter([0.0, 2000.0])  # budget runs out while the low-DPI render is OCR'd
+    monkeypatch.setattr(ocr_module.time, "time", lambda: next(clock))
+    page = ocr_service.ocr_pdf_page("invoice.pdf", 1, [150, 300], deadline=1000.0)
+    assert fake_ocr == [(1, 150)]
+    assert page["dpi"] == 150
+
+
+# Page cap and time budget: partial results, marked truncated
+
+def test_pages_not_done_within_the_time_budget_are_skipped(monkeypatch, fake_ocr):
+    _poppler(monkeypatch, None, page_count=3)
+    monkeypatch.setattr(settings, "OCR_ADAPTIVE_DPI_ENABLED", False)
+    # Each render takes 600 s of a 1000 s budget, so the third page starts too late
+    now = [0.0]
+    render = ocr_module.convert_from_path
+
+    def slow_convert_from_path(*args, **kwargs):
+        now[0] += 600
+        return render(*args, **kwargs)
+
+    monkeypatch.setattr(ocr_module, "convert_from_path", slow_convert_from_path)
+    monkeypatch.setattr(ocr_module.time, "time", lambda: now[0])
+
+    pages = ocr_service.extract_pages_from_pdf("invoice.pdf", deadline=1000.0)
+    assert [page.get("skipped") for page in pages] == [None, None, "time_budget"]
+    assert pages[2]["text"] == "" and ocr_service.is_truncated(pages)
+    assert [page for page, _ in fake_ocr] == [1, 2]
+
+
+def _stored_pdf(db, user):
+    from app.db import models
+    from app.services.storage_service import storage
+
+    writer = storage.open_writer(".pdf")
+    writer.write(b"%PDF-1.4\n")
+    key, size, sha256 = writer.commit()
+    invoice = models.Invoice(
+        filename="faktura.pdf", file_path=key, file_size=size, mime_type="application/pdf",
+        content_hash=sha256, uploaded_by=user.id, status=models.ProcessingStatus.UPLOADED,
+    )
+    db.add(invoice)
+    db.commit()
+    return invoice
+
+
+def test_truncated_ocr_marks_the_invoice_and_skips_the_cache(db, user, monkeypatch):
+    from app.db import models
+    from app.services import workflow_steps
+
+    invoice = _stored_pdf(db, user)
+    pages = [
+        {"page": 1, "text": TEXT_PAGE, "source": "text_layer"},
+        {"page": 2, "text": "", "source": "ocr", "skipped": "page_limit"},
+    ]
+    monkeypatch.setattr(workflow_steps.ocr_service, "extract_pages", lambda path, mime_type, db=None: pages)
+
+    out = workflow_steps.step_ocr(
+        {"invoice_id": invoice.id, "file_path": invoice.file_path, "mime_type": invoice.mime_type}, db
+    )
+    assert out["ocr_truncated"] is True
+    db.refresh(invoice)
+    assert invoice.ocr_truncated is True
+    assert db.query(models.OCRCacheEntry).count() == 0
+
+    validated = workflow_steps.step_rule_validation(
+        {"ai_result": {"account_number": "6540", "vat_code": "1", "confidence": 0.95, "reasoning": "Kontor"},
+         "ocr_truncated": True},
+        db,
+    )
+    assert validated["notes"].startswith(workflow_steps.TRUNCATED_OCR_NOTE)
+    assert validated["risk_level"] != "low"
+
+
+# Page cache
+
+def test_pages_seen_before_are_served_from_the_page_cache(db, monkeypatch, fake_ocr):
+    from app.services.ocr_page_cache_service import OCRPageCacheService
+
+    monkeypatch.setattr(ocr_module, "ocr_page_cache_service", OCRPageCacheService())
+    monkeypatch.setattr(settings, "OCR_PAGE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "OCR_ADAPTIVE_DPI_ENABLED", False)
+    _poppler(monkeypatch, None, page_count=1)
+    hash_dpi = settings.OCR_PAGE_CACHE_HASH_DPI
+
+    first = ocr_service.extract_pages_from_pdf("terms.pdf", db=db)
+    assert "page_cache_hit" not in first[0]
+    assert fake_ocr == [(1, hash_dpi), (1, settings.OCR_DPI)]
+
+    # Same page in another document: hashed, not OCR'd
+    fake_ocr.clear()
+    second = ocr_service.extract_pages_from_pdf("another-invoice.pdf", db=db)
+    assert fake_ocr == [(1, hash_dpi)]
+    assert second[0]["page_cache_hit"] is True
+    assert second[0]["text"] == first[0]["text"]
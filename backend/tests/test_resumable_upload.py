@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.db import models
+
+DATA = b"%PDF-1.4\n" + b"0" * 991
+
+
+@pytest.fixture
+def upload(client, auth_headers):
+    response = client.post(
+        "/api/v1/invoices/uploads",
+        json={"filename": "faktura.pdf", "size": len(DATA)},
+        headers=auth_headers,
+    )
+    assert response.status_code == 201
+    assert response.headers["Upload-Offset"] == "0"
+    return f"/api/v1/invoices/uploads/{response.json()['id']}"
+
+
+def _patch(client, auth_headers, url, offset, data):
+    return client.patch(url, content=data, headers={**auth_headers, "Upload-Offset": str(offset)})
+
+
+def test_chunks_resume_from_offset_and_finalize(client, auth_headers, upload, db):
+    assert _patch(client, auth_headers, upload, 0, DATA[:400]).status_code == 204
+    head = client.head(upload, headers=auth_headers)
+    assert head.headers["Upload-Offset"] == "400"
+    response = _patch(client, auth_headers, upload, 400, DATA[400:])
+    assert response.status_code == 204
+    assert response.headers["Upload-Offset"] == str(len(DATA))
+
+    response = client.post(f"{upload}/finalize", headers=auth_headers)
+    assert response.status_code == 202
+    invoice = db.query(models.Invoice).filter(models.Invoice.id == response.json()["id"]).one()
+    assert invoice.file_size == len(DATA)
+    assert db.query(models.Job).filter(models.Job.invoice_id == invoice.id).count() == 1
+
+    # Finalizing again returns the same invoice
+    again = client.post(f"{upload}/finalize", headers=auth_headers)
+    assert again.status_code == 200
+    assert again.json()["id"] == invoice.id
+
+
+def test_offset_mismatch_is_409_with_current_offset(client, auth_headers, upload):
+    assert _patch(client, auth_headers, upload, 0, DATA[:100]).status_code == 204
+    for offset in ("0", "250", "abc"):
+        response = client.patch(upload, content=DATA[100:200], headers={**auth_headers, "Upload-Offset": offset})
+        assert response.status_code == 409
+        assert response.headers["Upload-Offset"] == "100"
+    assert client.head(upload, headers=auth_headers).headers["Upload-Offset"] == "100"
+
+
+def test_chunk_past_declared_size_is_rejected(client, auth_headers, upload):
+    response = _patch(client, auth_headers, upload, 0, DATA + b"extra")
+    assert response.status_code == 413
+    assert client.head(upload, headers=auth_headers).headers["Upload-Offset"] == "0"
+
+
+def test_finalize_incomplete_upload_is_409(client, auth_headers, upload):
+    _patch(client, auth_headers, upload, 0, DATA[:10])
+    response = client.post(f"{upload}/finalize", headers=auth_headers)
+    assert response.status_code == 409
+
+
+def test_patch_after_finalize_is_409(client, auth_headers, upload):
+    _patch(client, auth_headers, upload, 0, DATA)
+    assert client.post(f"{upload}/finalize", headers=auth_headers).status_code == 202
+    assert _patch(client, auth_headers, upload, len(DATA), b"x").status_code == 409
+
+
+def _hold(db, url, locked_at):
+    """Lock the session as a concurrent PATCH/finalize would."""
+    session = db.query(models.UploadSession).filter(models.UploadSession.id == url.rsplit("/", 1)[1]).one()
+    session.locked_at = locked_at
+    db.commit()
+    return session
+
+
+def test_concurrent_patch_at_same_offset_is_409(client, auth_headers, upload, db):
+    _hold(db, upload, datetime.utcnow())
+    response = _patch(client, auth_headers, upload, 0, DATA[:100])
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "0"
+
+
+def test_claim_succeeds_once_per_offset(client, auth_headers, upload, db):
+    from app.api.v1.invoices import _claim_upload_session, _release_upload_session
+
+    session = _hold(db, upload, None)
+    assert _claim_upload_session(db, session, 0) is True
+    assert _claim_upload_session(db, session, 0) is False
+    _release_upload_session(db, session, 100)
+    assert session.offset == 100 and session.locked_at is None
+    assert _claim_upload_session(db, session, 0) is False
+
+
+def test_concurrent_finalize_is_409_and_registers_once(client, auth_headers, upload, db):
+    _patch(client, auth_headers, upload, 0, DATA)
+    _hold(db, upload, datetime.utcnow())
+    assert client.post(f"{upload}/finalize", headers=auth_headers).status_code == 409
+    assert db.query(models.Invoice).count() == 0
+
+
+def test_stale_lock_is_taken_over(client, auth_headers, upload, db):
+    _hold(db, upload, datetime.utcnow() - timedelta(seconds=settings.RESUMABLE_UPLOAD_LOCK_SECONDS + 1))
+    assert _patch(client, auth_headers, upload, 0, DATA).status_code == 204
+    assert client.post(f"{upload}/finalize", headers=auth_headers).status_code == 202
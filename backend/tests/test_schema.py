@@ -0,0 +1,48 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app.db.database import Base
+from app.db.schema import upgrade_schema
+
+# The users and invoices tables as created before this series added columns
+BASELINE = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY, email VARCHAR NOT NULL UNIQUE, hashed_password VARCHAR NOT NULL,
+        full_name VARCHAR NOT NULL, role VARCHAR(10) NOT NULL, is_active BOOLEAN NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, updated_at DATETIME)""",
+    """CREATE TABLE invoices (
+        id INTEGER PRIMARY KEY, filename VARCHAR NOT NULL, file_path VARCHAR NOT NULL, file_size INTEGER NOT NULL,
+        mime_type VARCHAR NOT NULL, uploaded_by INTEGER NOT NULL REFERENCES users (id), status VARCHAR(13) NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, updated_at DATETIME)""",
+]
+
+
+def test_adds_missing_columns_and_indexes_to_existing_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        for statement in BASELINE:
+            conn.execute(text(statement))
+        conn.execute(text(
+            "INSERT INTO users (email, hashed_password, full_name, role, is_active) VALUES "
+            "('a@firma.no', 'x', 'A', 'ACCOUNTANT', 1), ('b@gmail.com', 'x', 'B', 'ACCOUNTANT', 1)"
+        ))
+        conn.execute(text(
+            "INSERT INTO invoices (filename, file_path, file_size, mime_type, uploaded_by, status) "
+            "VALUES ('f.pdf', 'f.pdf', 1, 'application/pdf', 1, 'COMPLETE')"
+        ))
+    Base.metadata.create_all(bind=engine)
+
+    added = upgrade_schema(engine)
+    assert {"users.tenant", "invoices.content_hash", "invoices.ocr_truncated", "invoices.batch_id"} <= set(added)
+
+    inspector = inspect(engine)
+    for table in ("users", "invoices"):
+        assert {c.name for c in Base.metadata.tables[table].columns} <= {c["name"] for c in inspector.get_columns(table)}
+    assert "uq_invoices_uploaded_by_content_hash" in {i["name"] for i in inspector.get_indexes("invoices")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT email, tenant FROM users ORDER BY id")).all() == [
+            ("a@firma.no", "firma.no"), ("b@gmail.com", None)
+        ]
+        assert conn.execute(text("SELECT ocr_truncated FROM invoices")).scalar() == 0
+
+    # Idempotent
+    assert upgrade_schema(engine) == []
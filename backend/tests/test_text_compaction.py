@@ -0,0 +1,67 @@
+from app.services.ocr_service import ocr_service
+from app.services.text_compaction_service import text_compaction_service
+
+HEADER = "Hønefoss Elektro AS\nOrg.nr. 974 760 673 MVA"
+FOOTER = "Takk for handelen!\nSide 1 av 2"
+
+
+def _document(*pages):
+    return ocr_service.join_pages([{"text": page} for page in pages])
+
+
+def test_drops_headers_and_footers_repeated_on_later_pages():
+    text = _document(
+        f"{HEADER}\nFaktura 1001\nKonsulenttime 1 950,00\nTakk for handelen!",
+        f"{HEADER}\nReisekostnader 450,00\nSum 2 400,00\nTakk for handelen!",
+    )
+    compacted, stats = text_compaction_service.compact(text, budget=0)
+    assert compacted.splitlines() == [
+        "Hønefoss Elektro AS",
+        "Org.nr. 974 760 673 MVA",
+        "Faktura 1001",
+        "Konsulenttime 1 950,00",
+        "Takk for handelen!",
+        "Reisekostnader 450,00",
+        "Sum 2 400,00",
+    ]
+    assert stats["dropped_duplicate"] == 3
+
+
+def test_keeps_repeated_invoice_lines():
+    text = _document(
+        "Konsulenttime 1 950,00\nKonsulenttime 1 950,00\nKontorrekvisita",
+        "Konsulenttime 1 950,00\nSum 5 850,00",
+    )
+    compacted, stats = text_compaction_service.compact(text, budget=0)
+    assert compacted.splitlines().count("Konsulenttime 1 950,00") == 3
+    assert stats["dropped_duplicate"] == 0
+
+
+def test_keeps_repeated_lines_within_a_page():
+    compacted, _ = text_compaction_service.compact("Konsulenttime\nKonsulenttime\nSum 3 900,00", budget=0)
+    assert compacted.splitlines().count("Konsulenttime") == 2
+
+
+def test_drops_boilerplate_but_keeps_payment_terms():
+    text = "\n".join([
+        "Faktura 1001",
+        "Betalingsbetingelser: 14 dager netto",
+        "Ved forsinket betaling beregnes forsinkelsesrente",
+        "Personvern: se www.example.no/personvern",
+        "Side 1 av 1",
+        "Sum 1 950,00",
+    ])
+    compacted, stats = text_compaction_service.compact(text, budget=0)
+    assert compacted.splitlines() == ["Faktura 1001", "Betalingsbetingelser: 14 dager netto", "Sum 1 950,00"]
+    assert stats["dropped_boilerplate"] == 3
+
+
+def test_budget_keeps_key_lines_first_in_document_order():
+    filler = [f"Beskrivelse av arbeidet, del {i}" for i in range(200)]
+    text = "\n".join(["Hønefoss Elektro AS", *filler, "Forfallsdato 14.03.2024", "Å betale 12 500,00"])
+    compacted, stats = text_compaction_service.compact(text, budget=80)
+    lines = compacted.splitlines()
+    assert lines[0] == "Hønefoss Elektro AS"
+    assert lines[-2:] == ["Forfallsdato 14.03.2024", "Å betale 12 500,00"]
+    assert stats["tokens_after"] <= 80
+    assert stats["dropped_budget"] > 0
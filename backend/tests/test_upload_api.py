@@ -0,0 +1,124 @@
+import io
+import zipfile
+
+from app.api.v1 import invoices as invoices_api
+from app.core.security import create_access_token
+from app.db import models
+
+PDF = b"%PDF-1.4\nfaktura 1001\n"
+OTHER_PDF = b"%PDF-1.4\nfaktura 1002\n"
+
+
+def _upload(client, headers, data=PDF, filename="faktura.pdf"):
+    return client.post(
+        "/api/v1/invoices/upload", files={"file": (filename, data, "application/pdf")}, headers=headers
+    )
+
+
+def _headers(user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+
+def test_same_user_duplicate_returns_existing_invoice(client, auth_headers, db):
+    first = _upload(client, auth_headers)
+    assert first.status_code == 202
+
+    again = _upload(client, auth_headers, filename="forwarded.pdf")
+    assert again.status_code == 200
+    assert again.json()["id"] == first.json()["id"]
+    assert db.query(models.Invoice).count() == 1
+    assert db.query(models.Job).count() == 1
+    assert db.query(models.AuditLog).filter(models.AuditLog.action == "upload_duplicate").count() == 1
+
+
+def test_cross_user_duplicate_is_linked_to_the_original(client, auth_headers, make_user, db):
+    original = _upload(client, auth_headers).json()
+
+    response = _upload(client, _headers(make_user("colleague@firma.no")))
+    assert response.status_code == 202
+    assert response.json()["id"] != original["id"]
+    copy = db.query(models.Invoice).filter(models.Invoice.id == response.json()["id"]).one()
+    assert copy.duplicate_of_id == original["id"]
+
+
+def test_concurrent_same_user_upload_returns_the_winner(client, auth_headers, db, monkeypatch):
+    winner = _upload(client, auth_headers).json()
+
+    # The losing request looked before the winner committed, so its insert hits the unique index
+    lookups = []
+    find = invoices_api._find_user_duplicate
+
+    def find_after_race(db, user_id, sha256):
+        lookups.append(sha256)
+        return None if len(lookups) == 1 else find(db, user_id, sha256)
+
+    monkeypatch.setattr(invoices_api, "_find_user_duplicate", find_after_race)
+    response = _upload(client, auth_headers)
+    assert len(lookups) == 2
+    assert response.status_code == 200
+    assert response.json()["id"] == winner["id"]
+    assert db.query(models.Invoice).count() == 1
+
+
+def _zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_bulk_upload_expands_zips_and_reports_skipped_files(client, auth_headers, db):
+    archive = _zip({
+        "mars/a.pdf": PDF,
+        "mars/b.pdf": OTHER_PDF,
+        "mars/copy-of-a.pdf": PDF,
+        "mars/notes.txt": b"not an invoice",
+        "__MACOSX/mars/._a.pdf": b"metadata",
+    })
+    response = client.post(
+        "/api/v1/invoices/bulk",
+        files=[
+            ("files", ("mars.zip", archive, "application/zip")),
+            ("files", ("scan.png", b"\x89PNG fake", "image/png")),
+            ("files", ("readme.docx", b"docx", "application/octet-stream")),
+        ],
+        headers=auth_headers,
+    )
+    assert response.status_code == 202
+    body = response.json()
+    assert body["skipped"] == ["mars/notes.txt", "readme.docx"]
+    assert body["total_files"] == 6
+    assert body["queued"] == 3
+    assert len(body["duplicate_invoice_ids"]) == 1
+
+    invoices = db.query(models.Invoice).filter(models.Invoice.batch_id == body["batch_id"]).all()
+    assert sorted(i.filename for i in invoices) == ["a.pdf", "b.pdf", "scan.png"]
+    assert body["duplicate_invoice_ids"][0] in {i.id for i in invoices}
+
+
+def test_batch_status_counts(client, auth_headers, make_user, db):
+    body = client.post(
+        "/api/v1/invoices/bulk",
+        files=[("files", ("a.pdf", PDF, "application/pdf")), ("files", ("b.pdf", OTHER_PDF, "application/pdf"))],
+        headers=auth_headers,
+    ).json()
+    url = f"/api/v1/invoices/batches/{body['batch_id']}"
+
+    status = client.get(url, headers=auth_headers).json()
+    assert status["status_counts"] == {"uploaded": 2}
+    assert status["total_files"] == 2 and status["duplicates"] == 0 and status["skipped"] == 0
+    assert status["finished"] is False
+
+    invoices = db.query(models.Invoice).filter(models.Invoice.batch_id == body["batch_id"]).all()
+    invoices[0].status = models.ProcessingStatus.COMPLETE
+    invoices[1].status = models.ProcessingStatus.ERROR
+    db.query(models.Job).update({models.Job.status: models.JobStatus.DONE})
+    db.commit()
+
+    status = client.get(url, headers=auth_headers).json()
+    assert status["status_counts"] == {"complete": 1, "error": 1}
+    assert status["finished"] is True
+
+    assert client.get(url, headers=_headers(make_user("other@firma.no"))).status_code == 403
+    assert client.get("/api/v1/invoices/batches/999", headers=auth_headers).status_code == 404
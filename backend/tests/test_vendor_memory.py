@@ -0,0 +1,143 @@
+from app.db import models
+from app.services import workflow_steps
+from app.services.vendor_memory_service import vendor_memory_service
+
+VENDOR_ORG = "923609016"
+CLIENT_ORG = "974760673"
+
+INVOICE = f"""Hønefoss Elektro AS
+Storgata 1, 3510 Hønefoss
+Org.nr. NO 923 609 016 MVA
+
+Fakturamottaker:
+Klient Holding AS
+Postboks 12
+0101 Oslo
+Org.nr. 974 760 673
+
+Faktura 1001
+Kundenr: 4411
+Elektrikertime 2 450,00
+Å betale 2 450,00 til konto 1234.56.78903
+Foretaksregisteret"""
+
+
+def test_extracts_vendor_identifiers_only():
+    assert vendor_memory_service.extract_identifiers(INVOICE) == [
+        ("name", "hønefoss elektro as"),
+        ("org_number", VENDOR_ORG),
+        ("bank_account", "12345678903"),
+    ]
+
+
+def test_org_number_in_recipient_block_is_not_the_vendor():
+    text = "Fakturamottaker:\nKlient Holding AS\nStorgata 2\nOrg.nr. 974 760 673\n\nFaktura 1001\nSum 1 000,00"
+    assert vendor_memory_service.extract_identifiers(text) == []
+
+
+def test_org_number_below_the_recipient_needs_a_registration_marker():
+    recipient = "Kunde: Klient Holding AS\nStorgata 2\n\n"
+    assert vendor_memory_service.extract_identifiers(recipient + "Org.nr. 923 609 016") == []
+    assert vendor_memory_service.extract_identifiers(recipient + "Foretaksregisteret NO 923 609 016 MVA") == [
+        ("org_number", VENDOR_ORG)
+    ]
+
+
+def test_customer_lines_in_the_header_are_skipped():
+    text = "Kundenr: 974760673\nDeres ref: Klient Holding AS\nHønefoss Elektro AS\nOrg.nr 923609016"
+    assert vendor_memory_service.extract_identifiers(text) == [
+        ("name", "hønefoss elektro as"),
+        ("org_number", VENDOR_ORG),
+    ]
+
+
+def _approve(db, user, ocr_text, account_number="6300", vat_code="1"):
+    invoice = models.Invoice(
+        filename="f.pdf", file_path="f.pdf", file_size=1, mime_type="application/pdf",
+        uploaded_by=user.id, ocr_text=ocr_text,
+    )
+    db.add(invoice)
+    db.commit()
+    suggestion = models.Suggestion(
+        invoice_id=invoice.id, account_number=account_number, vat_code=vat_code, confidence_score=0.9,
+        risk_level=models.RiskLevel.LOW, approval_status=models.ApprovalStatus.APPROVED,
+    )
+    db.add(suggestion)
+    db.commit()
+    vendor_memory_service.record_decision(db, invoice, suggestion, models.ApprovalStatus.PENDING)
+    return invoice
+
+
+def _lookup(db, user, ocr_text=INVOICE):
+    invoice = models.Invoice(filename="n.pdf", file_path="n.pdf", file_size=1, mime_type="application/pdf", uploaded_by=user.id)
+    db.add(invoice)
+    db.commit()
+    key = vendor_memory_service.tenant_of_invoice(db, invoice)
+    return vendor_memory_service.lookup(db, key, vendor_memory_service.extract_identifiers(ocr_text))
+
+
+def test_memory_is_shared_within_a_tenant(db, make_user):
+    accountant, colleague = make_user("a@firma.no"), make_user("b@firma.no")
+    for _ in range(3):
+        _approve(db, accountant, INVOICE)
+
+    match = _lookup(db, colleague)
+    assert match["strong"]
+    assert (match["account_number"], match["identifier_type"]) == ("6300", "org_number")
+    assert _lookup(db, make_user("c@annet.no")) is None
+
+
+def test_users_of_public_mail_domains_do_not_share_memory(db, make_user):
+    first, second = make_user("ola@gmail.com"), make_user("kari@gmail.com")
+    for _ in range(3):
+        _approve(db, first, INVOICE)
+
+    assert _lookup(db, first)["strong"]
+    assert _lookup(db, second) is None
+
+
+def test_name_alone_is_never_a_strong_match(db, user):
+    name_only = "Hønefoss Elektro AS\nStorgata 1, 3510 Hønefoss\n\nFaktura 1001\nSum 2 450,00"
+    for _ in range(5):
+        _approve(db, user, name_only)
+
+    match = _lookup(db, user, name_only)
+    assert match["identifier_type"] == "name"
+    assert match["approvals"] == 5
+    assert not match["strong"]
+
+
+def test_unknown_bank_account_of_a_known_vendor_is_a_high_risk_conflict(db, user):
+    for _ in range(3):
+        _approve(db, user, INVOICE)
+    forged = INVOICE.replace("1234.56.78903", "1503.00.00002")
+
+    match = _lookup(db, user, forged)
+    assert match["identifier_type"] == "org_number"
+    assert match["unknown_accounts"] == ["15030000002"]
+    assert match["conflict"] and not match["strong"]
+
+    invoice = models.Invoice(filename="n.pdf", file_path="n.pdf", file_size=1, mime_type="application/pdf", uploaded_by=user.id)
+    db.add(invoice)
+    db.commit()
+    out = workflow_steps.step_vendor_memory({"invoice_id": invoice.id, "ocr_text": forged}, db)
+    assert out == {"vendor_unknown_accounts": ["15030000002"]}
+    validated = workflow_steps.step_rule_validation(
+        {"ai_result": {"account_number": "6300", "vat_code": "1", "confidence": 0.95, "reasoning": "Elektriker"}, **out},
+        db,
+    )
+    assert validated["risk_level"] == models.RiskLevel.HIGH
+    assert validated["notes"].startswith(workflow_steps.UNKNOWN_VENDOR_ACCOUNT_NOTE)
+    assert "15030000002" in validated["notes"]
+
+
+def test_rebuild_recounts_per_memory_key(db, make_user):
+    firm_user, private_user = make_user("a@firma.no"), make_user("ola@gmail.com")
+    _approve(db, firm_user, INVOICE)
+    _approve(db, private_user, INVOICE)
+    db.query(models.VendorMemoryEntry).delete()
+    db.commit()
+
+    assert vendor_memory_service.rebuild(db) == 6
+    keys = {entry.tenant for entry in db.query(models.VendorMemoryEntry)}
+    assert keys == {"firma.no", f"user:{private_user.id}"}
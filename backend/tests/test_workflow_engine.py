@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from app.db import models
+from app.services.workflow_engine import StepDef, run_workflow_async
+
+
+async def _double(context, db):
+    await asyncio.sleep(0)
+    return {"doubled": context["value"] * 2}
+
+
+def _describe(context, db):
+    return {"description": f"{context['value']} -> {context['doubled']}"}
+
+
+def test_runs_async_and_sync_steps_and_audits_them(db):
+    steps = [
+        StepDef("double", ["value"], ["doubled"], False, _double),
+        StepDef("describe", ["value", "doubled"], ["description"], False, _describe),
+    ]
+    context = asyncio.run(run_workflow_async("test", {"value": 21, "secret": "x"}, steps, db))
+    assert context["description"] == "21 -> 42"
+    assert db.query(models.AuditLog).filter(models.AuditLog.action == "workflow_step").count() == 2
+
+
+def test_step_only_sees_allowed_inputs_and_outputs(db):
+    seen = {}
+
+    def leak(context, db):
+        seen.update(context)
+        return {"secret": "overwritten"}
+
+    with pytest.raises(ValueError, match="disallowed output key: secret"):
+        asyncio.run(run_workflow_async("test", {"value": 1, "secret": "x"}, [StepDef("leak", ["value"], [], False, leak)], db))
+    assert seen == {"value": 1}